@@ -6,10 +6,13 @@ cd zoomin/database/
 python db_deprecation.py
 python db_creation.py
 
-# make django migrations to create tables 
+# make django migrations to create tables (region_data is partitioned by var_detail_id afterwards)
 python ../api/manage.py makemigrations v1_api 
 python ../api/manage.py migrate 
 
+# drop indexes and foreign keys of the data tables until they are populated
+python db_population_mode.py start
+
 # collect static files 
 python ../api/manage.py collectstatic --noinput
 
@@ -37,6 +40,9 @@ do
     echo "done ---------------------------------------------"
 done
 
+# rebuild indexes and foreign keys of the data tables
+python ../../zoomin/database/db_population_mode.py finish
+
 end=`date +%s`
 
 runtime=$((end-start))
@@ -0,0 +1,79 @@
+"""Shared fixtures of the tests."""
+from typing import Any, Iterator
+
+import pandas as pd
+import psycopg2
+import pytest
+
+from zoomin.data.region_hierarchy import RegionHierarchy
+from zoomin.database.db_connection import (
+    close_connection_pool,
+    db_name,
+    get_conn_info,
+)
+
+
+@pytest.fixture
+def regions() -> dict:
+    """Regions of one country: 2 NUTS3 regions with 2 LAU regions each."""
+    return {
+        "NUTS0": pd.DataFrame(
+            {"id": [1], "region_code": ["DE"], "parent_region_code": [None]}
+        ),
+        "NUTS1": pd.DataFrame(
+            {"id": [2], "region_code": ["DE1"], "parent_region_code": ["DE"]}
+        ),
+        "NUTS2": pd.DataFrame(
+            {"id": [3], "region_code": ["DE11"], "parent_region_code": ["DE1"]}
+        ),
+        "NUTS3": pd.DataFrame(
+            {
+                "id": [4, 5],
+                "region_code": ["DE111", "DE112"],
+                "parent_region_code": ["DE11", "DE11"],
+            }
+        ),
+        "LAU": pd.DataFrame(
+            {
+                "id": [10, 11, 12, 13],
+                "region_code": ["L1", "L2", "L3", "L4"],
+                "parent_region_code": ["DE111", "DE111", "DE112", "DE112"],
+            }
+        ),
+    }
+
+
+@pytest.fixture
+def region_hierarchy(regions: dict) -> RegionHierarchy:
+    """Region hierarchy of `regions`."""
+    return RegionHierarchy(regions)
+
+
+@pytest.fixture
+def db_cursor() -> Iterator[Any]:
+    """Cursor on the test DB (DB_NAME etc.) committing each statement; skips the test if there is no test DB.
+
+    The tables created during the test are dropped afterwards.
+    """
+    if db_name is None:
+        pytest.skip("no test DB configured")
+    try:
+        connection = psycopg2.connect(connect_timeout=3, **get_conn_info())
+    except psycopg2.OperationalError:
+        pytest.skip("the test DB is not reachable")
+
+    connection.autocommit = True
+    cursor = connection.cursor()
+    list_tables = "SELECT tablename FROM pg_tables WHERE schemaname='public'"
+    cursor.execute(list_tables)
+    existing_tables = {table for (table,) in cursor.fetchall()}
+    try:
+        yield cursor
+
+    finally:
+        close_connection_pool()
+        cursor.execute(list_tables)
+        for (table,) in cursor.fetchall():
+            if table not in existing_tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+        connection.close()
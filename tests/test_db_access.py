@@ -0,0 +1,296 @@
+"""Tests of reading from and writing to the DB."""
+import os
+from typing import Any, Iterator
+
+import pandas as pd
+import pytest
+
+from zoomin.database import db_access
+from zoomin.database.db_access import get_db_engine, get_table
+from zoomin.database.db_connection import borrow_db_connection
+from zoomin.database.db_dtypes import REGION_DATA_DTYPES
+from zoomin.database.db_session import load_session
+
+
+@pytest.fixture
+def engines(monkeypatch: pytest.MonkeyPatch) -> Iterator[dict]:
+    """An empty registry of engines, disposed afterwards."""
+    monkeypatch.setattr(db_access, "_engines", {})
+    yield db_access._engines
+    db_access.dispose_db_engines()
+
+
+def test_one_engine_per_db_uri(engines: dict) -> None:
+    engine = get_db_engine("postgresql://user@localhost:5432/db")
+
+    assert get_db_engine("postgresql://user@localhost:5432/db") is engine
+    assert get_db_engine("postgresql://user@localhost:5432/other_db") is not engine
+    assert len(engines) == 2
+
+
+def test_new_engine_after_dispose(engines: dict) -> None:
+    engine = get_db_engine("postgresql://user@localhost:5432/db")
+
+    db_access.dispose_db_engines()
+
+    assert engines == {}
+    assert get_db_engine("postgresql://user@localhost:5432/db") is not engine
+
+
+def test_new_engine_after_fork(engines: dict) -> None:
+    engine = get_db_engine("postgresql://user@localhost:5432/db")
+
+    pid = os.fork()
+    if pid == 0:
+        # child process; exits without running the teardown of the test
+        is_new = (
+            len(db_access._engines) == 0
+            and get_db_engine("postgresql://user@localhost:5432/db") is not engine
+        )
+        os._exit(0 if is_new else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert get_db_engine("postgresql://user@localhost:5432/db") is engine
+
+
+@pytest.mark.parametrize(
+    "sql_cmd",
+    [
+        "SELECT region_id, year, value, chosen FROM test_region_data ORDER BY region_id",
+        "SELECT region_id, year, region_code FROM test_region_data ORDER BY region_id",
+    ],
+)
+def test_copy_backend_reads_as_sql_backend(db_cursor: Any, sql_cmd: str) -> None:
+    db_cursor.execute(
+        "CREATE TABLE test_region_data (region_id integer, year smallint, value real, chosen boolean, region_code text)"
+    )
+    db_cursor.execute(
+        "INSERT INTO test_region_data VALUES (1, 2020, 0.5, true, 'DE1'), (2, NULL, NULL, NULL, NULL)"
+    )
+
+    pd.testing.assert_frame_equal(
+        get_table(sql_cmd, backend="copy"), get_table(sql_cmd, backend="sql")
+    )
+
+
+@pytest.fixture
+def region_data(db_cursor: Any) -> Any:
+    """The var_details and region_data tables with 2 vars, one of them without data."""
+    db_cursor.execute("CREATE TABLE var_details (id serial PRIMARY KEY, var_name text)")
+    db_cursor.execute(
+        "CREATE TABLE region_data (id serial PRIMARY KEY, region_id integer, var_detail_id integer, pathway_id integer, year smallint, value real)"
+    )
+    db_cursor.execute(
+        "INSERT INTO var_details (var_name) VALUES ('population'), ('employment')"
+    )
+    db_cursor.execute(
+        "INSERT INTO region_data (region_id, var_detail_id, pathway_id, year, value) \
+            SELECT i % 7, 1, NULLIF(i % 3, 0), 2020 + i % 2, i * 0.5 FROM generate_series(1, 25) i"
+    )
+    return db_cursor
+
+
+def _read_query(sql_cmd: str, params: Any = None) -> pd.DataFrame:
+    """Return `read_query()` of `sql_cmd` with the region_data dtypes of the streaming readers."""
+    with borrow_db_connection() as connection:
+        with connection.cursor() as cursor:
+            data_df = db_access.read_query(cursor, sql_cmd, params=params)
+
+    return data_df.astype(
+        {col: dtype for col, dtype in REGION_DATA_DTYPES.items() if col in data_df}
+    )
+
+
+@pytest.mark.parametrize("fetch_size", [1, 4, 25, 100])
+@pytest.mark.parametrize("var_detail_id", [1, 2])
+def test_query_chunks_are_the_read_query(
+    region_data: Any, fetch_size: int, var_detail_id: int
+) -> None:
+    sql_cmd = "SELECT region_id, pathway_id, year, value FROM region_data WHERE var_detail_id=%s ORDER BY id"
+
+    chunks = list(
+        db_access.iter_query_chunks(
+            sql_cmd,
+            (var_detail_id,),
+            dtypes=REGION_DATA_DTYPES,
+            fetch_size=fetch_size,
+        )
+    )
+
+    if var_detail_id == 1:
+        assert [len(chunk) for chunk in chunks[:-1]] == [fetch_size] * (len(chunks) - 1)
+        assert sum(len(chunk) for chunk in chunks) == 25
+    else:
+        # the result is empty
+        assert len(chunks) == 1
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True),
+        _read_query(sql_cmd, (var_detail_id,)),
+    )
+
+
+@pytest.mark.parametrize("var_name", ["population", "employment"])
+def test_streaming_readers_read_as_their_dataframe_readers(
+    region_data: Any, var_name: str
+) -> None:
+    _fk_var_name = {"population": 1, "employment": 2}[var_name]
+    readers = [
+        (
+            db_access.iter_var_data_for_eucalc_post_calculation(var_name, 4),
+            f"SELECT region_id, pathway_id, year, value FROM region_data WHERE var_detail_id={_fk_var_name}",
+        ),
+        (
+            db_access.iter_var_data_for_kpi_post_calculation(var_name, 4),
+            f"SELECT region_id, value, year, pathway_id FROM region_data WHERE var_detail_id={_fk_var_name}",
+        ),
+        (
+            db_access.iter_eucalc_pathway_data(_fk_var_name, 4),
+            f"SELECT var_detail_id, value, year, region_id FROM region_data WHERE pathway_id={_fk_var_name}",
+        ),
+    ]
+
+    for chunks, sql_cmd in readers:
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks, ignore_index=True),
+            _read_query(sql_cmd),
+        )
+
+
+def test_proxy_vars_of_many_vars_are_their_proxy_vars(db_cursor: Any) -> None:
+    db_cursor.execute("CREATE TABLE var_details (id serial PRIMARY KEY, var_name text)")
+    db_cursor.execute(
+        "CREATE TABLE regions (id serial PRIMARY KEY, region_code text, resolution text)"
+    )
+    db_cursor.execute(
+        "CREATE TABLE proxy_metrics (id serial PRIMARY KEY, var_detail_id integer, region_id integer, proxy_var_detail_id integer)"
+    )
+    db_cursor.execute(
+        "INSERT INTO var_details (var_name) VALUES ('population'), ('employment'), ('gross value added'), ('heat demand')"
+    )
+    db_cursor.execute(
+        "INSERT INTO regions (region_code, resolution) VALUES ('DE', 'NUTS0'), ('FR', 'NUTS0'), ('DE1', 'NUTS1')"
+    )
+    # employment has 2 proxies in DE, heat demand none in FR, and NUTS1 proxies are ignored
+    db_cursor.execute(
+        "INSERT INTO proxy_metrics (var_detail_id, region_id, proxy_var_detail_id) VALUES \
+            (2, 1, 1), (2, 2, 1), (4, 1, 2), (2, 1, 3), (4, 3, 1)"
+    )
+    var_names = ["population", "employment", "heat demand"]
+    countries = ["DE", "FR"]
+
+    proxy_vars = db_access.resolve_proxy_vars(var_names, countries)
+
+    assert proxy_vars == {
+        ("employment", "DE"): ["population", "gross value added"],
+        ("employment", "FR"): ["population"],
+        ("heat demand", "DE"): ["employment"],
+    }
+    assert proxy_vars == {
+        (var_name, country): db_access.get_proxy_vars(var_name, country)
+        for var_name in var_names
+        for country in countries
+        if db_access.get_proxy_vars(var_name, country) is not None
+    }
+    assert db_access.resolve_proxy_vars(var_names) == proxy_vars
+
+
+@pytest.fixture
+def input_var_values(db_cursor: Any) -> Any:
+    """An input_var_values table with 4 rows, none of them chosen nor rated."""
+    db_cursor.execute(
+        "CREATE TABLE input_var_values (id serial PRIMARY KEY, value real, chosen smallint, input_var_quality_id integer)"
+    )
+    db_cursor.execute(
+        "INSERT INTO input_var_values (value) VALUES (0.5), (1.5), (2.5), (3.5)"
+    )
+    return db_cursor
+
+
+def _get_annotations(cursor: Any) -> list:
+    cursor.execute(
+        "SELECT id, value, chosen, input_var_quality_id FROM input_var_values ORDER BY id"
+    )
+    return cursor.fetchall()
+
+
+@pytest.mark.parametrize("copy_format", ["csv", "binary"])
+def test_col_values_are_set_per_row(input_var_values: Any, copy_format: str) -> None:
+    # the row with id 9 does not exist
+    n_rows = db_access.add_col_values_per_row(
+        "input_var_values",
+        pd.DataFrame(
+            {"id": [4, 9, 2], "chosen": [1, 1, 0], "input_var_quality_id": [1, 2, 3]}
+        ),
+        copy_format=copy_format,
+    )
+
+    assert n_rows == 2
+    assert _get_annotations(input_var_values) == [
+        (1, 0.5, None, None),
+        (2, 1.5, 0, 3),
+        (3, 2.5, None, None),
+        (4, 3.5, 1, 1),
+    ]
+
+
+def test_col_values_of_duplicate_keys_are_rejected(input_var_values: Any) -> None:
+    with pytest.raises(ValueError, match="duplicate"):
+        db_access.add_col_values_per_row(
+            "input_var_values",
+            pd.DataFrame({"id": [1, 2, 1], "chosen": [1, 1, 0]}),
+        )
+
+    assert _get_annotations(input_var_values) == [
+        (1, 0.5, None, None),
+        (2, 1.5, None, None),
+        (3, 2.5, None, None),
+        (4, 3.5, None, None),
+    ]
+
+
+def test_col_values_are_set_per_row_twice_in_a_load_session(
+    input_var_values: Any,
+) -> None:
+    with load_session("test"):
+        db_access.add_col_values_per_row(
+            "input_var_values", pd.DataFrame({"id": [1, 2], "chosen": [1, 1]})
+        )
+        db_access.add_col_values_per_row(
+            "input_var_values",
+            pd.DataFrame({"id": [2, 3], "input_var_quality_id": [1, 2]}),
+        )
+
+    assert _get_annotations(input_var_values) == [
+        (1, 0.5, 1, None),
+        (2, 1.5, 1, 1),
+        (3, 2.5, None, 2),
+        (4, 3.5, None, None),
+    ]
+
+
+def test_proxy_vars_are_none_if_there_are_none(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    proxy_vars = {("employment", "DE"): ["population", "gross value added"]}
+    monkeypatch.setattr(
+        db_access,
+        "resolve_proxy_vars",
+        lambda var_names, countries: {
+            key: value
+            for key, value in proxy_vars.items()
+            if key[0] in var_names and key[1] in countries
+        },
+    )
+
+    assert db_access.get_proxy_vars("employment", "DE") == [
+        "population",
+        "gross value added",
+    ]
+    assert db_access.get_proxy_vars("employment", "FR") is None
+
+    # the proxies could not be read
+    monkeypatch.setattr(
+        db_access, "resolve_proxy_vars", lambda var_names, countries: None
+    )
+    assert db_access.get_proxy_vars("employment", "DE") is None
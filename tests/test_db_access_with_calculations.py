@@ -0,0 +1,211 @@
+"""Tests of disaggregating and aggregating data before adding it to the DB."""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from zoomin.data.region_hierarchy import RegionHierarchy
+from zoomin.database import db_access_with_calculations as dawc
+from zoomin.disaggregation.share_matrix import ShareMatrix, build_share_matrix
+
+
+@pytest.fixture
+def regions(regions: dict) -> dict:
+    """The test regions and a second country, FR, with 1 LAU region."""
+    regions = dict(regions)
+    for level, (region_id, code, parent_code) in {
+        "NUTS0": (101, "FR", None),
+        "NUTS1": (102, "FR1", "FR"),
+        "NUTS2": (103, "FR11", "FR1"),
+        "NUTS3": (104, "FR111", "FR11"),
+        "LAU": (110, "F1", "FR111"),
+    }.items():
+        regions[level] = pd.concat(
+            [
+                regions[level],
+                pd.DataFrame(
+                    {
+                        "id": [region_id],
+                        "region_code": [code],
+                        "parent_region_code": [parent_code],
+                    }
+                ),
+            ],
+            ignore_index=True,
+        )
+    return regions
+
+
+@pytest.fixture
+def written(
+    monkeypatch: pytest.MonkeyPatch,
+    regions: dict,
+    region_hierarchy: RegionHierarchy,
+) -> dict:
+    """Patch the DB access of the module, and collect what would be written to the DB."""
+    written: dict = {"region_data": [], "proxy_metrics": []}
+
+    def get_share_matrix(proxy: str, resolution: str) -> ShareMatrix:
+        proxy_df = regions["LAU"].rename(columns={"id": "region_id"})
+        # the proxy is 0 in FR
+        proxy_df["value"] = [1.0, 1.0, 1.0, 1.0, 0.0] if proxy != "population" else 1.0
+        return build_share_matrix(proxy_df, resolution)
+
+    pathway_ids = {("p", "r", "v1"): 1, ("p", "r", "v2"): 2}
+
+    def get_primary_key(table: str, cols_criteria: dict) -> int:
+        if table == "pathways":
+            return pathway_ids[tuple(cols_criteria.values())]
+        return 7
+
+    def add_to_proxy_metrics(
+        var_detail_id: int, proxy_vars: list, countries: Optional[list] = None
+    ) -> None:
+        written["proxy_metrics"].append((countries, proxy_vars))
+
+    monkeypatch.setattr(dawc, "get_region_hierarchy", lambda: region_hierarchy)
+    monkeypatch.setattr(
+        "zoomin.disaggregation.share_matrix.get_region_hierarchy",
+        lambda: region_hierarchy,
+    )
+    monkeypatch.setattr(dawc, "get_share_matrix", get_share_matrix)
+    monkeypatch.setattr(dawc, "get_primary_key", get_primary_key)
+    monkeypatch.setattr(dawc, "add_to_region_data", written["region_data"].append)
+    monkeypatch.setattr(dawc, "aggregate_and_add_to_db", lambda *args: None)
+    monkeypatch.setattr(dawc, "invalidate_share_matrices", lambda var_name: None)
+    monkeypatch.setattr(dawc, "add_to_proxy_metrics", add_to_proxy_metrics)
+
+    return written
+
+
+def _get_eucalc_df(country_codes: list, variants: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "country_code": country_codes,
+            "year": 2030,
+            "main_pathway": "p",
+            "reference": "r",
+            "pathway_variant": variants,
+            "value": np.arange(1.0, len(country_codes) + 1),
+        }
+    )
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_eucalc_var_data_records_the_proxy_of_each_country(written: dict) -> None:
+    dawc.process_and_add_eucalc_var_data(
+        "var", _get_eucalc_df(["DE", "FR"], ["v1", "v1"]), "employment", np.nan
+    )
+
+    region_data_df = written["region_data"][0]
+    assert sorted(region_data_df["region_id"]) == [10, 11, 12, 13, 110]
+    assert region_data_df.loc[region_data_df["region_id"] == 110, "value"].item() == 2
+    assert sorted(written["proxy_metrics"]) == [
+        (["DE"], ["employment"]),
+        (["FR"], ["population"]),
+    ]
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_eucalc_var_data_rejects_duplicate_values(written: dict) -> None:
+    with pytest.raises(ValueError, match="several values"):
+        dawc.process_and_add_eucalc_var_data(
+            "var", _get_eucalc_df(["DE", "DE"], ["v1", "v1"]), "employment", np.nan
+        )
+
+    assert written["region_data"] == []
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_eucalc_var_data_keeps_the_values_of_each_pathway(written: dict) -> None:
+    dawc.process_and_add_eucalc_var_data(
+        "var", _get_eucalc_df(["DE", "DE"], ["v1", "v2"]), "employment", np.nan
+    )
+
+    region_data_df = written["region_data"][0]
+    assert not region_data_df.duplicated(["region_id", "year", "pathway_id"]).any()
+    assert region_data_df.groupby("pathway_id")["value"].sum().to_dict() == {
+        1: pytest.approx(1.0),
+        2: pytest.approx(2.0),
+    }
+
+
+def _aggregate_per_group(
+    db_ready_df: pd.DataFrame, agg_method: str, region_hierarchy: RegionHierarchy
+) -> pd.DataFrame:
+    """Aggregate the LAU data to each NUTS level group by group, as before the vectorized rollup."""
+    key_vars = ["year", "pathway_id"]
+    agg_df_list = []
+    for resolution in ["NUTS3", "NUTS2", "NUTS1", "NUTS0"]:
+        agg_df = db_ready_df.copy()
+        agg_df["region_id"] = region_hierarchy.ancestor_ids(
+            "LAU", agg_df["region_id"].values, resolution
+        )
+        rows = []
+        for keys, group in agg_df.groupby(["region_id"] + key_vars, dropna=False):
+            if agg_method == "sum":
+                value = group["value"].sum()
+            elif agg_method == "mean":
+                value = group["value"].mean()
+            else:
+                value = group["value"].unique().item()
+            rows.append(
+                dict(
+                    zip(["region_id"] + key_vars, keys),
+                    value=value,
+                    var_detail_id=group["var_detail_id"].unique().item(),
+                    quality_rating=group["quality_rating"].value_counts().idxmax(),
+                )
+            )
+        agg_df_list.append(pd.DataFrame(rows))
+
+    return pd.concat(agg_df_list, ignore_index=True)
+
+
+@pytest.mark.parametrize("agg_method", ["sum", "mean", "bool"])
+def test_rollup_matches_the_aggregation_per_group(
+    monkeypatch: pytest.MonkeyPatch, region_hierarchy: RegionHierarchy, agg_method: str
+) -> None:
+    rng = np.random.default_rng(0)
+    lau_ids = [10, 11, 12, 13, 110]
+    db_ready_df = pd.DataFrame(
+        {
+            "region_id": np.tile(lau_ids, 4),
+            "year": np.repeat([2020, 2030], 10),
+            "pathway_id": np.tile(np.repeat([1.0, np.nan], 5), 2),
+            "value": rng.random(20),
+            "var_detail_id": 7,
+            # ties of A and B in DE111, DE112 and up to DE in all groups
+            "quality_rating": np.tile(["A", "B", "B", "A", "C"], 4),
+        }
+    )
+    if agg_method == "bool":
+        db_ready_df["value"] = np.tile([1.0, 1.0, 1.0, 1.0, 0.0], 4)
+    else:
+        db_ready_df.loc[[1, 2, 3, 11], "value"] = np.nan
+    db_ready_df.loc[[0, 6], "quality_rating"] = np.nan
+    db_ready_df.loc[[14], "quality_rating"] = "A"
+
+    written: list = []
+    monkeypatch.setattr(dawc, "get_region_hierarchy", lambda: region_hierarchy)
+    monkeypatch.setattr(dawc, "get_col_values", lambda *args: agg_method)
+    monkeypatch.setattr(dawc, "add_to_region_data", written.append)
+
+    dawc.aggregate_and_add_to_db(db_ready_df, "var", {"citation_id": 3})
+
+    cols = ["region_id", "year", "pathway_id"]
+    result_df = written[0].sort_values(cols, ignore_index=True)
+    expected_df = _aggregate_per_group(
+        db_ready_df, agg_method, region_hierarchy
+    ).sort_values(cols, ignore_index=True)
+
+    # 4 combinations of year and pathway in 3 NUTS3, 2 NUTS2, 2 NUTS1 and 2 NUTS0 regions
+    assert len(result_df) == len(expected_df) == 4 * 9
+    pd.testing.assert_frame_equal(
+        result_df[cols + ["var_detail_id", "quality_rating"]],
+        expected_df[cols + ["var_detail_id", "quality_rating"]],
+        check_dtype=False,
+    )
+    np.testing.assert_allclose(result_df["value"], expected_df["value"])
+    assert (result_df["citation_id"] == 3).all()
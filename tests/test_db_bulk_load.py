@@ -0,0 +1,211 @@
+"""Tests of the CSV COPY and the bulk loader."""
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pytest
+
+from zoomin.database import db_bulk_load
+from zoomin.database.db_connection import with_db_connection
+from zoomin.database.db_session import load_session
+
+
+@pytest.fixture
+def data_df() -> pd.DataFrame:
+    """Rows with a missing value in each column, as NaN, <NA> and None."""
+    return pd.DataFrame(
+        {
+            "region_id": [1, 2, 3],
+            "pathway_id": [1.0, np.nan, 2.0],
+            "year": pd.array([2020, 2030, None], dtype="Int32"),
+            "value": [0.5, np.nan, 2.0],
+            "region_code": ["DE1", None, np.nan],
+        }
+    )
+
+
+class _CopyCursor:
+    """Cursor collecting the CSV COPYed to it."""
+
+    def copy_expert(self, sql: str, file: Any) -> None:
+        self.sql = sql
+        self.data = file.read()
+
+
+def test_missing_values_are_written_as_empty_fields(data_df: pd.DataFrame) -> None:
+    cursor = _CopyCursor()
+
+    db_bulk_load.copy_csv(cursor, "region_data", data_df)
+
+    assert cursor.sql == (
+        "COPY region_data (region_id, pathway_id, year, value, region_code) FROM STDIN WITH CSV"
+    )
+    assert cursor.data.splitlines() == ["1,1,2020,0.5,DE1", "2,,2030,,", "3,2,,2.0,"]
+
+
+@pytest.fixture
+def test_table(db_cursor: Any) -> Any:
+    """An empty table for the columns of `data_df`."""
+    db_cursor.execute(
+        "CREATE TABLE test_bulk_load (region_id integer NOT NULL, pathway_id integer, year integer, value double precision, region_code text)"
+    )
+    return db_cursor
+
+
+def _get_rows(cursor: Any) -> list:
+    cursor.execute("SELECT * FROM test_bulk_load ORDER BY region_id")
+    return cursor.fetchall()
+
+
+EXPECTED_ROWS = [
+    (1, 1, 2020, 0.5, "DE1"),
+    (2, None, 2030, None, None),
+    (3, 2, None, 2.0, None),
+]
+
+
+def test_missing_values_are_added_as_null(
+    test_table: Any, data_df: pd.DataFrame
+) -> None:
+    db_bulk_load.copy_csv(test_table, "test_bulk_load", data_df)
+
+    assert _get_rows(test_table) == EXPECTED_ROWS
+
+
+@pytest.mark.parametrize("copy_format", ["csv", "binary"])
+def test_bulk_load_adds_all_partitions(
+    test_table: Any, data_df: pd.DataFrame, copy_format: str
+) -> None:
+    db_bulk_load.bulk_load(
+        "test_bulk_load", data_df, copy_format=copy_format, rows_per_partition=2
+    )
+
+    assert _get_rows(test_table) == EXPECTED_ROWS
+
+
+@pytest.fixture
+def region_data_table(db_cursor: Any) -> Any:
+    """An empty region_data table with the upsert keys."""
+    db_cursor.execute(
+        "CREATE TABLE region_data (region_id integer NOT NULL, var_detail_id integer NOT NULL, year integer, pathway_id integer, climate_experiment_id integer, value double precision)"
+    )
+    return db_cursor
+
+
+def _get_region_data_df(value: float) -> pd.DataFrame:
+    """Region data of 2 regions, with and without pathway; without climate experiment column."""
+    return pd.DataFrame(
+        {
+            "region_id": [1, 1, 2],
+            "var_detail_id": 7,
+            "year": [2020, 2050, 2020],
+            "pathway_id": [np.nan, 3.0, np.nan],
+            "value": value,
+        }
+    )
+
+
+@pytest.mark.parametrize("copy_format", ["csv", "binary"])
+def test_upsert_is_idempotent(region_data_table: Any, copy_format: str) -> None:
+    other_var_df = _get_region_data_df(9.0).assign(var_detail_id=8)
+    db_bulk_load.bulk_load("region_data", other_var_df, copy_format=copy_format)
+
+    for value in [1.0, 1.0, 2.0]:
+        db_bulk_load.bulk_load(
+            "region_data",
+            _get_region_data_df(value),
+            copy_format=copy_format,
+            mode="upsert",
+            rows_per_partition=2,
+        )
+
+    region_data_table.execute(
+        "SELECT var_detail_id, region_id, year, pathway_id, value FROM region_data ORDER BY 1, 2, 3"
+    )
+    assert region_data_table.fetchall() == [
+        (7, 1, 2020, None, 2.0),
+        (7, 1, 2050, 3, 2.0),
+        (7, 2, 2020, None, 2.0),
+        (8, 1, 2020, None, 9.0),
+        (8, 1, 2050, 3, 9.0),
+        (8, 2, 2020, None, 9.0),
+    ]
+
+
+def test_upsert_needs_keys(region_data_table: Any) -> None:
+    with pytest.raises(ValueError, match="no upsert keys"):
+        db_bulk_load.bulk_load(
+            "test_bulk_load", _get_region_data_df(1.0), mode="upsert"
+        )
+
+
+def _get_staging_tables(cursor: Any) -> list:
+    cursor.execute(
+        "SELECT tablename FROM pg_tables WHERE tablename LIKE 'test_bulk_load_staging_%%'"
+    )
+    return cursor.fetchall()
+
+
+@pytest.mark.parametrize("copy_format", ["csv", "binary"])
+def test_bulk_load_within_a_load_session(
+    test_table: Any,
+    data_df: pd.DataFrame,
+    copy_format: str,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # waiting for a lock fails instead of hanging the tests
+    monkeypatch.setenv("PGOPTIONS", "-c lock_timeout=5000")
+
+    with load_session("test"):
+        db_bulk_load.bulk_load(
+            "test_bulk_load", data_df, copy_format=copy_format, rows_per_partition=2
+        )
+
+    assert [record for record in caplog.records if record.levelname == "ERROR"] == []
+    assert _get_rows(test_table) == EXPECTED_ROWS
+    assert _get_staging_tables(test_table) == []
+
+
+def test_staging_table_is_dropped_after_a_failed_load_session(
+    test_table: Any, data_df: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PGOPTIONS", "-c lock_timeout=5000")
+    # NULL region_id fails adding the staging table to the table
+    data_df["region_id"] = pd.array([1, None, 3], dtype="Int64")
+
+    with pytest.raises(psycopg2.IntegrityError):
+        with load_session("test"):
+            db_bulk_load.bulk_load("test_bulk_load", data_df)
+
+    assert _get_rows(test_table) == []
+    assert _get_staging_tables(test_table) == []
+
+
+def test_staging_table_is_dropped_after_a_load_session_failed_later(
+    test_table: Any, data_df: pd.DataFrame, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PGOPTIONS", "-c lock_timeout=5000")
+
+    with pytest.raises(RuntimeError):
+        with load_session("test"):
+            db_bulk_load.bulk_load("test_bulk_load", data_df)
+            raise RuntimeError("a later step of the load failed")
+
+    assert _get_rows(test_table) == []
+    assert _get_staging_tables(test_table) == []
+
+
+@with_db_connection()
+def _copy_csv(cursor: Any, table: str, data_df: pd.DataFrame) -> None:
+    db_bulk_load.copy_csv(cursor, table, data_df)
+
+
+def test_missing_values_are_added_as_null_within_a_load_session(
+    test_table: Any, data_df: pd.DataFrame
+) -> None:
+    with load_session("test"):
+        _copy_csv("test_bulk_load", data_df)
+
+    assert _get_rows(test_table) == EXPECTED_ROWS
@@ -0,0 +1,162 @@
+"""Tests of the connection pool and the connection helpers."""
+import os
+from typing import Any
+
+import psycopg2
+import pytest
+
+from zoomin.database import db_connection
+from zoomin.database.db_connection import (
+    borrow_db_connection,
+    get_connection_pool,
+    get_load_session,
+    with_db_connection,
+)
+from zoomin.database.db_session import load_session
+
+
+@with_db_connection()
+def _get_backend_pid(cursor: Any) -> int:
+    cursor.execute("SELECT pg_backend_pid()")
+    return int(cursor.fetchone()[0])
+
+
+@with_db_connection(pooled=False)
+def _get_dedicated_backend_pid(cursor: Any) -> int:
+    cursor.execute("SELECT pg_backend_pid()")
+    return int(cursor.fetchone()[0])
+
+
+@with_db_connection(in_session=False)
+def _get_own_backend_pid(cursor: Any) -> int:
+    cursor.execute("SELECT pg_backend_pid()")
+    return int(cursor.fetchone()[0])
+
+
+@with_db_connection()
+def _select_from_missing_table(cursor: Any) -> list:
+    cursor.execute("SELECT * FROM missing_table")
+    return list(cursor.fetchall())
+
+
+@with_db_connection(in_session=False)
+def _select_from_missing_table_on_own_connection(cursor: Any) -> list:
+    cursor.execute("SELECT * FROM missing_table")
+    return list(cursor.fetchall())
+
+
+def test_pooled_connections_are_reused_and_released(db_cursor: Any) -> None:
+    pid = _get_backend_pid()
+
+    assert _get_backend_pid() == pid
+    assert _get_dedicated_backend_pid() not in (pid, _get_dedicated_backend_pid())
+
+    connection_pool = get_connection_pool()
+    with borrow_db_connection():
+        assert len(connection_pool._used) == 1
+        # the pooled connection is in use; another one is opened
+        assert _get_backend_pid() != pid
+    assert len(connection_pool._used) == 0
+
+
+def test_borrowed_connection_commits_or_rolls_back(db_cursor: Any) -> None:
+    db_cursor.execute("CREATE TABLE test_connection (id integer)")
+
+    with borrow_db_connection() as connection:
+        connection.cursor().execute("INSERT INTO test_connection VALUES (1)")
+    with pytest.raises(RuntimeError):
+        with borrow_db_connection() as connection:
+            connection.cursor().execute("INSERT INTO test_connection VALUES (2)")
+            raise RuntimeError("failed")
+
+    db_cursor.execute("SELECT id FROM test_connection")
+    assert db_cursor.fetchall() == [(1,)]
+
+
+def test_exhausted_pool_opens_dedicated_connections(
+    db_cursor: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_connection.close_connection_pool()
+    monkeypatch.setattr(db_connection, "db_pool_max_conn", 1)
+
+    with borrow_db_connection() as pooled_connection:
+        with borrow_db_connection() as dedicated_connection:
+            assert dedicated_connection is not pooled_connection
+    assert dedicated_connection.closed != 0
+    assert pooled_connection.closed == 0
+
+
+def test_broken_connections_are_not_reused(db_cursor: Any) -> None:
+    connection_pool = get_connection_pool()
+    connection, _ = db_connection._get_connection(pooled=True)
+    connection.close()
+
+    db_connection._release_connection(connection, connection_pool)
+
+    with borrow_db_connection() as other_connection:
+        assert other_connection is not connection
+        assert other_connection.closed == 0
+
+
+def test_db_errors_return_none_outside_of_a_session(
+    db_cursor: Any, caplog: pytest.LogCaptureFixture
+) -> None:
+    assert _select_from_missing_table() is None
+    assert "missing_table" in caplog.text
+
+    # the connection is still usable afterwards
+    assert _get_backend_pid() > 0
+
+
+def test_db_errors_are_raised_within_a_session(db_cursor: Any) -> None:
+    with pytest.raises(psycopg2.errors.UndefinedTable):
+        with load_session("test"):
+            _select_from_missing_table()
+
+
+def test_functions_not_in_session_use_their_own_connection(db_cursor: Any) -> None:
+    with load_session("test"):
+        session_pid = _get_backend_pid()
+
+        assert _get_own_backend_pid() != session_pid
+        # not part of the session; does not abort it
+        assert _select_from_missing_table_on_own_connection() is None
+        assert _get_backend_pid() == session_pid
+
+
+def test_pool_of_another_process_is_not_used(
+    db_cursor: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    connection_pool = get_connection_pool()
+
+    # for ex.: a process not started with os.fork
+    monkeypatch.setattr(db_connection, "_connection_pool_pid", -1)
+
+    assert get_connection_pool() is not connection_pool
+
+
+def test_pool_is_reset_after_fork(db_cursor: Any) -> None:
+    parent_pid = _get_backend_pid()
+    read_fd, write_fd = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        # child process; exits without running the teardown of the test
+        try:
+            os.close(read_fd)
+            is_reset = (
+                db_connection._connection_pool is None and get_load_session() is None
+            )
+            child_pid = _get_backend_pid() if is_reset else 0
+            os.write(write_fd, str(child_pid).encode("utf-8"))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        child_pid = int(f.read() or 0)
+    os.waitpid(pid, 0)
+
+    assert child_pid not in (0, parent_pid)
+    # the connection of the parent is still usable
+    assert _get_backend_pid() == parent_pid
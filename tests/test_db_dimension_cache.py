@@ -0,0 +1,95 @@
+"""Tests of the in-memory cache of the dimension tables."""
+import pytest
+
+from zoomin.database import db_dimension_cache
+from zoomin.database.db_dimension_cache import DimensionCache
+
+
+@pytest.fixture
+def tables(monkeypatch: pytest.MonkeyPatch) -> dict:
+    """Rows of the dimension tables, and the number of reads of each table."""
+    tables = {
+        "pathways": [(1, "p", "r", "v1"), (2, "p", "r", "v2")],
+        "citations": [(1, "a citation")],
+        "reads": {},
+    }
+
+    def get_table_rows(table: str) -> tuple:
+        tables["reads"][table] = tables["reads"].get(table, 0) + 1
+        columns = {
+            "pathways": ["id", "main_pathway", "reference", "pathway_variant"],
+            "citations": ["id", "data_source_citation"],
+        }[table]
+        return columns, list(tables[table])
+
+    monkeypatch.setattr(db_dimension_cache, "_get_table_rows", get_table_rows)
+    return tables
+
+
+def test_tables_are_loaded_on_first_use(tables: dict) -> None:
+    cache = DimensionCache(["pathways", "citations"])
+    assert tables["reads"] == {}
+
+    assert cache.get_col_values("pathways", "id", {"pathway_variant": "v2"}) == [2]
+    assert cache.get_col_values("pathways", "id", {"pathway_variant": "v1"}) == [1]
+    assert cache.get_col_values("pathways", "id") == [1, 2]
+    assert list(cache.get_table("pathways")["pathway_variant"]) == ["v1", "v2"]
+
+    assert tables["reads"] == {"pathways": 1}
+
+
+def test_refresh_drops_the_table(tables: dict) -> None:
+    cache = DimensionCache(["pathways", "citations"])
+    cache.get_col_values("pathways", "id", {"pathway_variant": "v1"})
+    cache.get_col_values("citations", "id")
+
+    tables["pathways"][0] = (1, "p", "r", "v3")
+    cache.refresh("pathways")
+
+    assert cache.get_col_values("pathways", "id", {"pathway_variant": "v3"}) == [1]
+    assert cache.get_col_values("citations", "id") == [1]
+    assert tables["reads"] == {"pathways": 2, "citations": 1}
+
+    cache.refresh()
+    cache.get_col_values("citations", "id")
+    assert tables["reads"] == {"pathways": 2, "citations": 2}
+
+
+def test_miss_reloads_the_table_once(tables: dict) -> None:
+    cache = DimensionCache(["pathways"])
+    cache.get_col_values("pathways", "id", {"pathway_variant": "v1"})
+
+    # added by another process
+    tables["pathways"].append((3, "p", "r", "v3"))
+    assert cache.get_col_values("pathways", "id", {"pathway_variant": "v3"}) == [3]
+    assert tables["reads"] == {"pathways": 2}
+
+    assert cache.get_col_values("pathways", "id", {"pathway_variant": "v4"}) == []
+    assert tables["reads"] == {"pathways": 3}
+
+
+def test_tables_that_cannot_be_read_are_reported(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(db_dimension_cache, "_get_table_rows", lambda table: None)
+
+    with pytest.raises(ValueError, match="could not be read"):
+        DimensionCache(["pathways"]).get_col_values("pathways", "id")
+
+
+def test_refreshing_the_regions_invalidates_the_region_snapshot(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    invalidated: list = []
+    monkeypatch.setattr(
+        db_dimension_cache,
+        "invalidate_region_snapshot",
+        lambda: invalidated.append(True),
+    )
+
+    db_dimension_cache.refresh_dimension_cache("pathways")
+    assert invalidated == []
+
+    db_dimension_cache.refresh_dimension_cache("regions")
+    db_dimension_cache.refresh_dimension_cache()
+    assert invalidated == [True, True]
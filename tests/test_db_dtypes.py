@@ -0,0 +1,42 @@
+"""Tests of the compact dtypes."""
+import importlib
+from typing import Iterator, Optional
+
+import pytest
+
+from zoomin.database import db_dtypes
+
+
+@pytest.fixture
+def reload_db_dtypes(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """Reload the module with the environment set by the test, and with the original one afterwards."""
+    yield
+    monkeypatch.undo()
+    importlib.reload(db_dtypes)
+
+
+@pytest.mark.parametrize(
+    "setting, float32_values",
+    [
+        (None, False),
+        ("0", False),
+        ("false", False),
+        ("no", False),
+        ("", False),
+        ("1", True),
+        ("True", True),
+        ("yes", True),
+    ],
+)
+def test_float32_values_setting(
+    monkeypatch: pytest.MonkeyPatch,
+    reload_db_dtypes: None,
+    setting: Optional[str],
+    float32_values: bool,
+) -> None:
+    if setting is None:
+        monkeypatch.delenv("FLOAT32_VALUES", raising=False)
+    else:
+        monkeypatch.setenv("FLOAT32_VALUES", setting)
+
+    assert importlib.reload(db_dtypes).FLOAT32_VALUES is float32_values
@@ -0,0 +1,83 @@
+"""Tests of partitioning region_data by var_detail_id."""
+from typing import Any
+
+import pytest
+
+from zoomin.database import db_partitioning
+from zoomin.database.db_connection import with_db_connection
+from zoomin.database.db_session import load_session
+
+
+@pytest.fixture
+def region_data_table(db_cursor: Any, monkeypatch: pytest.MonkeyPatch) -> Any:
+    """An unpartitioned region_data table with rows of 2 vars and an index."""
+    # waiting for a lock fails instead of hanging the tests
+    monkeypatch.setenv("PGOPTIONS", "-c lock_timeout=5000")
+    monkeypatch.setattr(db_partitioning, "_is_partitioned", None)
+    monkeypatch.setattr(db_partitioning, "_var_partitions", set())
+
+    db_cursor.execute(
+        "CREATE TABLE region_data (id serial PRIMARY KEY, region_id integer NOT NULL, var_detail_id integer NOT NULL, value double precision)"
+    )
+    db_cursor.execute("CREATE INDEX region_data_region_idx ON region_data (region_id)")
+    db_cursor.execute(
+        "INSERT INTO region_data (region_id, var_detail_id, value) VALUES (1, 1, 1.0), (2, 1, 2.0), (1, 2, 3.0)"
+    )
+    return db_cursor
+
+
+def _get_partitions(cursor: Any) -> list:
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid \
+            WHERE i.inhparent = 'region_data'::regclass ORDER BY 1"
+    )
+    return [name for (name,) in cursor.fetchall()]
+
+
+def test_partition_region_data_keeps_rows_and_indexes(region_data_table: Any) -> None:
+    db_partitioning.partition_region_data()
+    db_partitioning.partition_region_data()  # does nothing the second time
+
+    assert db_partitioning.is_partitioned(region_data_table)
+    assert _get_partitions(region_data_table) == [
+        "region_data_default",
+        "region_data_var_1",
+        "region_data_var_2",
+    ]
+    assert [
+        name
+        for name, _ in db_partitioning.get_index_definitions(
+            region_data_table, "region_data"
+        )
+    ] == ["region_data_region_idx"]
+
+    region_data_table.execute(
+        "INSERT INTO region_data (region_id, var_detail_id, value) VALUES (3, 2, 4.0) RETURNING id"
+    )
+    assert region_data_table.fetchone()[0] == 4
+    region_data_table.execute("SELECT COUNT(*) FROM region_data_var_2")
+    assert region_data_table.fetchone()[0] == 2
+
+
+@with_db_connection()
+def _count_region_data(cursor: Any) -> int:
+    cursor.execute("SELECT COUNT(*) FROM region_data")
+    return int(cursor.fetchone()[0])
+
+
+def test_var_partitions_are_not_created_within_a_load_session(
+    region_data_table: Any, caplog: pytest.LogCaptureFixture
+) -> None:
+    db_partitioning.partition_region_data()
+
+    with load_session("test"):
+        # the session holds a lock on the partitions of region_data from now on
+        assert _count_region_data() == 3
+        db_partitioning.add_var_partitions([3])
+
+    # no lock timeout
+    assert [record for record in caplog.records if record.levelname == "ERROR"] == []
+    assert "region_data_var_3" not in _get_partitions(region_data_table)
+
+    db_partitioning.add_var_partitions([3])
+    assert "region_data_var_3" in _get_partitions(region_data_table)
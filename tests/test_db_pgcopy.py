@@ -0,0 +1,194 @@
+"""Tests of the binary COPY (PGCOPY) encoder and decoder."""
+import struct
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from zoomin.database import db_pgcopy
+
+PG_TYPES = ["integer", "double precision", "text", "text", "boolean"]
+
+
+def _pack_rows(rows: list, pg_types: list) -> bytes:
+    """Pack rows field by field with `struct`, as reference for the vectorized encoder."""
+    data = b""
+    for row in rows:
+        data += struct.pack(">h", len(row))
+        for value, pg_type in zip(row, pg_types):
+            if value is None:
+                data += struct.pack(">i", -1)
+            elif pg_type in db_pgcopy.PG_TEXT_TYPES:
+                encoded = value.encode("utf-8")
+                data += struct.pack(">i", len(encoded)) + encoded
+            else:
+                fmt = db_pgcopy.PG_STRUCT_FORMATS[pg_type]
+                data += struct.pack(">i", struct.calcsize(fmt)) + struct.pack(
+                    fmt, value
+                )
+    return data
+
+
+@pytest.fixture
+def data_df() -> pd.DataFrame:
+    """Rows with NULLs in each column, non-ASCII and empty texts, and a categorical column."""
+    return pd.DataFrame(
+        {
+            "region_id": pd.array([1, None, 3], dtype="Int32"),
+            "value": [0.5, 2.0, np.nan],
+            "region_code": ["DE1", "Bückeburg", None],
+            "parent_region_code": pd.Categorical(["DE", None, ""]),
+            "chosen": pd.array([True, False, None], dtype="boolean"),
+        }
+    )
+
+
+def test_encode_rows_matches_struct_packing(data_df: pd.DataFrame) -> None:
+    expected = _pack_rows(
+        [
+            (1, 0.5, "DE1", "DE", True),
+            (None, 2.0, "Bückeburg", None, False),
+            (3, None, None, "", None),
+        ],
+        PG_TYPES,
+    )
+
+    assert db_pgcopy.encode_pgcopy_rows(data_df, PG_TYPES).tobytes() == expected
+
+
+def test_encode_rows_of_an_empty_frame(data_df: pd.DataFrame) -> None:
+    assert db_pgcopy.encode_pgcopy_rows(data_df.iloc[:0], PG_TYPES).tobytes() == b""
+
+
+def test_chunks_are_read_in_any_size(data_df: pd.DataFrame) -> None:
+    chunks = list(db_pgcopy.iter_pgcopy_chunks(data_df, PG_TYPES, rows_per_chunk=2))
+    reader = db_pgcopy._ChunkReader(chunks)
+
+    data = b""
+    while True:
+        part = reader.read(7)
+        if part == b"":
+            break
+        data += part
+
+    assert len(chunks) == 4  # header, 2 chunks of rows, trailer
+    assert data == b"".join(chunks)
+
+
+def test_unsupported_types_are_rejected(data_df: pd.DataFrame) -> None:
+    with pytest.raises(ValueError, match="not supported"):
+        db_pgcopy.encode_pgcopy_rows(data_df[["region_id"]], ["numeric"])
+
+
+def test_copy_to_table(db_cursor: Any, data_df: pd.DataFrame) -> None:
+    db_cursor.execute(
+        "CREATE TABLE test_pgcopy (region_id integer, value double precision, region_code text, parent_region_code varchar(8), chosen boolean)"
+    )
+
+    db_pgcopy.copy_to_table(db_cursor, "test_pgcopy", data_df, rows_per_chunk=2)
+
+    db_cursor.execute("SELECT * FROM test_pgcopy ORDER BY region_code")
+    assert db_cursor.fetchall() == [
+        (None, 2.0, "Bückeburg", None, False),
+        (1, 0.5, "DE1", "DE", True),
+        (3, None, None, "", None),
+    ]
+
+
+def test_decode_rows_of_encoded_rows(data_df: pd.DataFrame) -> None:
+    data = b"".join(db_pgcopy.iter_pgcopy_chunks(data_df, PG_TYPES))
+
+    assert db_pgcopy.decode_pgcopy_rows(data, PG_TYPES) == [
+        [1, None, 3],
+        [0.5, 2.0, None],
+        ["DE1", "Bückeburg", None],
+        ["DE", None, ""],
+        [True, False, None],
+    ]
+
+
+def test_decode_fixed_width_rows() -> None:
+    pg_types = ["smallint", "bigint", "real", "boolean"]
+    data_df = pd.DataFrame(
+        {
+            "a": [1, -2],
+            "b": [2**40, 0],
+            "c": [0.5, -1.25],
+            "d": [True, False],
+        }
+    )
+    data = b"".join(db_pgcopy.iter_pgcopy_chunks(data_df, pg_types))
+
+    cols = db_pgcopy.decode_pgcopy_fixed(data, pg_types)
+
+    for col, values in zip(data_df.columns, cols):
+        np.testing.assert_array_equal(values, data_df[col].values)
+
+
+def test_decode_fixed_width_rows_rejects_nulls(data_df: pd.DataFrame) -> None:
+    data = b"".join(db_pgcopy.iter_pgcopy_chunks(data_df[["region_id"]], ["integer"]))
+
+    with pytest.raises(ValueError, match="fixed width"):
+        db_pgcopy.decode_pgcopy_fixed(data, ["integer"])
+
+
+@pytest.mark.parametrize("with_text", [False, True])
+def test_copy_from_query_returns_the_dtypes_of_read_sql(
+    db_cursor: Any, with_text: bool
+) -> None:
+    text_col = ", 'DE'::text AS region_code" if with_text else ""
+    sql_cmd = f"SELECT 1::smallint AS a, 2::integer AS b, NULL::integer AS c, 0.5::real AS d, 1.5::double precision AS e{text_col}"
+
+    data_df = db_pgcopy.copy_from_query(db_cursor, sql_cmd)
+
+    assert data_df[["a", "b", "d", "e"]].dtypes.astype(str).to_list() == [
+        "int64",
+        "int64",
+        "float64",
+        "float64",
+    ]
+    assert data_df.iloc[0][["a", "b", "d", "e"]].to_list() == [1, 2, 0.5, 1.5]
+    assert data_df["c"].isna().all()
+
+
+def _get_texts(series: pd.Series) -> list:
+    return [value if isinstance(value, str) else None for value in series]
+
+
+def test_copy_from_query_decodes_text_columns(db_cursor: Any) -> None:
+    sql_cmd = "SELECT * FROM (VALUES ('DE1'::text, 1, 'a'::varchar), (NULL, 2, 'b'), ('Bückeburg', NULL, 'a'), ('', 4, NULL)) AS t(region_code, id, name)"
+
+    data_df = db_pgcopy.copy_from_query(db_cursor, sql_cmd)
+
+    assert _get_texts(data_df["region_code"]) == ["DE1", None, "Bückeburg", ""]
+    assert _get_texts(data_df["name"]) == ["a", "b", "a", None]
+    np.testing.assert_array_equal(data_df["id"], [1.0, 2.0, np.nan, 4.0])
+
+
+def test_copy_from_query_of_an_empty_result(db_cursor: Any) -> None:
+    sql_cmd = "SELECT 'DE1'::text AS region_code, 1 AS id WHERE false"
+
+    data_df = db_pgcopy.copy_from_query(db_cursor, sql_cmd)
+
+    assert list(data_df.columns) == ["region_code", "id"]
+    assert len(data_df) == 0
+
+
+def test_copy_from_query_keeps_the_padding_of_character_columns(
+    db_cursor: Any,
+) -> None:
+    data_df = db_pgcopy.copy_from_query(db_cursor, "SELECT 'ab'::char(3) AS code")
+
+    assert data_df["code"].to_list() == ["ab "]
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_copy_from_query_of_mixed_columns_matches_read_sql(db_cursor: Any) -> None:
+    sql_cmd = "SELECT * FROM (VALUES ('01001'::text, 1::smallint, 0.1::real, (1.0 / 3)::float8, true, NULL::boolean, 'a,\"b\"'), ('', NULL, NULL, NULL, false, true, NULL)) AS t(region_code, a, b, c, d, e, f)"
+
+    data_df = db_pgcopy.copy_from_query(db_cursor, sql_cmd)
+
+    pd.testing.assert_frame_equal(
+        data_df, pd.read_sql_query(sql_cmd, db_cursor.connection)
+    )
@@ -0,0 +1,78 @@
+"""Tests of the dependency graph of the DB population jobs."""
+import os
+import signal
+
+import pytest
+
+from zoomin.database import db_population_dag as dag
+
+
+def _get_job(var_name: str, proxy: object = None) -> tuple:
+    return (var_name, None, proxy, None, None)
+
+
+def _add_var(values: tuple) -> None:
+    if values[0] == "employment":
+        raise ValueError("broken data")
+    if values[0] == "gdp":
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_proxies_are_added_before_their_dependents() -> None:
+    jobs = [
+        _get_job("gdp", "employment + population"),
+        _get_job("employment", "population"),
+        _get_job("population"),
+        _get_job("area", "land area"),
+    ]
+
+    levels = dag.build_population_dag(jobs)
+
+    assert [sorted(values[0] for values in level) for level in levels] == [
+        ["area", "population"],
+        ["employment"],
+        ["gdp"],
+    ]
+
+
+def test_circular_dependencies_are_rejected() -> None:
+    with pytest.raises(ValueError, match="circular"):
+        dag.build_population_dag([_get_job("a", "b"), _get_job("b", "a")])
+
+
+def test_dependents_of_failed_jobs_are_skipped(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(dag, "process_and_add_input_data", _add_var)
+    monkeypatch.setattr(dag, "estimate_input_data_memory", lambda values: 1.0)
+    jobs = [
+        _get_job("population"),
+        _get_job("employment", "population"),
+        _get_job("gdp", "employment"),
+    ]
+
+    report = dag.run_population_dag(jobs, memory_budget_mb=10.0, n_workers=2)
+
+    assert dict(zip(report["var_name"], report["failed"])) == {
+        "population": False,
+        "employment": True,
+    }
+
+
+def test_dependents_of_jobs_of_a_killed_worker_are_skipped(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(dag, "process_and_add_input_data", _add_var)
+    monkeypatch.setattr(dag, "estimate_input_data_memory", lambda values: 1.0)
+    jobs = [
+        _get_job("population"),
+        _get_job("gdp", "population"),
+        _get_job("gdp per capita", "gdp / population"),
+    ]
+
+    report = dag.run_population_dag(jobs, memory_budget_mb=10.0, n_workers=2)
+
+    assert dict(zip(report["var_name"], report["failed"])) == {
+        "population": False,
+        "gdp": True,
+    }
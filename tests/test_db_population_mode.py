@@ -0,0 +1,69 @@
+"""Tests of loading the data tables without index and foreign key maintenance."""
+import os
+from typing import Any
+
+import pytest
+
+from zoomin.database import db_population_mode
+from zoomin.database.db_partitioning import partition_region_data
+
+
+@pytest.fixture
+def region_data_table(
+    db_cursor: Any, monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> Any:
+    """A region_data table partitioned by var_detail_id, with an index and a foreign key."""
+    monkeypatch.setattr(db_population_mode, "POPULATION_MODE_DIR", str(tmp_path))
+
+    db_cursor.execute("CREATE TABLE regions (id integer PRIMARY KEY)")
+    db_cursor.execute("INSERT INTO regions VALUES (1), (2)")
+    db_cursor.execute(
+        "CREATE TABLE region_data (id serial PRIMARY KEY, region_id integer NOT NULL REFERENCES regions (id), var_detail_id integer NOT NULL, value double precision)"
+    )
+    db_cursor.execute("CREATE INDEX region_data_region_idx ON region_data (region_id)")
+    db_cursor.execute(
+        "INSERT INTO region_data (region_id, var_detail_id, value) VALUES (1, 1, 1.0), (2, 2, 2.0)"
+    )
+    partition_region_data()
+
+    return db_cursor
+
+
+def _get_indexes(cursor: Any) -> list:
+    """Return the indexes of region_data and its partitions, without primary keys, and whether they are valid."""
+    cursor.execute(
+        "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid \
+            JOIN pg_class t ON t.oid = i.indrelid \
+            WHERE t.relname LIKE 'region_data%%' AND NOT i.indisprimary ORDER BY 1"
+    )
+    return cursor.fetchall()
+
+
+def test_indexes_of_partitioned_tables_are_rebuilt(region_data_table: Any) -> None:
+    indexes = _get_indexes(region_data_table)
+    assert len(indexes) == 4  # region_data, default and 2 var partitions
+
+    db_population_mode.start_population_mode(["region_data"])
+
+    assert _get_indexes(region_data_table) == []
+    assert os.path.isfile(db_population_mode.get_population_mode_path())
+
+    db_population_mode.finish_population_mode()
+
+    assert [valid for _, valid in _get_indexes(region_data_table)] == [True] * 4
+    assert not os.path.isfile(db_population_mode.get_population_mode_path())
+
+    region_data_table.execute(
+        "SELECT COUNT(*) FROM pg_constraint WHERE conrelid = 'region_data'::regclass AND contype = 'f'"
+    )
+    assert region_data_table.fetchone()[0] == 1
+
+
+def test_definitions_are_recorded_per_db(monkeypatch: pytest.MonkeyPatch) -> None:
+    path = db_population_mode.get_population_mode_path()
+    monkeypatch.setattr(db_population_mode, "db_name", "other/db")
+
+    other_path = db_population_mode.get_population_mode_path()
+
+    assert other_path != path
+    assert os.path.dirname(other_path) == os.path.dirname(path)
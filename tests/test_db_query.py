@@ -0,0 +1,54 @@
+"""Tests of the query layer."""
+import gc
+from typing import Any
+
+import numpy as np
+import psycopg2
+import pytest
+
+from zoomin.database import db_query
+from zoomin.database.db_connection import get_conn_info
+
+
+def test_where_clause_binds_arrays_as_one_parameter() -> None:
+    where_clause, params = db_query.build_where_clause(
+        {"region_id": np.array([1, 2]), "year": np.int64(2020), "pathway_id": None}
+    )
+
+    assert where_clause == "region_id = ANY(%s) AND year = %s AND pathway_id IS NULL"
+    assert params == [[1, 2], 2020]
+
+
+@pytest.mark.parametrize("name", ["1col", "col; DROP TABLE regions", "a-b", ""])
+def test_invalid_identifiers_are_rejected(name: str) -> None:
+    with pytest.raises(ValueError, match="invalid"):
+        db_query.build_where_clause({name: 1})
+
+
+def test_placeholders_become_positional() -> None:
+    assert (
+        db_query._to_positional("SELECT 1 WHERE a = %s AND b LIKE '%%x' AND c = %s")
+        == "SELECT 1 WHERE a = $1 AND b LIKE '%x' AND c = $2"
+    )
+
+
+def test_statements_are_prepared_once_per_connection(db_cursor: Any) -> None:
+    db_cursor.execute("CREATE TABLE test_query (id integer, name text)")
+    db_cursor.execute("INSERT INTO test_query VALUES (1, 'a'), (2, 'b'), (3, 'c')")
+
+    connection = psycopg2.connect(**get_conn_info())
+    with connection.cursor() as cursor:
+        for names in [["a", "b"], ["c"]]:
+            assert db_query.select_col_values(
+                cursor, "test_query", "id", {"name": names}
+            ) == sorted(ord(name) - ord("a") + 1 for name in names)
+
+        cursor.execute("SELECT COUNT(*) FROM pg_prepared_statements")
+        assert cursor.fetchone()[0] == 1
+    assert len(db_query._prepared_statements[connection]) == 1
+
+    connection.close()
+    del cursor, connection
+    gc.collect()
+
+    assert len(db_query._prepared_statements) == 0
@@ -0,0 +1,46 @@
+"""Tests of the snapshot of the regions table."""
+from typing import Any
+
+import pandas as pd
+import pytest
+
+from zoomin.database import db_region_snapshot
+from zoomin.database.db_access import add_col_values_per_row
+
+
+@pytest.fixture
+def regions_table(
+    db_cursor: Any, monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> Any:
+    """A regions table with one NUTS3 region and its LAU regions, and an empty snapshot directory."""
+    db_cursor.execute(
+        "CREATE TABLE regions (id integer PRIMARY KEY, region_code text, parent_region_code text, resolution text)"
+    )
+    db_cursor.execute(
+        "INSERT INTO regions VALUES (4, 'DE111', 'DE11', 'NUTS3'), (10, 'L1', 'DE111', 'LAU'), (11, 'L2', 'DE111', 'LAU')"
+    )
+    monkeypatch.setattr(db_region_snapshot, "REGION_SNAPSHOT_PATH", str(tmp_path))
+    monkeypatch.setattr(db_region_snapshot, "_region_snapshot", None)
+
+    return db_cursor
+
+
+def test_version_changes_when_a_region_is_edited(regions_table: Any) -> None:
+    version = db_region_snapshot.get_regions_version()
+
+    regions_table.execute("UPDATE regions SET region_code='L9' WHERE id=11")
+
+    assert db_region_snapshot.get_regions_version() != version
+
+
+def test_snapshot_is_checked_again_after_writes_to_regions(
+    regions_table: Any,
+) -> None:
+    snapshot = db_region_snapshot.get_region_snapshot()
+    assert list(snapshot.get_regions("LAU", "DE")["region_code"]) == ["L1", "L2"]
+
+    add_col_values_per_row("regions", pd.DataFrame({"id": [11], "region_code": ["L9"]}))
+
+    snapshot = db_region_snapshot.get_region_snapshot()
+    assert list(snapshot.get_regions("LAU", "DE")["region_code"]) == ["L1", "L9"]
+    assert list(snapshot.get_regions("NUTS3", None)["region_code"]) == ["DE111"]
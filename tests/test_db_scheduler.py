@@ -0,0 +1,57 @@
+"""Tests of the memory-aware scheduling of DB population jobs."""
+import os
+import signal
+
+import pytest
+
+from zoomin.database import db_access_with_calculations as dawc
+from zoomin.database import db_scheduler
+
+
+def _add_var(values: tuple) -> None:
+    if values[0] == "broken var":
+        raise ValueError("broken data")
+    if values[0] == "killed var":
+        # as killed by the OOM killer
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_run_jobs_reports_failed_jobs() -> None:
+    jobs = [("var", None, None, None, None), ("broken var", None, None, None, None)]
+
+    report = db_scheduler.run_jobs(
+        _add_var, jobs, lambda values: 1.0, memory_budget_mb=10.0, n_workers=2
+    )
+
+    assert dict(zip(report["var_name"], report["failed"])) == {
+        "var": False,
+        "broken var": True,
+    }
+    assert (report["peak_rss_increase_mb"] >= 0).all()
+
+
+def test_run_jobs_reports_jobs_of_a_killed_worker_as_failed() -> None:
+    jobs = [
+        ("var", None, None, None, None),
+        ("killed var", None, None, None, None),
+        ("other var", None, None, None, None),
+    ]
+
+    report = db_scheduler.run_jobs(
+        _add_var, jobs, lambda values: 1.0, memory_budget_mb=10.0, n_workers=1
+    )
+
+    assert dict(zip(report["var_name"], report["failed"])) == {
+        "var": False,
+        "killed var": True,
+        "other var": False,
+    }
+
+
+def test_input_data_errors_are_raised(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> None:
+    monkeypatch.setattr(dawc, "PROCESSED_DATA_PATH", str(tmp_path))
+
+    with pytest.raises(FileNotFoundError):
+        dawc.process_and_add_input_data(("var", None, "population", None, None))
@@ -0,0 +1,148 @@
+"""Tests of the load session."""
+from typing import Any
+
+import pytest
+
+from zoomin.database import db_session
+from zoomin.database.db_connection import get_load_session, with_db_connection
+from zoomin.database.db_session import LoadSession, load_phase, load_session
+
+
+class _Connection:
+    """Connection counting its commits and rollbacks."""
+
+    def __init__(self) -> None:
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.statements: list = []
+
+    def cursor(self) -> "_Cursor":
+        return _Cursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+
+
+class _Cursor:
+    def __init__(self, connection: _Connection) -> None:
+        self.connection = connection
+
+    def execute(self, sql: str) -> None:
+        self.connection.statements.append(sql)
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def connection(monkeypatch: pytest.MonkeyPatch) -> _Connection:
+    """The connection pinned by the load sessions, released to a list."""
+    connection = _Connection()
+    connection.released = []
+    monkeypatch.setattr(
+        db_session, "_get_connection", lambda pooled: (connection, None)
+    )
+    monkeypatch.setattr(
+        db_session,
+        "_release_connection",
+        lambda conn, connection_pool: connection.released.append(conn),
+    )
+    return connection
+
+
+@with_db_connection()
+def _execute(cursor: Any, sql: str) -> None:
+    cursor.execute(sql)
+
+
+def test_session_commits_once_on_success(connection: _Connection) -> None:
+    with load_session("test") as session:
+        assert get_load_session() is session
+        _execute("INSERT 1")
+        with load_session("inner") as inner_session:
+            assert inner_session is session
+            _execute("INSERT 2")
+
+    assert get_load_session() is None
+    assert connection.statements == ["INSERT 1", "INSERT 2"]
+    assert (connection.commits, connection.rollbacks) == (1, 0)
+    assert connection.released == [connection]
+
+
+def test_session_rolls_back_on_error(connection: _Connection) -> None:
+    cleanups: list = []
+
+    with pytest.raises(RuntimeError):
+        with load_session("test") as session:
+            session.add_cleanup(cleanups.append, "staging table")
+            _execute("INSERT 1")
+            raise RuntimeError("load failed")
+
+    assert get_load_session() is None
+    assert (connection.commits, connection.rollbacks) == (0, 1)
+    assert connection.released == [connection]
+    assert cleanups == ["staging table"]
+
+
+def test_failed_cleanups_are_logged(
+    connection: _Connection, caplog: pytest.LogCaptureFixture
+) -> None:
+    def fail() -> None:
+        raise OSError("no connection")
+
+    cleanups: list = []
+    with load_session("test") as session:
+        session.add_cleanup(fail)
+        session.add_cleanup(cleanups.append, "second")
+
+    assert cleanups == ["second"]
+    assert "cleanup of test failed: no connection" in caplog.text
+
+
+def test_phase_timings_exclude_nested_phases(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = iter([0.0, 1.0, 3.0, 7.0, 8.0, 9.0, 10.0, 10.0])
+    monkeypatch.setattr(db_session.time, "perf_counter", lambda: next(clock))
+    session = LoadSession("test", None)
+
+    with session.phase("region_data"):
+        with session.phase("lookups"):
+            pass
+    with session.phase("lookups"):
+        pass
+
+    assert session.get_timing_report() == {
+        "region_data": 3.0,
+        "lookups": 5.0,
+        "total": 10.0,
+    }
+
+
+def test_load_phase_outside_of_a_session_does_nothing() -> None:
+    with load_phase("lookups"):
+        assert get_load_session() is None
+
+
+@with_db_connection(in_session=False)
+def _count_rows(cursor: Any) -> int:
+    cursor.execute("SELECT COUNT(*) FROM test_session")
+    return int(cursor.fetchone()[0])
+
+
+def test_session_changes_are_seen_once_committed(db_cursor: Any) -> None:
+    db_cursor.execute("CREATE TABLE test_session (id integer)")
+
+    with load_session("test"):
+        _execute("INSERT INTO test_session VALUES (1)")
+        _execute("INSERT INTO test_session VALUES (2)")
+        assert _count_rows() == 0
+    assert _count_rows() == 2
+
+    with pytest.raises(RuntimeError):
+        with load_session("test"):
+            _execute("INSERT INTO test_session VALUES (3)")
+            raise RuntimeError("load failed")
+    assert _count_rows() == 2
@@ -0,0 +1,118 @@
+"""Tests of compiling and evaluating proxy expressions."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from zoomin.disaggregation import proxy_expression as pe
+
+
+@pytest.mark.parametrize(
+    "proxy, var_names",
+    [
+        ("population", ["population"]),
+        ("population+employment", ["population", "employment"]),
+        (
+            "employment in nace sector G-I + population",
+            ["employment in nace sector G-I", "population"],
+        ),
+        (
+            "0.7 * gross value added / (population + 1)",
+            ["gross value added", "population"],
+        ),
+        ("a - b - a", ["a", "b"]),
+    ],
+)
+def test_var_names(proxy: str, var_names: list) -> None:
+    assert pe.compile_proxy_expression(proxy).var_names == var_names
+
+
+@pytest.mark.parametrize(
+    "proxy, expected",
+    [
+        ("a + b * c", 2 + 3 * 4),
+        ("(a + b) * c", (2 + 3) * 4),
+        ("a - b - c", 2 - 3 - 4),
+        ("a / b / c", 2 / 3 / 4),
+        ("-a + 2 * -b", -2 + 2 * -3),
+        ("a-b", 10),
+        ("0.5 * c", 2),
+    ],
+)
+def test_evaluate(proxy: str, expected: float) -> None:
+    values = {"a": 2.0, "b": 3.0, "c": 4.0, "a-b": 10.0}
+
+    assert pe.compile_proxy_expression(proxy).evaluate(values) == pytest.approx(
+        expected
+    )
+
+
+@pytest.mark.parametrize("proxy", ["", "a +", "(a + b", "a + b)", "* a", "a ( b"])
+def test_invalid_expressions(proxy: str) -> None:
+    with pytest.raises(ValueError):
+        pe.compile_proxy_expression(proxy)
+
+
+@pytest.fixture
+def patch_db(monkeypatch: pytest.MonkeyPatch, regions: dict) -> dict:
+    """Serve the vars data from a dict instead of the DB."""
+    data = {}
+
+    def get_vars_data_for_disaggregation(var_names: list) -> pd.DataFrame:
+        return data["vars"][data["vars"]["var_name"].isin(var_names)]
+
+    monkeypatch.setattr(
+        pe, "get_vars_data_for_disaggregation", get_vars_data_for_disaggregation
+    )
+    monkeypatch.setattr(pe, "get_regions", lambda level, country: regions["LAU"])
+
+    return data
+
+
+def _get_vars_df(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        rows, columns=["region_id", "var_name", "year", "pathway_id", "value"]
+    )
+
+
+def test_proxy_data_combines_the_vars_per_region(patch_db: dict) -> None:
+    patch_db["vars"] = _get_vars_df(
+        [
+            (10, "a", 2020, None, 2.0),
+            (10, "b", 2020, None, 4.0),
+            (11, "a", 2020, None, 3.0),
+            (11, "b", 2020, None, 0.0),
+            # no value of b
+            (12, "a", 2020, None, 1.0),
+        ]
+    )
+
+    proxy_df, var_names = pe.get_proxy_data("a * b / b + a")
+
+    assert var_names == ["a", "b"]
+    assert list(proxy_df["region_id"]) == [10, 11]
+    # division by 0 is set to 0
+    np.testing.assert_allclose(proxy_df["value"], [4.0, 0.0])
+    assert list(proxy_df["region_code"]) == ["L1", "L2"]
+
+
+def test_proxy_data_uses_one_year_of_each_var(patch_db: dict) -> None:
+    patch_db["vars"] = _get_vars_df(
+        [
+            (10, "a", 2010, None, 100.0),
+            (10, "a", 2020, None, 2.0),
+            (10, "b", 2015, None, 3.0),
+            # pathway data is not used if there is observed data
+            (10, "b", 2050, 1, 1000.0),
+        ]
+    )
+
+    proxy_df, _ = pe.get_proxy_data("a * b")
+
+    np.testing.assert_allclose(proxy_df["value"], [6.0])
+
+
+def test_proxy_data_rejects_several_values_per_region(patch_db: dict) -> None:
+    patch_db["vars"] = _get_vars_df([(10, "a", 2050, 1, 1.0), (10, "a", 2050, 2, 2.0)])
+
+    with pytest.raises(ValueError, match="several values per region"):
+        pe.get_proxy_data("a")
@@ -0,0 +1,88 @@
+"""Tests of the integer index of the region hierarchy."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from zoomin.data import region_hierarchy as rh
+from zoomin.data.region_hierarchy import RegionHierarchy
+
+
+@pytest.fixture
+def hierarchy(regions: dict) -> RegionHierarchy:
+    """The test regions, with a LAU region without parent and a NUTS3 region of an unknown NUTS2 region."""
+    regions["NUTS3"] = pd.DataFrame(
+        {
+            "id": [4, 5, 6],
+            "region_code": ["DE111", "DE112", "FR101"],
+            "parent_region_code": ["DE11", "DE11", "FR10"],
+        }
+    )
+    regions["LAU"] = pd.DataFrame(
+        {
+            "id": [10, 11, 12, 13, 14],
+            "region_code": ["L1", "L2", "L3", "L4", "L5"],
+            "parent_region_code": ["DE111", "DE111", "DE112", "DE112", None],
+        }
+    )
+    return RegionHierarchy(regions)
+
+
+def test_ids_and_codes_per_level(hierarchy: RegionHierarchy) -> None:
+    assert list(hierarchy.codes("NUTS3")) == ["DE111", "DE112", "FR101"]
+    assert list(hierarchy.ids("LAU")) == [10, 11, 12, 13, 14]
+    assert list(hierarchy.index_of_codes("NUTS3", ["FR101", "XX999", "DE111"])) == [
+        2,
+        -1,
+        0,
+    ]
+    assert list(hierarchy.index_of_ids("LAU", [14, 99, 10])) == [4, -1, 0]
+
+
+def test_parents_of_regions_with_and_without_parent(
+    hierarchy: RegionHierarchy,
+) -> None:
+    assert list(hierarchy.parent_of("LAU", np.arange(5))) == [0, 0, 1, 1, -1]
+    assert list(hierarchy.parent_of("NUTS3", [0, 2, -1])) == [0, -1, -1]
+    assert list(hierarchy.parent_of("NUTS0", [0])) == [-1]
+
+    assert list(hierarchy.ancestor_at("LAU", [0, 3, 4], "NUTS0")) == [0, 0, -1]
+    assert list(hierarchy.ancestor_ids("LAU", [13, 14, 99], "NUTS3")) == [5, -1, -1]
+    assert list(hierarchy.ancestor_ids("NUTS3", [6], "NUTS0")) == [-1]
+
+
+def test_children_of_regions(hierarchy: RegionHierarchy) -> None:
+    position, child_idx = hierarchy.children_of("NUTS3", [1, 2, -1, 0])
+
+    # FR101 and the unknown region have no children, L5 has no parent
+    assert list(position) == [0, 0, 3, 3]
+    assert list(hierarchy.ids("LAU")[child_idx]) == [12, 13, 10, 11]
+
+    position, child_idx = hierarchy.children_of("NUTS0", [0], "LAU")
+    assert list(position) == [0, 0, 0, 0]
+    assert list(hierarchy.ids("LAU")[child_idx]) == [10, 11, 12, 13]
+
+
+def test_children_of_no_regions(hierarchy: RegionHierarchy) -> None:
+    position, child_idx = hierarchy.children_of("NUTS3", np.array([], dtype=int))
+
+    assert len(position) == len(child_idx) == 0
+
+
+def test_region_hierarchy_is_built_once(
+    monkeypatch: pytest.MonkeyPatch, regions: dict
+) -> None:
+    calls: list = []
+
+    def get_regions(level: str) -> pd.DataFrame:
+        calls.append(level)
+        return regions[level]
+
+    monkeypatch.setattr(rh, "get_regions", get_regions)
+    monkeypatch.setattr(rh, "_region_hierarchy", None)
+
+    hierarchy = rh.get_region_hierarchy()
+    assert rh.get_region_hierarchy() is hierarchy
+    assert calls == rh.LEVELS
+
+    assert rh.get_region_hierarchy(refresh=True) is not hierarchy
+    assert calls == rh.LEVELS * 2
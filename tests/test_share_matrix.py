@@ -0,0 +1,212 @@
+"""Tests of the share matrices and their cache."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from zoomin.data.region_hierarchy import RegionHierarchy
+from zoomin.disaggregation import share_matrix as sm
+from zoomin.disaggregation.disaggregation import disaggregate_value
+
+
+@pytest.fixture
+def proxy_data(regions: dict) -> pd.DataFrame:
+    """Proxy values of the LAU regions; 0 in all LAU regions of DE112."""
+    proxy_df = regions["LAU"].rename(columns={"id": "region_id"})
+    proxy_df["value"] = [1.0, 3.0, 0.0, 0.0]
+    return proxy_df
+
+
+@pytest.fixture(autouse=True)
+def patch_region_hierarchy(
+    monkeypatch: pytest.MonkeyPatch, region_hierarchy: RegionHierarchy
+) -> None:
+    """Use the region hierarchy of the test regions."""
+    monkeypatch.setattr(sm, "get_region_hierarchy", lambda: region_hierarchy)
+
+
+def test_shares_sum_to_one_per_parent(proxy_data: pd.DataFrame) -> None:
+    with pytest.warns(UserWarning):
+        share_matrix = sm.build_share_matrix(proxy_data, "NUTS3")
+
+    assert list(share_matrix.parent_codes) == ["DE111", "DE112"]
+    assert list(share_matrix.zero_parents) == [False, True]
+    np.testing.assert_allclose(share_matrix.matrix.sum(axis=0).A1, [1.0, 1.0])
+    np.testing.assert_allclose(
+        share_matrix.matrix.toarray(),
+        [[0.25, 0.0], [0.75, 0.0], [0.0, 0.5], [0.0, 0.5]],
+    )
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_disaggregate_frame_matches_disaggregate_value(
+    proxy_data: pd.DataFrame,
+) -> None:
+    share_matrix = sm.build_share_matrix(proxy_data, "NUTS3")
+    data_df = pd.DataFrame(
+        {
+            "reg_code": ["DE111", "DE112", "DE111"],
+            "value": [100.0, 10.0, 8.0],
+            "year": [2020, 2020, 2030],
+        }
+    )
+
+    disagg_df = share_matrix.disaggregate_frame(data_df, carry_cols=["year"])
+
+    assert len(disagg_df) == 6
+    for reg_code, value, year in data_df.itertuples(index=False):
+        parent_proxy_df = proxy_data[proxy_data["parent_region_code"] == reg_code]
+        expected_df = disaggregate_value(value, parent_proxy_df)
+
+        result_df = disagg_df[
+            (disagg_df["parent_region_code"] == reg_code) & (disagg_df["year"] == year)
+        ]
+        assert list(result_df["region_id"]) == list(expected_df["region_id"])
+        np.testing.assert_array_equal(result_df["value"], expected_df["value"])
+        assert result_df["value"].sum() == pytest.approx(value)
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_disaggregate_frame_matches_disaggregate_value_bitwise(
+    regions: dict, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # 3 LAU regions in DE112, as splitting equally in 2 is exact either way
+    regions["LAU"] = pd.DataFrame(
+        {
+            "id": [10, 11, 12, 13, 14],
+            "region_code": ["L1", "L2", "L3", "L4", "L5"],
+            "parent_region_code": ["DE111", "DE111", "DE112", "DE112", "DE112"],
+        }
+    )
+    monkeypatch.setattr(sm, "get_region_hierarchy", lambda: RegionHierarchy(regions))
+    rng = np.random.default_rng(0)
+    proxy_data = regions["LAU"].rename(columns={"id": "region_id"})
+    proxy_data["value"] = [rng.random(), rng.random() * 1e6, 0.0, 0.0, 0.0]
+    share_matrix = sm.build_share_matrix(proxy_data, "NUTS3")
+    years = np.arange(1000)
+    data_df = pd.DataFrame(
+        {
+            "reg_code": np.repeat(["DE111", "DE112"], len(years)),
+            "value": rng.random(2 * len(years)) * 10.0 ** rng.integers(-3, 9, 2000),
+            "year": np.tile(years, 2),
+        }
+    )
+
+    disagg_df = share_matrix.disaggregate_frame(data_df, carry_cols=["year"])
+
+    expected_df = pd.concat(
+        [
+            disaggregate_value(
+                value, proxy_data[proxy_data["parent_region_code"] == reg_code]
+            ).assign(year=year)
+            for reg_code, value, year in data_df.itertuples(index=False)
+        ]
+    )
+    result_df = disagg_df.merge(expected_df, on=["region_id", "year"])
+    assert len(result_df) == len(disagg_df) == 5 * len(years)
+    np.testing.assert_array_equal(result_df["value_x"], result_df["value_y"])
+
+
+def test_disaggregate_frame_skips_unknown_parents(proxy_data: pd.DataFrame) -> None:
+    with pytest.warns(UserWarning):
+        share_matrix = sm.build_share_matrix(proxy_data, "NUTS3")
+    data_df = pd.DataFrame({"reg_code": ["DE111", "XX999"], "value": [4.0, 1.0]})
+
+    disagg_df = share_matrix.disaggregate_frame(data_df)
+
+    assert list(disagg_df["region_id"]) == [10, 11]
+    np.testing.assert_allclose(disagg_df["value"], [1.0, 3.0])
+
+
+def test_subset_keeps_the_shares_of_the_parents(proxy_data: pd.DataFrame) -> None:
+    with pytest.warns(UserWarning):
+        share_matrix = sm.build_share_matrix(proxy_data, "NUTS3")
+
+    subset = share_matrix.subset(np.array(["DE112"]))
+
+    assert list(subset.region_ids) == [12, 13]
+    np.testing.assert_allclose(subset.disaggregate(np.array([6.0])), [3.0, 3.0])
+
+
+@pytest.fixture
+def cache(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: str, proxy_data: pd.DataFrame
+) -> sm.ShareMatrixCache:
+    """A share matrix cache in `tmp_path`, counting the version and proxy data reads."""
+    calls = {"version": 0, "proxy_data": 0}
+
+    def get_var_data_version(var_names: list) -> str:
+        calls["version"] += 1
+        return "v1"
+
+    def get_proxy_data(proxy: str, country: str) -> tuple:
+        calls["proxy_data"] += 1
+        return proxy_data, [proxy]
+
+    monkeypatch.setattr(sm, "get_var_data_version", get_var_data_version)
+    monkeypatch.setattr(sm, "get_proxy_data", get_proxy_data)
+
+    share_matrix_cache = sm.ShareMatrixCache(str(tmp_path))
+    share_matrix_cache.calls = calls
+    return share_matrix_cache
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_cache_checks_the_version_on_every_get(
+    cache: sm.ShareMatrixCache,
+) -> None:
+    first = cache.get("population", "NUTS3")
+    second = cache.get("population", "NUTS3")
+
+    assert second is first
+    assert cache.calls == {"version": 2, "proxy_data": 1}
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_cache_file_is_reloaded_without_rebuilding(
+    cache: sm.ShareMatrixCache, tmp_path: str
+) -> None:
+    built = cache.get("population", "NUTS3")
+
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+    assert len(os.listdir(tmp_path)) == 1
+
+    reloaded_cache = sm.ShareMatrixCache(str(tmp_path))
+    reloaded = reloaded_cache.get("population", "NUTS3")
+
+    assert cache.calls == {"version": 2, "proxy_data": 1}
+    assert reloaded.version == "v1"
+    assert (reloaded.matrix != built.matrix).nnz == 0
+    assert list(reloaded.region_codes) == list(built.region_codes)
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_cache_is_rebuilt_when_the_version_changes(
+    cache: sm.ShareMatrixCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache.get("population", "NUTS3")
+
+    # reloaded by another process right after
+    monkeypatch.setattr(sm, "get_var_data_version", lambda var_names: "v2")
+    rebuilt = cache.get("population", "NUTS3")
+
+    assert rebuilt.version == "v2"
+    assert cache.calls["proxy_data"] == 2
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_invalidate_removes_the_entries_of_a_var(
+    cache: sm.ShareMatrixCache, tmp_path: str
+) -> None:
+    cache.get("population", "NUTS3")
+    cache.get("population", "NUTS3", "DE")
+
+    cache.invalidate("employment")
+    assert len(os.listdir(tmp_path)) == 2
+
+    cache.invalidate("population")
+    assert os.listdir(tmp_path) == []
+
+    cache.get("population", "NUTS3")
+    assert cache.calls["proxy_data"] == 3
@@ -1,5 +1,22 @@
 """Module from Django app template."""
+from typing import Any
+
 from django.apps import AppConfig
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_migrate
+
+
+def partition_region_data_after_migrate(
+    sender: Any, using: str = DEFAULT_DB_ALIAS, **kwargs: Any
+) -> None:
+    """Partition region_data by var_detail_id once the migrations created it, see `db_partitioning.py`."""
+    # NOTE: imported here, as the models are not loaded yet when this module is imported
+    from zoomin.database.db_partitioning import (  # pylint: disable=import-outside-toplevel
+        partition_region_data_table,
+    )
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        partition_region_data_table(cursor)
 
 
 class V1ApiConfig(AppConfig):
@@ -7,3 +24,7 @@ class V1ApiConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "zoomin.api.v1_api"
+
+    def ready(self) -> None:
+        """Connect the signals of the app."""
+        post_migrate.connect(partition_region_data_after_migrate, sender=self)
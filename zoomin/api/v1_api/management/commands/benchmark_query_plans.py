@@ -0,0 +1,107 @@
+"""Management command to benchmark the query plans of the data views.
+
+Run before and after a change of the DB (for ex.: the indexes or the partitioning of region_data):
+`python manage.py benchmark_query_plans --label before` ... `python manage.py benchmark_query_plans --label after`
+"""
+import os
+import json
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from zoomin.api.v1_api import views
+
+QUERY_PLANS_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "..",
+    "..",
+    "..",
+    "data",
+    "output",
+    "query_plans",
+)
+
+
+def get_query_plan(view_class: Any, query_params: dict) -> dict:
+    """Return the executed query plan of the queryset of a view, for the given query parameters."""
+    view = view_class()
+    view.request = Request(APIRequestFactory().get("/", query_params))
+    view.format_kwarg = None
+
+    queryset = view.get_queryset()
+    query_plan: list = json.loads(
+        queryset.explain(format="json", analyze=True, buffers=True)
+    )
+
+    executed_plan: dict = query_plan[0]
+
+    return executed_plan
+
+
+class Command(BaseCommand):
+    """Benchmark the query plans of VariableDataViewSet and RegionDataViewSet."""
+
+    help = "Save the query plans of the data views under a label and compare them to the other saved labels."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        """Add the arguments."""
+        parser.add_argument("--label", required=True, help="for ex.: before, after")
+        parser.add_argument("--variable", default="population")
+        parser.add_argument("--resolution", default="LAU")
+        parser.add_argument("--country", default="DE")
+        parser.add_argument("--region", default="DE")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        """Save the query plans and print the planning and execution times of all labels."""
+        api_key = views.API_KEY
+        view_queries = {
+            "VariableDataViewSet": (
+                views.VariableDataViewSet,
+                {
+                    "api_key": api_key,
+                    "variable": options["variable"],
+                    "resolution": options["resolution"],
+                    "country": options["country"],
+                },
+            ),
+            "RegionDataViewSet": (
+                views.RegionDataViewSet,
+                {
+                    "api_key": api_key,
+                    "resolution": options["resolution"],
+                    "region": options["region"],
+                    "country": options["country"],
+                },
+            ),
+        }
+
+        query_plans = {
+            view_name: get_query_plan(view_class, query_params)
+            for view_name, (view_class, query_params) in view_queries.items()
+        }
+
+        os.makedirs(QUERY_PLANS_PATH, exist_ok=True)
+        with open(
+            os.path.join(QUERY_PLANS_PATH, f"{options['label']}.json"),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump(query_plans, f, indent=2)
+
+        for file_name in sorted(os.listdir(QUERY_PLANS_PATH)):
+            with open(
+                os.path.join(QUERY_PLANS_PATH, file_name), "r", encoding="utf-8"
+            ) as f:
+                label_query_plans = json.load(f)
+
+            for view_name, query_plan in label_query_plans.items():
+                self.stdout.write(
+                    f"{file_name[:-len('.json')]} - {view_name}: "
+                    f"planning {query_plan['Planning Time']} ms, "
+                    f"execution {query_plan['Execution Time']} ms, "
+                    f"top node {query_plan['Plan']['Node Type']}"
+                )
@@ -39,7 +39,17 @@ class Regions(models.Model):
         """Meta class."""
 
         managed = True
-        # indexes = [models.Index(fields=["id", "region_code"])]
+        indexes = [
+            models.Index(
+                fields=["resolution", "region_code"], name="regions_res_code_idx"
+            ),
+            # NOTE: pattern ops, as the views filter parent region codes with `startswith`
+            models.Index(
+                fields=["resolution", "parent_region_code"],
+                name="regions_res_parent_code_idx",
+                opclasses=["varchar_ops", "varchar_pattern_ops"],
+            ),
+        ]
         db_table = "regions"
 
 
@@ -58,7 +68,7 @@ class VarDetails(models.Model):
         """Meta class."""
 
         managed = True
-        # indexes = [models.Index(fields=["id"])]
+        indexes = [models.Index(fields=["var_name"], name="var_details_var_name_idx")]
         db_table = "var_details"
 
 
@@ -156,17 +166,24 @@ class RegionData(models.Model):
         """Meta class."""
 
         managed = True
-        # indexes = [
-        #     models.Index(
-        #         fields=[
-        #             "id",
-        #             "region",
-        #             "var_detail",
-        #             "pathway_id",
-        #             "year",
-        #         ]
-        #     )
-        # ]
+        # NOTE: the table is partitioned by var_detail_id after the migrations, with the
+        # primary key (id, var_detail_id), see `apps.py` and `db_partitioning.py`
+        indexes = [
+            # VariableDataViewSet
+            models.Index(
+                fields=["var_detail", "chosen", "region"],
+                name="region_data_var_chosen_idx",
+            ),
+            # RegionDataViewSet
+            models.Index(
+                fields=["region", "chosen"], name="region_data_region_chosen_idx"
+            ),
+            # pathway data
+            models.Index(
+                fields=["var_detail", "pathway", "year"],
+                name="region_data_var_path_year_idx",
+            ),
+        ]
         db_table = "region_data"
 
 
@@ -187,7 +204,11 @@ class ProxyMetrics(models.Model):
         """Meta class."""
 
         managed = True
-        # indexes = [models.Index(fields=["id"])]
+        indexes = [
+            models.Index(
+                fields=["var_detail", "region"], name="proxy_metrics_var_region_idx"
+            )
+        ]
         db_table = "proxy_metrics"
 
 
@@ -168,9 +168,9 @@ class RegionDataViewSet(generics.ListAPIView):
             ## region filter
             proxy_metric_prefetch = Prefetch(
                 "var_detail__proxy_metrics",
-                queryset=models.ProxyMetrics.objects.filter(
-                    region__region_code__startswith=query_country
-                ).filter(region__resolution="NUTS0"),
+                queryset=models.ProxyMetrics.objects.select_related("proxy_var_detail")
+                .filter(region__region_code__startswith=query_country)
+                .filter(region__resolution="NUTS0"),
             )
 
             region_filter = (
@@ -511,9 +511,9 @@ class VariableMetadataViewSet(generics.ListAPIView):
             # filter on data
             proxy_metric_prefetch = Prefetch(
                 "proxy_metrics",
-                queryset=models.ProxyMetrics.objects.filter(
-                    region__region_code__startswith=query_country
-                ).filter(region__resolution="NUTS0"),
+                queryset=models.ProxyMetrics.objects.select_related("proxy_var_detail")
+                .filter(region__region_code__startswith=query_country)
+                .filter(region__resolution="NUTS0"),
             )
 
             queryset = (
@@ -1,7 +1,7 @@
 """Data comparison, quality assessment, filling missing values is done here."""
 import os
 import itertools
-from typing import Optional, Union, Dict
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -11,23 +11,19 @@ from zoomin.database.db_access import (
     get_table,
     get_regions,
     get_col_values,
-    add_col_values,
+    add_col_values_per_row,
     add_to_input_var_values,
 )
 from zoomin.data.constants import resolution_hierarchy
+from zoomin.data.region_hierarchy import get_region_hierarchy
 from zoomin.disaggregation.disaggregation import disaggregate_value
 
 
-# get var qualities
-fk_good_quality = get_primary_key(
-    "input_var_qualities", cols_criteria={"var_quality_level": "good"}
-)
-fk_okay_quality = get_primary_key(
-    "input_var_qualities", cols_criteria={"var_quality_level": "okay"}
-)
-fk_bad_quality = get_primary_key(
-    "input_var_qualities", cols_criteria={"var_quality_level": "bad"}
-)
+def get_quality_fk(var_quality_level: str) -> int:
+    """Return the primary key of a var quality level (good, okay or bad)."""
+    return get_primary_key(
+        "input_var_qualities", cols_criteria={"var_quality_level": var_quality_level}
+    )
 
 
 def get_regions_df(resolution: str = "LAU") -> pd.DataFrame:
@@ -47,17 +43,14 @@ def get_regions_and_data(
     regions_df = get_regions_df(resolution)
 
     # get data
-    if len(regions_df) == 1:
-        sql_cmd = (
-            f"SELECT * FROM input_var_values WHERE region_id={regions_df.id.values[0]}"
-        )
-    else:
-        sql_cmd = f"SELECT * FROM input_var_values WHERE region_id IN {tuple(regions_df.id.values)}"
+    sql_cmd = "SELECT * FROM input_var_values WHERE region_id = ANY(%(region_ids)s)"
+    params = {"region_ids": regions_df.id.values.tolist()}
 
     if input_var_detail_id is not None:
-        sql_cmd = f"{sql_cmd} AND input_var_detail_id={input_var_detail_id}"
+        sql_cmd = f"{sql_cmd} AND input_var_detail_id=%(input_var_detail_id)s"
+        params["input_var_detail_id"] = int(input_var_detail_id)
 
-    data_df = get_table(sql_cmd=sql_cmd)
+    data_df = get_table(sql_cmd=sql_cmd, params=params)
 
     return (regions_df, data_df)
 
@@ -83,39 +76,30 @@ def get_proxy_data() -> pd.DataFrame:
 
 
 def map_region_data_to_lau(
-    regions_df: pd.DataFrame, var_df: pd.DataFrame, n_chars_to_del: int
+    regions_df: pd.DataFrame, var_df: pd.DataFrame, resolution: str
 ) -> pd.DataFrame:
     """Map region data to lau regions."""
-    lau_regions = get_regions_df()
+    hierarchy = get_region_hierarchy()
 
-    if n_chars_to_del != 0:
-        lau_regions["current_parent_region_code"] = lau_regions[
-            "parent_region_code"
-        ].str[:-n_chars_to_del]
-    else:
-        lau_regions["current_parent_region_code"] = lau_regions["parent_region_code"]
-
-    region_lau_mapping = pd.merge(
-        regions_df,
-        lau_regions,
-        left_on="region_code",
-        right_on="current_parent_region_code",
-        how="left",
+    region_pos, lau_idx = hierarchy.children_of(
+        resolution, hierarchy.index_of_ids(resolution, regions_df["id"].values), "LAU"
     )
-
-    def _f(data_df: pd.DataFrame) -> Dict[str, Union[pd.DataFrame, tuple]]:
-        return {
-            "region_id": data_df["id_x"].values[0],
-            "region_code": data_df["current_parent_region_code"].values[0],
-            "lau_region_ids": set(data_df["id_y"].values),
+    region_lau_mapping = pd.DataFrame(
+        {
+            "region_id": regions_df["id"].values[region_pos],
+            "lau_region_id": hierarchy.ids("LAU")[lau_idx],
         }
+    )
 
-    region_lau_mapping = region_lau_mapping.groupby("current_parent_region_code").apply(
-        _f
+    region_lau_mapping = (
+        region_lau_mapping.groupby("region_id", sort=False)["lau_region_id"]
+        .apply(set)
+        .reset_index(name="lau_region_ids")
     )
-    region_lau_mapping = pd.DataFrame(region_lau_mapping.values.tolist())
 
-    region_lau_mapping = pd.merge(region_lau_mapping, var_df, how="left")
+    region_lau_mapping = pd.merge(
+        region_lau_mapping, var_df, on="region_id", how="left"
+    )
 
     region_lau_mapping = region_lau_mapping[["lau_region_ids", "value"]]
 
@@ -136,13 +120,15 @@ def disaggregate_and_annotate_lau_data(
     )
     if var_name != "population":
         # annotate data; chosen=1 and quality=good
-        add_col_values(
+        add_col_values_per_row(
             table="input_var_values",
-            col_values={
-                "chosen": 1,
-                "input_var_quality_id": fk_good_quality,
-            },
-            cols_criteria={"id": tuple(var_df["id"].values)},
+            col_values_df=pd.DataFrame(
+                {
+                    "id": var_df["id"].values,
+                    "chosen": 1,
+                    "input_var_quality_id": get_quality_fk("good"),
+                }
+            ),
         )
 
         # if data is incomplete; fill missing values with 0; annotate chosen=1 and quality=bad
@@ -158,7 +144,7 @@ def disaggregate_and_annotate_lau_data(
                 "year": int(var_df["year"].values[0]),
                 "climate_model_detail_id": var_df["climate_model_detail_id"].values[0],
                 "chosen": 1,
-                "input_var_quality_id": fk_bad_quality,
+                "input_var_quality_id": get_quality_fk("bad"),
                 "value": 0,
             }
             for col, val in col_val_dict.items():
@@ -181,9 +167,8 @@ def disaggregate_and_annotate_nuts_data(
 
     if len(chosen_data) == 0:
         # collect current regions, list of corresponding lau regions and the var values for current regions in a df
-        n_chars_to_del = resolution_index - 1
         region_data_to_lau_df = map_region_data_to_lau(
-            regions_df, var_df, n_chars_to_del
+            regions_df, var_df, resolution_hierarchy[resolution_index]
         )
 
         # if data missing values;
@@ -197,11 +182,10 @@ def disaggregate_and_annotate_nuts_data(
                 ) = get_regions_and_data(resolution_hierarchy[j], input_var_detail_id)
 
                 if len(upper_lvl_var_df) != 0:
-                    n_chars_to_del = j - 1
                     upper_lvl_region_data_to_lau_df = map_region_data_to_lau(
                         upper_lvl_regions_df,
                         upper_lvl_var_df,
-                        n_chars_to_del,
+                        resolution_hierarchy[j],
                     )
 
                     for key_group in upper_lvl_region_data_to_lau_df.iterrows():
@@ -266,12 +250,12 @@ def disaggregate_and_annotate_nuts_data(
         # where values missing - annotate quality=bad fill with 0, rest annotate quality=okay
         db_ready_df.loc[
             db_ready_df["value"].isna(), "input_var_quality_id"
-        ] = fk_bad_quality
+        ] = get_quality_fk("bad")
         db_ready_df.loc[db_ready_df["value"].isna(), "value"] = 0
         db_ready_df.loc[
             db_ready_df["input_var_quality_id"].isna(),
             "input_var_quality_id",
-        ] = fk_okay_quality
+        ] = get_quality_fk("okay")
 
         db_ready_df = db_ready_df[["value", "region_id", "input_var_quality_id"]]
         db_ready_df["input_var_quality_id"] = db_ready_df[
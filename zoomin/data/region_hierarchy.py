@@ -0,0 +1,151 @@
+"""Integer index of the region hierarchy LAU -> NUTS3 -> NUTS2 -> NUTS1 -> NUTS0."""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from zoomin.data.constants import resolution_hierarchy
+from zoomin.database.db_access import get_regions
+
+LEVELS = resolution_hierarchy[:-1]  # without Europe
+
+
+class RegionHierarchy:
+    """Region hierarchy as compact integer arrays, one set per level.
+
+    Regions of a level are addressed by their position (idx) in the arrays of that
+    level. `parent_idx` of a level holds, for each region, the idx of its parent
+    region in the next upper level (-1 if unknown). All lookups are vectorized.
+    """
+
+    def __init__(self, regions: dict) -> None:
+        """Build the hierarchy from a dict of regions dataframes (id, region_code, parent_region_code) per level."""
+        self._ids: Dict[str, np.ndarray] = {}
+        self._codes: Dict[str, np.ndarray] = {}
+        self._id_index: dict = {}
+        self._code_index: dict = {}
+        self._parent_idx: Dict[str, np.ndarray] = {}
+        self._children: Dict[Tuple[str, str], tuple] = {}
+
+        for level in LEVELS:
+            regions_df = regions[level]
+            self._ids[level] = regions_df["id"].values.astype(np.int64)
+            self._codes[level] = np.asarray(regions_df["region_code"], dtype=str)
+            self._id_index[level] = pd.Index(self._ids[level])
+            self._code_index[level] = pd.Index(self._codes[level])
+
+        for level, upper_level in zip(LEVELS[:-1], LEVELS[1:]):
+            # LAU codes are not unique and refer to their NUTS3 region with the
+            # parent_region_code; NUTS codes are nested, i.e. the parent code is
+            # the region code without its last character
+            if level == "LAU":
+                parent_codes = regions[level]["parent_region_code"]
+            else:
+                parent_codes = pd.Series(self._codes[level]).str[:-1]
+
+            self._parent_idx[level] = (
+                self._code_index[upper_level].get_indexer(parent_codes).astype(np.int32)
+            )
+        self._parent_idx[LEVELS[-1]] = np.full(
+            len(self._ids[LEVELS[-1]]), -1, dtype=np.int32
+        )
+
+    def ids(self, level: str) -> np.ndarray:
+        """Return the region ids of a level."""
+        return self._ids[level]
+
+    def codes(self, level: str) -> np.ndarray:
+        """Return the region codes of a level."""
+        return self._codes[level]
+
+    def index_of_ids(self, level: str, region_ids: np.ndarray) -> np.ndarray:
+        """Return the idx of regions given by their ids (-1 if unknown)."""
+        return np.asarray(self._id_index[level].get_indexer(region_ids))
+
+    def index_of_codes(self, level: str, region_codes: np.ndarray) -> np.ndarray:
+        """Return the idx of regions given by their codes (-1 if unknown).
+
+        NOTE: LAU region codes are not unique across countries. Use `index_of_ids` for LAU regions.
+        """
+        return np.asarray(self._code_index[level].get_indexer(region_codes))
+
+    def parent_of(self, level: str, idx: np.ndarray) -> np.ndarray:
+        """Return the idx of the parent regions in the next upper level (-1 if unknown)."""
+        idx = np.asarray(idx)
+        return np.where(idx >= 0, self._parent_idx[level][idx], -1)
+
+    def ancestor_at(
+        self, level: str, idx: np.ndarray, ancestor_level: str
+    ) -> np.ndarray:
+        """Return the idx of the ancestor regions at `ancestor_level` (-1 if unknown)."""
+        ancestor_idx = np.asarray(idx)
+        for _level in LEVELS[LEVELS.index(level) : LEVELS.index(ancestor_level)]:
+            ancestor_idx = self.parent_of(_level, ancestor_idx)
+        return ancestor_idx
+
+    def ancestor_ids(
+        self, level: str, region_ids: np.ndarray, ancestor_level: str
+    ) -> np.ndarray:
+        """Return the ids of the ancestor regions at `ancestor_level` of regions given by their ids (-1 if unknown)."""
+        ancestor_idx = self.ancestor_at(
+            level, self.index_of_ids(level, region_ids), ancestor_level
+        )
+        return np.where(ancestor_idx >= 0, self._ids[ancestor_level][ancestor_idx], -1)
+
+    def _children_index(self, level: str, descendant_level: str) -> tuple:
+        """Return descendants at `descendant_level` sorted by their ancestor at `level` and the offsets per ancestor."""
+        key = (level, descendant_level)
+        if key not in self._children:
+            ancestor_idx = self.ancestor_at(
+                descendant_level,
+                np.arange(len(self._ids[descendant_level])),
+                level,
+            )
+            known = ancestor_idx >= 0
+            order = np.flatnonzero(known)[
+                np.argsort(ancestor_idx[known], kind="stable")
+            ]
+            counts = np.bincount(ancestor_idx[known], minlength=len(self._ids[level]))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._children[key] = (order, offsets)
+
+        return self._children[key]
+
+    def children_of(
+        self, level: str, idx: np.ndarray, descendant_level: Optional[str] = None
+    ) -> tuple:
+        """Return the descendants at `descendant_level` (default; the next lower level) of the given regions.
+
+        Returns a tuple of two aligned arrays; the position of the region in `idx`
+        and the idx of its descendant.
+        """
+        if descendant_level is None:
+            descendant_level = LEVELS[LEVELS.index(level) - 1]
+
+        idx = np.asarray(idx)
+        order, offsets = self._children_index(level, descendant_level)
+
+        known = idx >= 0
+        starts = np.where(known, offsets[np.where(known, idx, 0)], 0)
+        counts = np.where(known, offsets[np.where(known, idx, 0) + 1] - starts, 0)
+
+        position = np.repeat(np.arange(len(idx)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        descendant_idx = order[np.repeat(starts, counts) + within]
+
+        return position, descendant_idx
+
+
+_region_hierarchy: Optional[RegionHierarchy] = None
+
+
+def get_region_hierarchy(refresh: bool = False) -> RegionHierarchy:
+    """Return the region hierarchy, built once per process from the regions table."""
+    global _region_hierarchy  # pylint: disable=global-statement
+
+    if _region_hierarchy is None or refresh:
+        _region_hierarchy = RegionHierarchy(
+            {level: get_regions(level) for level in LEVELS}
+        )
+
+    return _region_hierarchy
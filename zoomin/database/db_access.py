@@ -2,17 +2,37 @@
 import logging
 
 import os
-from typing import Any, Iterable, Optional
+import uuid
+import threading
+from typing import Any, Iterable, Iterator, Optional
 import csv
 from io import StringIO
 
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import dask.dataframe as dd
 from sqlalchemy import create_engine
 
-from zoomin.database.db_connection import with_db_connection
+from zoomin.database.db_connection import (
+    with_db_connection,
+    borrow_db_connection,
+    get_load_session,
+)
+from zoomin.database.db_pgcopy import copy_to_table, copy_from_query, get_column_types
+from zoomin.database.db_query import (
+    check_identifier,
+    select_col_values,
+    update_col_values,
+    insert_row,
+)
+from zoomin.database.db_bulk_load import bulk_load, copy_csv, LOAD_MODE
+from zoomin.database.db_partitioning import add_var_partitions
+from zoomin.database.db_dtypes import REGION_DATA_DTYPES
+from zoomin.database.db_region_snapshot import get_region_snapshot
+from zoomin.database.db_dimension_cache import (
+    dimension_cache,
+    refresh_dimension_cache,
+)
 from zoomin.gen_utils import measure_time, measure_memory_leak
 
 db_access_log = logging.getLogger("db_access")
@@ -24,18 +44,67 @@ db_pwd = os.environ.get("DB_PASSWORD")
 db_host = os.environ.get("DB_HOST")
 db_port = os.environ.get("DB_PORT")
 
+# pool size of the SQLAlchemy engine of each process
+db_engine_pool_size = int(os.environ.get("DB_ENGINE_POOL_SIZE", 5))
+db_engine_max_overflow = int(os.environ.get("DB_ENGINE_MAX_OVERFLOW", 5))
+
+# format of the COPY used to add data; "csv" or "binary"
+COPY_FORMAT = os.environ.get("COPY_FORMAT", "csv")
+
+# backend of the readers; "sql" (pd.read_sql_query) or "copy" (binary COPY decoded into NumPy arrays)
+READ_BACKEND = os.environ.get("READ_BACKEND", "sql")
+
+# number of rows per chunk read with a server-side cursor
+STREAM_FETCH_SIZE = int(os.environ.get("STREAM_FETCH_SIZE", 100000))
+
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
 
 def get_db_uri() -> str:
     """Return db uri."""
     return f"postgresql://{db_user}:{db_pwd}@{db_host}:{db_port}/{db_name}"
 
 
-def get_db_engine() -> Any:
-    """Set up database connection engine."""
-    db_uri = get_db_uri()
-    engine = create_engine(db_uri, pool_pre_ping=True)
+def get_db_engine(db_uri: Optional[str] = None) -> Any:
+    """Return the database connection engine, created once per process and DB uri."""
+    if db_uri is None:
+        db_uri = get_db_uri()
+
+    with _engines_lock:
+        if db_uri not in _engines:
+            _engines[db_uri] = create_engine(
+                db_uri,
+                pool_pre_ping=True,
+                pool_size=db_engine_pool_size,
+                max_overflow=db_engine_max_overflow,
+            )
+
+    return _engines[db_uri]
 
-    return engine
+
+def dispose_db_engines() -> None:
+    """Close all pooled connections of the engines of the current process."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def _dispose_db_engines_after_fork() -> None:
+    """Forget the engines inherited from the parent process.
+
+    NOTE: the inherited connections are not closed, as they share their sockets
+    with the parent process. The child process creates its own engines.
+    """
+    global _engines_lock  # pylint: disable=global-statement
+    for engine in _engines.values():
+        engine.dispose(close=False)
+    _engines.clear()
+    _engines_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_dispose_db_engines_after_fork)
 
 
 # ===================================================================================================
@@ -44,51 +113,81 @@ def get_db_engine() -> Any:
 
 
 @with_db_connection()
-def get_col_values(
+def _get_col_values_from_db(
     cursor: Any, table: str, col: str, cols_criteria: Optional[dict] = None
-) -> Any:
-    """Return all `col` values or a subset corresponding to other column values in a table."""
-    sql_cmd = f"SELECT {col} FROM {table}"
-
-    if cols_criteria is not None:
-        where_clause = " AND ".join(
-            [
-                f"{key}='{val}'" if isinstance(val, str) else f"{key}={val}"
-                for (key, val) in cols_criteria.items()
-            ]
-        )
+) -> list:
+    """Return all `col` values or a subset corresponding to other column values in a table, from the DB."""
+    return select_col_values(cursor, table, col, cols_criteria)
 
-        sql_cmd = f"{sql_cmd} WHERE {where_clause}"
 
-    cursor.execute(sql_cmd)
+def get_col_values(table: str, col: str, cols_criteria: Optional[dict] = None) -> Any:
+    """Return all `col` values or a subset corresponding to other column values in a table.
 
-    result = cursor.fetchall()
+    Values of dimension tables are looked up in the dimension cache instead of the DB.
+    """
+    if table in dimension_cache:
+        result_list = dimension_cache.get_col_values(table, col, cols_criteria)
+    else:
+        result_list = _get_col_values_from_db(table, col, cols_criteria)
 
-    if result == []:
+    if result_list is None or result_list == []:
         raise ValueError("the value/values do not exist in the DB")
 
     # return a list of values if there is more than 1 unique
     # value, else just the unique value
-    result_list = [res[0] for res in result]
     if len(np.unique(result_list)) == 1:
         return result_list[0]
 
     return result_list
 
 
-@with_db_connection()
-def get_table(cursor: Any, sql_cmd: str) -> pd.DataFrame:
-    """Return a table as dataframe based on the sql_cmd."""
+def read_query(
+    cursor: Any,
+    sql_cmd: str,
+    params: Optional[Any] = None,
+    backend: str = READ_BACKEND,
+) -> pd.DataFrame:
+    """Return the result of a query as dataframe.
+
+    `backend` is either "sql" (pd.read_sql_query) or "copy" (binary COPY decoded
+    straight into NumPy arrays, without building a tuple per row; a CSV COPY parsed
+    by pandas for results with text columns). If the copy backend does not support
+    the data types of the result, "sql" is used instead.
+    """
+    if backend == "copy":
+        copy_sql_cmd = (
+            sql_cmd
+            if params is None
+            else cursor.mogrify(sql_cmd, params).decode("utf-8")
+        )
+        try:
+            return copy_from_query(cursor, copy_sql_cmd)
+        except ValueError as error:
+            db_access_log.debug(f"reading with pd.read_sql_query instead: {error}")
+
+    elif backend != "sql":
+        raise ValueError(f"unknown backend {backend}")
+
     engine = get_db_engine()
-    engine_conn = engine.connect()
+    with engine.connect() as engine_conn:
+        return pd.read_sql_query(sql_cmd, con=engine_conn, params=params)
+
 
-    table_df = pd.read_sql(sql=sql_cmd, con=engine_conn)
+@with_db_connection()
+def get_table(
+    cursor: Any,
+    sql_cmd: str,
+    params: Optional[Any] = None,
+    backend: str = READ_BACKEND,
+) -> pd.DataFrame:
+    """Return a table as dataframe based on the sql_cmd, with its placeholders bound to `params`."""
+    table_df = read_query(cursor, sql_cmd, params=params, backend=backend)
     # TODO: find out what is the diff between read_sql and read_sql_query. Can get_table() be used instead of get_region_data() and get_eucalc_pathway_data()???
 
     return table_df
 
 
-def get_primary_key(table: str, cols_criteria: dict) -> Any:
+def get_primary_key(table: str, cols_criteria: dict) -> int:
     """Return primary key/keys corresponding to other column values in a table."""
     col_vals = get_col_values(table, "id", cols_criteria)
 
@@ -97,41 +196,65 @@ def get_primary_key(table: str, cols_criteria: dict) -> Any:
     return col_vals
 
 
-@with_db_connection()
-def get_regions(
-    cursor: Any,
-    resolution: str,
-    country: Optional[str] = "all",
-) -> pd.DataFrame:
-    """Return dataframe of region codes and their primary keys corresponding to the specified resolution from the DB."""
-    # Construct sql command
-    sql_cmd = f"SELECT id, region_code, parent_region_code FROM regions WHERE resolution='{resolution}'"
+def _get_regions_where_clause(
+    resolution: str, country: Optional[str] = "all", alias: str = "regions"
+) -> tuple:
+    """Return the condition on the regions table (as `alias`) selecting the regions of a resolution and country, and its parameters."""
+    where_clause = f"{alias}.resolution=%(resolution)s"
+    params: dict = {"resolution": resolution}
 
     # subset on a country
     if country != "all":
         if resolution == "LAU":  # NOTE: LAU regions ids do not contain country codes
-            sql_cmd = f"{sql_cmd} AND parent_region_code LIKE '{country}%%'"
+            where_clause = (
+                f"{where_clause} AND {alias}.parent_region_code LIKE %(country)s"
+            )
         else:
-            sql_cmd = f"{sql_cmd} AND region_code LIKE '{country}%%'"
+            where_clause = f"{where_clause} AND {alias}.region_code LIKE %(country)s"
+        params["country"] = f"{country}%"
+
+    return where_clause, params
+
+
+def get_regions(
+    resolution: str,
+    country: Optional[str] = "all",
+    use_snapshot: bool = True,
+) -> pd.DataFrame:
+    """Return dataframe of region codes and their primary keys corresponding to the specified resolution from the DB.
+
+    If `use_snapshot`, the regions are filtered in memory from the memory-mapped
+    snapshot of the regions table instead of being queried from the DB.
+    """
+    if use_snapshot:
+        return get_region_snapshot().get_regions(resolution, country=country)
+
+    # Construct sql command
+    where_clause, params = _get_regions_where_clause(resolution, country)
+    sql_cmd = (
+        f"SELECT id, region_code, parent_region_code FROM regions WHERE {where_clause}"
+    )
 
     # get table
-    regions_df = get_table(sql_cmd=sql_cmd)
+    regions_df = get_table(sql_cmd=sql_cmd, params=params)
 
     return regions_df
 
 
 @with_db_connection()
 def get_var_data_for_disaggregation(
-    cursor: Any, var_name: str, country: Optional[str] = "all"
+    cursor: Any,
+    var_name: str,
+    country: Optional[str] = "all",
+    backend: str = READ_BACKEND,
 ) -> pd.DataFrame:
     """Return dataframe from region_data table."""
-    engine = get_db_engine()
-
     _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
-    data_df = pd.read_sql_query(
+    data_df = read_query(
+        cursor,
         f"SELECT region_id, value FROM region_data \
             WHERE var_detail_id={_fk_var_name}",
-        con=engine,
+        backend=backend,
     )
 
     regions_df = get_regions("LAU", country=country)
@@ -144,6 +267,95 @@ def get_var_data_for_disaggregation(
     return final_df
 
 
+@with_db_connection()
+def get_vars_data_for_disaggregation(cursor: Any, var_names: list) -> pd.DataFrame:
+    """Return dataframe of region_id, var_name, year, pathway_id and value of several vars from region_data table, in a single query."""
+    cursor.execute(
+        "SELECT id, var_name FROM var_details WHERE var_name = ANY(%s)",
+        (list(var_names),),
+    )
+    var_details = dict(cursor.fetchall())
+
+    missing_vars = set(var_names) - set(var_details.values())
+    if len(missing_vars) > 0:
+        raise ValueError(f"the vars {sorted(missing_vars)} do not exist in the DB")
+
+    engine = get_db_engine()
+    with engine.connect() as engine_conn:
+        data_df = pd.read_sql_query(
+            "SELECT region_id, var_detail_id, year, pathway_id, value FROM region_data \
+                WHERE var_detail_id = ANY(%(var_detail_ids)s)",
+            con=engine_conn,
+            params={"var_detail_ids": list(var_details.keys())},
+        )
+    data_df["var_name"] = data_df["var_detail_id"].map(var_details)
+    data_df.drop(columns=["var_detail_id"], inplace=True)
+
+    return data_df
+
+
+@with_db_connection()
+def get_var_data_version(cursor: Any, var_names: list) -> str:
+    """Return a version stamp of the data of the vars in region_data table.
+
+    The stamp changes whenever rows of any of the vars are added or deleted.
+    """
+    cursor.execute(
+        "SELECT vd.var_name, COUNT(rd.id), MAX(rd.id) FROM var_details vd \
+            LEFT JOIN region_data rd ON rd.var_detail_id=vd.id \
+            WHERE vd.var_name = ANY(%s) GROUP BY vd.var_name ORDER BY vd.var_name",
+        (list(var_names),),
+    )
+
+    return ";".join(
+        [
+            f"{var_name}:{n_rows}:{max_id}"
+            for var_name, n_rows, max_id in cursor.fetchall()
+        ]
+    )
+
+
+def iter_query_chunks(
+    sql_cmd: str,
+    params: Optional[tuple] = None,
+    dtypes: Optional[dict] = None,
+    fetch_size: int = STREAM_FETCH_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """Yield the result of a query as dataframes of up to `fetch_size` rows, read with a server-side cursor.
+
+    Only one chunk is held in memory at a time. The columns in `dtypes` are converted
+    to the given dtypes. An empty result yields one empty dataframe with the columns of
+    the query, so that the chunks can always be concatenated. The connection is held
+    until the iterator is exhausted or closed.
+    """
+    with borrow_db_connection() as connection:
+        with connection.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = fetch_size
+            cursor.execute(sql_cmd, params)
+
+            n_chunks = 0
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if len(rows) == 0 and n_chunks > 0:
+                    break
+
+                columns = [desc[0] for desc in cursor.description]
+                chunk_df = pd.DataFrame.from_records(rows, columns=columns)
+                if dtypes is not None:
+                    chunk_df = chunk_df.astype(
+                        {
+                            col: dtype
+                            for col, dtype in dtypes.items()
+                            if col in chunk_df.columns
+                        }
+                    )
+
+                yield chunk_df
+                n_chunks += 1
+                if len(rows) == 0:
+                    break
+
+
 @with_db_connection()
 def get_var_data_for_eucalc_post_calculation(
     cursor: Any, var_name: str
@@ -152,11 +364,12 @@ def get_var_data_for_eucalc_post_calculation(
     engine = get_db_engine()
 
     _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
-    data_df = pd.read_sql_query(
-        f"SELECT region_id, pathway_id, year, value FROM region_data \
-            WHERE var_detail_id={_fk_var_name}",
-        con=engine,
-    )
+    with engine.connect() as engine_conn:
+        data_df = pd.read_sql_query(
+            f"SELECT region_id, pathway_id, year, value FROM region_data \
+                WHERE var_detail_id={_fk_var_name}",
+            con=engine_conn,
+        )
 
     return data_df
 
@@ -167,65 +380,115 @@ def get_var_data_for_kpi_post_calculation(cursor: Any, var_name: str) -> pd.Data
     engine = get_db_engine()
 
     _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
-    data_df = pd.read_sql_query(
-        f"SELECT region_id, value, year, pathway_id FROM region_data \
-            WHERE var_detail_id={_fk_var_name}",
-        con=engine,
-    )
+    with engine.connect() as engine_conn:
+        data_df = pd.read_sql_query(
+            f"SELECT region_id, value, year, pathway_id FROM region_data \
+                WHERE var_detail_id={_fk_var_name}",
+            con=engine_conn,
+        )
 
     return data_df
 
 
+def iter_var_data_for_eucalc_post_calculation(
+    var_name: str, fetch_size: int = STREAM_FETCH_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Yield the data of `get_var_data_for_eucalc_post_calculation()` in chunks of up to `fetch_size` rows."""
+    _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
+
+    return iter_query_chunks(
+        "SELECT region_id, pathway_id, year, value FROM region_data WHERE var_detail_id=%s",
+        (_fk_var_name,),
+        dtypes=REGION_DATA_DTYPES,
+        fetch_size=fetch_size,
+    )
+
+
+def iter_var_data_for_kpi_post_calculation(
+    var_name: str, fetch_size: int = STREAM_FETCH_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Yield the data of `get_var_data_for_kpi_post_calculation()` in chunks of up to `fetch_size` rows."""
+    _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
+
+    return iter_query_chunks(
+        "SELECT region_id, value, year, pathway_id FROM region_data WHERE var_detail_id=%s",
+        (_fk_var_name,),
+        dtypes=REGION_DATA_DTYPES,
+        fetch_size=fetch_size,
+    )
+
+
 @with_db_connection()
 def get_region_data(  # TODO: rename this, check if its being used anywhere
-    cursor: Any, var_name: str, resolution: str, country: str
+    cursor: Any,
+    var_name: str,
+    resolution: str,
+    country: str,
+    backend: str = READ_BACKEND,
 ) -> pd.DataFrame:
     """Return dataframe from region_data table."""
-    engine = get_db_engine()
-
     _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
 
-    regions_df = get_regions(resolution, country=country)
-    _fk_region_ids = tuple(regions_df["id"].values)
-
-    data_df = pd.read_sql_query(
-        f"SELECT region_id, value FROM region_data \
-            WHERE var_detail_id={_fk_var_name} \
-            AND region_id IN {_fk_region_ids}",
-        con=engine,
+    # NOTE: the regions are joined instead of listing their ids in the query
+    where_clause, params = _get_regions_where_clause(resolution, country, alias="r")
+    params["var_detail_id"] = _fk_var_name
+
+    data_df = read_query(
+        cursor,
+        f"SELECT rd.region_id, rd.value FROM region_data rd \
+            JOIN regions r ON r.id=rd.region_id \
+            WHERE rd.var_detail_id=%(var_detail_id)s AND {where_clause}",
+        params=params,
+        backend=backend,
     )
 
     return data_df
 
 
-def get_proxy_vars(var_name: str, country: str) -> list:
-    """Return list of proxies corresponding to a variable and country."""
-    _fk_var_name = get_primary_key("var_details", {"var_name": var_name})
-    _fk_country_code = get_primary_key("regions", {"region_code": country})
+def _query_proxy_vars(
+    cursor: Any, var_names: list, countries: Optional[list] = None
+) -> dict:
+    """Return the proxies of `var_names` in `countries` (default: all countries) with one joined query."""
+    sql_cmd = "SELECT vd.var_name, r.region_code, pvd.var_name FROM proxy_metrics pm \
+        JOIN var_details vd ON vd.id=pm.var_detail_id \
+        JOIN regions r ON r.id=pm.region_id \
+        JOIN var_details pvd ON pvd.id=pm.proxy_var_detail_id \
+        WHERE r.resolution='NUTS0' AND vd.var_name = ANY(%s)"
+    params: list = [list(var_names)]
 
-    try:
-        proxy_vars_fk = get_col_values(
-            "proxy_metrics",
-            "proxy_var_detail_id",
-            {"var_detail_id": _fk_var_name, "region_id": _fk_country_code},
-        )
+    if countries is not None:
+        sql_cmd = f"{sql_cmd} AND r.region_code = ANY(%s)"
+        params.append(list(countries))
 
-        if isinstance(proxy_vars_fk, list):
-            proxy_var_list = []
-            for proxy_var_fk in proxy_vars_fk:
-                proxy_var = get_col_values(
-                    "var_details", "var_name", {"id": proxy_var_fk}
-                )
-                proxy_var_list.append(proxy_var)
+    cursor.execute(f"{sql_cmd} ORDER BY pm.id", params)
+
+    proxy_vars: dict = {}
+    for var_name, country, proxy_var in cursor.fetchall():
+        proxy_vars.setdefault((var_name, country), []).append(proxy_var)
+
+    return proxy_vars
+
+
+@with_db_connection()
+def resolve_proxy_vars(
+    cursor: Any, var_names: list, countries: Optional[list] = None
+) -> dict:
+    """Return a mapping of (var_name, country) to the list of proxies, for all `var_names` and `countries` at once.
+
+    Combinations without proxies are not in the mapping.
+    """
+    return _query_proxy_vars(cursor, var_names, countries)
 
-            return proxy_var_list
-        else:
-            proxy_var = get_col_values("var_details", "var_name", {"id": proxy_vars_fk})
-            return [proxy_var]
 
-    except ValueError:
+def get_proxy_vars(var_name: str, country: str) -> Optional[list]:
+    """Return list of proxies corresponding to a variable and country, None if there are none or they could not be read."""
+    proxy_vars: Optional[dict] = resolve_proxy_vars([var_name], [country])
+    if proxy_vars is None:
         return None
 
+    var_proxy_vars: Optional[list] = proxy_vars.get((var_name, country))
+    return var_proxy_vars
+
 
 @with_db_connection()
 def get_on_the_fly_calculation_vars(
@@ -234,11 +497,12 @@ def get_on_the_fly_calculation_vars(
     """Return dataframe from var_details table where vars have on_the_fly_calculation."""
     engine = get_db_engine()
 
-    data_df = pd.read_sql_query(
-        f"SELECT var_name, var_description, var_unit, on_the_fly_calculation FROM var_details \
-            WHERE on_the_fly_calculation IS NOT NULL",
-        con=engine,
-    )
+    with engine.connect() as engine_conn:
+        data_df = pd.read_sql_query(
+            f"SELECT var_name, var_description, var_unit, on_the_fly_calculation FROM var_details \
+                WHERE on_the_fly_calculation IS NOT NULL",
+            con=engine_conn,
+        )
 
     # TODO: add tags to data_df in the correct format
 
@@ -247,24 +511,44 @@ def get_on_the_fly_calculation_vars(
 
 @with_db_connection()
 def get_eucalc_pathway_data(
-    cursor: Any, _fk_pathway: Optional[int] = None
+    cursor: Any, _fk_pathway: Optional[int] = None, backend: str = READ_BACKEND
 ) -> pd.DataFrame:
     """Return dataframe of eucalc pathway data from region_data table."""
-    engine = get_db_engine()
     if _fk_pathway is None:
-        data_df = pd.read_sql_query(
+        data_df = read_query(
+            cursor,
             "SELECT var_detail_id, value, year, region_id FROM region_data",
-            con=engine,
+            backend=backend,
         )
     else:
-        data_df = pd.read_sql_query(
+        data_df = read_query(
+            cursor,
             f"SELECT var_detail_id, value, year, region_id FROM region_data WHERE pathway_id={_fk_pathway}",
-            con=engine,
+            backend=backend,
         )
 
     return data_df
 
 
+def iter_eucalc_pathway_data(
+    _fk_pathway: Optional[int] = None, fetch_size: int = STREAM_FETCH_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Yield the data of `get_eucalc_pathway_data()` in chunks of up to `fetch_size` rows."""
+    if _fk_pathway is None:
+        return iter_query_chunks(
+            "SELECT var_detail_id, value, year, region_id FROM region_data",
+            dtypes=REGION_DATA_DTYPES,
+            fetch_size=fetch_size,
+        )
+
+    return iter_query_chunks(
+        "SELECT var_detail_id, value, year, region_id FROM region_data WHERE pathway_id=%s",
+        (_fk_pathway,),
+        dtypes=REGION_DATA_DTYPES,
+        fetch_size=fetch_size,
+    )
+
+
 # ===================================================================================================
 # POST functions
 # ===================================================================================================
@@ -303,6 +587,17 @@ def _psql_insert_copy(table: Any, conn: Any, keys: list, data_iter: Iterable) ->
         cur.copy_expert(sql=sql, file=s_buf)
 
 
+@with_db_connection()
+def _copy_to_table(
+    cursor: Any, table: str, data_df: pd.DataFrame, copy_format: str = "binary"
+) -> None:
+    """Add the data to a table with a binary or CSV COPY."""
+    if copy_format == "binary":
+        copy_to_table(cursor, table, data_df)
+    else:
+        copy_csv(cursor, table, data_df)
+
+
 @with_db_connection()
 def add_col_values(
     cursor: Any,
@@ -311,25 +606,62 @@ def add_col_values(
     cols_criteria: Optional[dict] = None,
 ) -> None:
     """Post `col_values` corresponding to other column values in a table."""
-    values = ", ".join(
-        [
-            f"{key}='{val}'" if isinstance(val, str) else f"{key}={val}"
-            for key, val in col_values.items()
-        ]
+    update_col_values(cursor, table, col_values, cols_criteria)
+    refresh_dimension_cache(table)
+
+
+@with_db_connection()
+def add_col_values_per_row(
+    cursor: Any,
+    table: str,
+    col_values_df: pd.DataFrame,
+    key_col: str = "id",
+    copy_format: str = COPY_FORMAT,
+) -> int:
+    """Post different column values per row in a table, for ex.: quality ratings and chosen flags of many rows at once.
+
+    `col_values_df` holds the `key_col` of each row and its new values. It is COPYed to a
+    temporary table and all rows are set with one `UPDATE ... FROM`, instead of listing
+    their keys in the query. Keys without a row are ignored. Returns the number of updated rows.
+    """
+    if key_col not in col_values_df.columns:
+        raise ValueError(f"the key column {key_col} is missing")
+
+    # NOTE: UPDATE ... FROM would set a row to the values of any one of its duplicates
+    if col_values_df[key_col].duplicated().any():
+        raise ValueError(f"the key column {key_col} has duplicate values")
+
+    if copy_format not in ("csv", "binary"):
+        raise ValueError(f"unknown copy_format {copy_format}")
+
+    cols = [check_identifier(col) for col in col_values_df.columns]
+    value_cols = [col for col in cols if col != key_col]
+    tmp_table = f"{check_identifier(table)}_new_col_values"
+
+    cursor.execute(
+        f"CREATE TEMP TABLE {tmp_table} ON COMMIT DROP AS SELECT {', '.join(cols)} FROM {table} WITH NO DATA"
     )
-    sql_cmd = f"UPDATE {table} SET {values}"
-
-    if cols_criteria is not None:
-        where_clause = " AND ".join(
-            [
-                f"{key} IN {val}" if len(val) > 1 else f"{key}={val[0]}"
-                for key, val in cols_criteria.items()
-            ]
+    if copy_format == "binary":
+        copy_to_table(
+            cursor,
+            tmp_table,
+            col_values_df,
+            column_types=get_column_types(cursor, table),
         )
+    else:
+        copy_csv(cursor, tmp_table, col_values_df)
+    cursor.execute(f"ANALYZE {tmp_table}")
 
-        sql_cmd = f"{sql_cmd} WHERE {where_clause}"
+    set_clause = ", ".join([f"{col}=tmp.{col}" for col in value_cols])
+    cursor.execute(
+        f"UPDATE {table} t SET {set_clause} FROM {tmp_table} tmp WHERE t.{key_col}=tmp.{key_col}"
+    )
+    n_rows = int(cursor.rowcount)
+    # the temp table is only dropped on commit, i.e. at the end of a load session
+    cursor.execute(f"DROP TABLE {tmp_table}")
+    refresh_dimension_cache(table)
 
-    cursor.execute(sql_cmd)
+    return n_rows
 
 
 @with_db_connection()
@@ -340,15 +672,21 @@ def add_to_citations(
     source_citation: str,
 ) -> None:
     """Add citation to DB if not already present."""
-    cursor.execute(
-        f"SELECT id FROM citations WHERE data_source_citation='{source_citation}'"
+    citation_ids = select_col_values(
+        cursor, "citations", "id", {"data_source_citation": source_citation}
     )
 
-    if cursor.fetchone() is None:
-        cursor.execute(
-            f"INSERT INTO citations (data_source_name, data_source_link, data_source_citation) \
-                        VALUES ('{source_name}', '{source_link}', '{source_citation}')"
+    if len(citation_ids) == 0:
+        insert_row(
+            cursor,
+            "citations",
+            {
+                "data_source_name": source_name,
+                "data_source_link": source_link,
+                "data_source_citation": source_citation,
+            },
         )
+        refresh_dimension_cache("citations")
     else:
         db_access_log.info("citation already in DB!")
 
@@ -356,74 +694,99 @@ def add_to_citations(
 @measure_time
 @measure_memory_leak
 @with_db_connection()
-def add_to_proxy_metrics(cursor: Any, var_detail_id: int, proxy_vars: list) -> None:
-    """Add proxy metrics of data."""
-    cursor.execute(f"SELECT id FROM proxy_metrics WHERE var_detail_id={var_detail_id}")
-
-    if cursor.fetchone() is None:
-        regions_df = get_regions("NUTS0")
-        _fk_var_df = pd.DataFrame(
-            regions_df["id"].values, columns=["region_id"]
-        )  # INFO: proxy data added for each country. currently assuming same proxy in all countries. this will change in the futute
-        _fk_var_df["var_detail_id"] = var_detail_id
-
-        # get var_detail_ids
-        _fk_var_detail_list = []
-        for var_name in proxy_vars:
-            _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
-            _fk_var_detail_list.append(_fk_var_detail)
-
-        final_df_list = []
-        for _fk_var_detail in _fk_var_detail_list:
-            _df = _fk_var_df.copy(deep=True)
-            _df["proxy_var_detail_id"] = _fk_var_detail
-            final_df_list.append(_df)
-
-        final_df = pd.concat(final_df_list)
+def add_to_proxy_metrics(
+    cursor: Any,
+    var_detail_id: int,
+    proxy_vars: list,
+    copy_format: str = COPY_FORMAT,
+    countries: Optional[list] = None,
+) -> None:
+    """Add proxy metrics of data, for the NUTS0 regions in `countries` (default: all countries).
 
-        engine = get_db_engine()
+    `copy_format` is either "csv" or "binary" (binary COPY encoded straight from the columns).
+    """
+    var_name = get_col_values("var_details", "var_name", {"id": var_detail_id})
+    existing_proxy_vars = _query_proxy_vars(cursor, [var_name], countries)
+
+    # INFO: proxy data added for each country. currently assuming same proxy in all countries. this will change in the futute
+    regions_df = get_regions("NUTS0")
+    if countries is not None:
+        regions_df = regions_df[regions_df["region_code"].isin(countries)]
+
+    # get var_detail_ids
+    _fk_var_details = {
+        proxy_var: get_primary_key("var_details", {"var_name": proxy_var})
+        for proxy_var in proxy_vars
+    }
+
+    # only the proxies not in the DB yet
+    final_df = pd.DataFrame(
+        [
+            (region_id, var_detail_id, _fk_var_details[proxy_var])
+            for region_id, region_code in zip(
+                regions_df["id"].values, regions_df["region_code"].values
+            )
+            for proxy_var in proxy_vars
+            if proxy_var not in existing_proxy_vars.get((var_name, region_code), [])
+        ],
+        columns=["region_id", "var_detail_id", "proxy_var_detail_id"],
+    )
 
-        if len(final_df) > 10000:
-            db_uri = get_db_uri()
+    if len(final_df) == 0:
+        db_access_log.info("proxy metrics already in DB!")
+        return
 
-            ddf = dd.from_pandas(final_df, npartitions=100)
+    if copy_format not in ("csv", "binary"):
+        raise ValueError(f"unknown copy_format {copy_format}")
 
-            ddf.to_sql(
-                name="proxy_metrics",
-                uri=db_uri,
-                index=False,
-                if_exists="append",
-                parallel=True,
-            )
+    if len(final_df) > 10000:
+        bulk_load("proxy_metrics", final_df, copy_format=copy_format, mode="append")
 
-        # for smaller datasets make a normal entry
-        else:
-            engine = get_db_engine()
-            final_df.to_sql(
-                "proxy_metrics",
-                engine,
-                index=False,
-                if_exists="append",
-                method=_psql_insert_copy,
-            )
+    elif copy_format == "binary":
+        copy_to_table(cursor, "proxy_metrics", final_df)
+
+    # NOTE: the engine would add the rows on another connection than the one of the load session
+    elif get_load_session() is not None:
+        copy_csv(cursor, "proxy_metrics", final_df)
+
+    # for smaller datasets make a normal entry
+    else:
+        engine = get_db_engine()
+        final_df.to_sql(
+            "proxy_metrics",
+            engine,
+            index=False,
+            if_exists="append",
+            method=_psql_insert_copy,
+        )
 
 
 @measure_time
 @measure_memory_leak
-def add_to_region_data(db_ready_df: pd.DataFrame) -> None:
-    """Add the data to region_data table."""
-    if len(db_ready_df) > 10000:
-        db_uri = get_db_uri()
+def add_to_region_data(
+    db_ready_df: pd.DataFrame,
+    copy_format: str = COPY_FORMAT,
+    load_mode: str = LOAD_MODE,
+) -> None:
+    """Add the data to region_data table.
 
-        ddf = dd.from_pandas(db_ready_df, npartitions=100)
+    `copy_format` is either "csv" or "binary" (binary COPY encoded straight from the columns).
+    `load_mode` is either "append" or "upsert" (replacing rows of the same region, var_detail,
+    year, pathway and climate_experiment, so that re-running a variable does not duplicate it).
+    """
+    if copy_format not in ("csv", "binary"):
+        raise ValueError(f"unknown copy_format {copy_format}")
 
-        ddf.to_sql(
-            name="region_data",
-            uri=db_uri,
-            index=False,
-            if_exists="append",
-            parallel=True,
-        )
+    # each var gets its own partition, if region_data is partitioned
+    add_var_partitions(db_ready_df["var_detail_id"].unique())
+
+    # for larger datasets COPY partitions in parallel, adding either all rows or none
+    if len(db_ready_df) > 10000 or load_mode == "upsert":
+        bulk_load("region_data", db_ready_df, copy_format=copy_format, mode=load_mode)
+
+    # NOTE: the engine would add the rows on another connection than the one of the load session
+    elif copy_format == "binary" or get_load_session() is not None:
+        _copy_to_table("region_data", db_ready_df, copy_format)
 
     # for smaller datasets make a normal entry
     else:
@@ -443,15 +806,24 @@ def add_to_pathways(
 ) -> None:
     """Add pathway to the database if not already present."""
 
-    cursor.execute(
-        f"SELECT id FROM pathways WHERE pathway_main='{pathway_main}' AND pathway_variant='{pathway_variant}'"
+    pathway_ids = select_col_values(
+        cursor,
+        "pathways",
+        "id",
+        {"pathway_main": pathway_main, "pathway_variant": pathway_variant},
     )
 
-    if cursor.fetchone() is None:
-        cursor.execute(
-            f"INSERT INTO pathways (pathway_main, pathway_reference, pathway_variant) \
-                VALUES ('{pathway_main}', '{pathway_reference}', '{pathway_variant}')"
+    if len(pathway_ids) == 0:
+        insert_row(
+            cursor,
+            "pathways",
+            {
+                "pathway_main": pathway_main,
+                "pathway_reference": pathway_reference,
+                "pathway_variant": pathway_variant,
+            },
         )
+        refresh_dimension_cache("pathways")
 
     else:
         print("pathway already in DB!")
@@ -1,26 +1,36 @@
 """Functions to help disaggregate values to LAU and populate DB with data."""
 import os
 import json
-import traceback
-import psutil
-import time
 import logging
 import warnings
+from typing import Any, Optional
 
 import pandas as pd
 
-from zoomin.data.constants import del_dict
+from zoomin.data.region_hierarchy import get_region_hierarchy
 
 from zoomin.database.db_access import (
     get_regions,
     get_primary_key,
     add_to_region_data,
-    get_table,
     get_col_values,
     add_to_proxy_metrics,
-    get_var_data_for_disaggregation,
 )
-from zoomin.disaggregation.disaggregation import disaggregate_value, add_proxy_vars
+from zoomin.database.db_dimension_cache import dimension_cache
+from zoomin.database.db_partitioning import add_var_partitions
+from zoomin.database.db_session import load_session, load_phase
+from zoomin.database.db_dtypes import (
+    get_memory_usage,
+    log_memory_report,
+    optimize_dtypes,
+    with_constant_cols,
+)
+from zoomin.disaggregation.share_matrix import (
+    get_proxy_var_names,
+    get_share_matrix,
+    invalidate_share_matrices,
+    iter_disaggregated_chunks,
+)
 
 db_access_with_calculations_log = logging.getLogger("db_access_with_calculations")
 logging.basicConfig(level=logging.INFO)
@@ -35,7 +45,42 @@ PROCESSED_DATA_PATH = os.path.join(
 LOG_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "output", "logs")
 
 
-def aggregate_and_add_to_db(db_ready_df, var_name):
+def _rollup_to_parent(
+    level_df: pd.DataFrame,
+    resolution: str,
+    parent_resolution: str,
+    key_vars: list,
+    agg_dict: dict,
+) -> pd.DataFrame:
+    """Aggregate the rows of regions at `resolution` to their parent regions."""
+    hierarchy = get_region_hierarchy()
+
+    level_df = level_df.copy()
+    level_df["region_id"] = hierarchy.ancestor_ids(
+        resolution, level_df["region_id"].values, parent_resolution
+    )
+    level_df = level_df[level_df["region_id"] >= 0]
+
+    return (
+        level_df.groupby(
+            ["region_id"] + key_vars, dropna=False, sort=False, observed=True
+        )
+        .agg(**agg_dict)
+        .reset_index()
+    )
+
+
+def aggregate_and_add_to_db(
+    db_ready_df: pd.DataFrame, var_name: str, constant_cols: Optional[dict] = None
+) -> None:
+    """Aggregate LAU data to all upper levels and add it to the DB.
+
+    `constant_cols` are the columns with the same value in all rows. They are not
+    carried through the aggregation, but attached to the aggregated data before writing.
+    """
+    if constant_cols is None:
+        constant_cols = {}
+
     db_access_with_calculations_log.info(
         f"aggregating {var_name} data to higher levels ---------"
     )
@@ -43,84 +88,109 @@ def aggregate_and_add_to_db(db_ready_df, var_name):
         "var_details", "var_aggregation_method", {"var_name": var_name}
     )
 
-    def _perform_aggregation(data_group):
-        # aggregate the value
-        if agg_method == "sum":
-            agg_val = data_group["value"].sum()
-        elif agg_method == "mean":
-            agg_val = data_group["value"].mean()
-        elif agg_method == "bool":
-            agg_val = data_group["value"].unique().item()
-
-        data_dict = {
-            "value": agg_val,
-            "var_detail_id": data_group["var_detail_id"].unique().item(),
-            "citation_id": data_group["citation_id"].unique().item(),
-            "original_resolution_id": data_group["original_resolution_id"]
-            .unique()
-            .item(),
-            "chosen": data_group["chosen"].unique().item(),
-            "parent_region_code": data_group["parent_region_code"].unique().item(),
-        }
-
-        # get the most repeated quality_rating
-        if "quality_rating" in data_group.columns:
-            agg_quality_rating = data_group["quality_rating"].value_counts().idxmax()
-            data_dict.update({"quality_rating": agg_quality_rating})
-
+    key_vars = [
+        var
+        for var in ["climate_experiment_id", "year", "pathway_id"]
+        if var in db_ready_df.columns
+    ]
+    # same value in all LAU regions of a parent region
+    const_vars = [
+        var
         for var in [
-            "year",
-            "climate_experiment_id",
+            "var_detail_id",
+            "citation_id",
+            "original_resolution_id",
+            "chosen",
             "disaggregation_method_id",
-            "pathway_id",
             "confidence_interval",
-        ]:
-            if var in data_group.columns:
-                data_dict.update({var: data_group[var].unique().item()})
-
-        return pd.Series(data_dict)
-
-    for resolution in ["NUTS0", "NUTS1", "NUTS2", "NUTS3"]:
+        ]
+        if var in db_ready_df.columns and var not in constant_cols
+    ]
+
+    # value statistics that can be aggregated further from one level to the next
+    lau_df = db_ready_df[["region_id"] + key_vars + const_vars].copy()
+    # NOTE: values are aggregated as float64, even if they are held as float32
+    if agg_method == "sum":
+        lau_df["value"] = db_ready_df["value"].values.astype(float)
+        value_aggs = {"value": ("value", "sum")}
+    elif agg_method == "mean":
+        lau_df["value_sum"] = db_ready_df["value"].values.astype(float)
+        lau_df["value_count"] = db_ready_df["value"].notna().values.astype(int)
+        value_aggs = {
+            "value_sum": ("value_sum", "sum"),
+            "value_count": ("value_count", "sum"),
+        }
+    elif agg_method == "bool":
+        lau_df["value"] = db_ready_df["value"].values
+        value_aggs = {"value": ("value", "first")}
+    else:
+        raise ValueError(f"unknown aggregation method {agg_method}")
 
-        agg_df = db_ready_df.copy(deep=True)
+    agg_dict = {**value_aggs, **{var: (var, "first") for var in const_vars}}
 
-        if resolution != "NUTS3":
-            n_del = del_dict[resolution]
-            agg_df["parent_region_code"] = agg_df["parent_region_code"].str[:-n_del]
+    # count the quality_ratings, to get the most repeated one in each region
+    has_quality_rating = "quality_rating" in db_ready_df.columns
+    if has_quality_rating:
+        level_quality_df = db_ready_df[
+            ["region_id"] + key_vars + ["quality_rating"]
+        ].dropna(subset=["quality_rating"])
+        level_quality_df["n_ratings"] = 1
+        quality_agg_dict = {"n_ratings": ("n_ratings", "sum")}
 
-        group_vars = list(
-            set(agg_df.columns)
-            & {"parent_region_code", "climate_experiment_id", "year"}
+    nuts3_region_ids = get_region_hierarchy().ancestor_ids(
+        "LAU", db_ready_df["region_id"].values, "NUTS3"
+    )
+    if (nuts3_region_ids < 0).any():
+        db_access_with_calculations_log.warning(
+            f"{var_name} has LAU regions without a NUTS3 region. These are not aggregated"
         )
 
-        agg_df = agg_df.groupby(group_vars, dropna=False).apply(_perform_aggregation)
-        agg_df.reset_index(drop=True, inplace=True)
-
-        regions_df = get_regions(resolution)
-
-        agg_df = pd.merge(
-            agg_df,
-            regions_df,
-            left_on=["parent_region_code"],
-            right_on=["region_code"],
-            how="left",
+    level_df = lau_df
+    agg_df_list = []
+    for resolution, parent_resolution in zip(
+        ["LAU", "NUTS3", "NUTS2", "NUTS1"], ["NUTS3", "NUTS2", "NUTS1", "NUTS0"]
+    ):
+        # each level is aggregated from the previous one, not from LAU
+        level_df = _rollup_to_parent(
+            level_df, resolution, parent_resolution, key_vars, agg_dict
         )
+        agg_df = level_df.copy()
+
+        if agg_method == "mean":
+            agg_df["value"] = agg_df["value_sum"] / agg_df["value_count"]
+            agg_df.drop(columns=["value_sum", "value_count"], inplace=True)
+
+        if has_quality_rating:
+            level_quality_df = _rollup_to_parent(
+                level_quality_df,
+                resolution,
+                parent_resolution,
+                key_vars + ["quality_rating"],
+                quality_agg_dict,
+            )
+            mode_df = level_quality_df.sort_values(
+                "n_ratings", ascending=False, kind="mergesort"
+            ).drop_duplicates(["region_id"] + key_vars)
+            agg_df = pd.merge(
+                agg_df,
+                mode_df.drop(columns=["n_ratings"]),
+                on=["region_id"] + key_vars,
+                how="left",
+            )
 
-        agg_df.rename(columns={"id": "region_id"}, inplace=True)
-        agg_df.drop(
-            columns=[
-                "parent_region_code_x",
-                "parent_region_code_y",
-                "region_code",
-            ],
-            inplace=True,
-        )
+        agg_df_list.append(agg_df)
 
-        add_to_region_data(agg_df)
+    with load_phase("region_data"):
+        add_to_region_data(
+            with_constant_cols(pd.concat(agg_df_list, ignore_index=True), constant_cols)
+        )
 
 
-def process_and_add_lau_data(data_df, var_name, details_dict):
-    regions_df = get_regions("LAU")
+def process_and_add_lau_data(
+    data_df: pd.DataFrame, var_name: str, details_dict: dict
+) -> None:
+    with load_phase("lookups"):
+        regions_df = get_regions("LAU")
 
     db_ready_df = pd.merge(
         data_df,
@@ -132,21 +202,22 @@ def process_and_add_lau_data(data_df, var_name, details_dict):
 
     db_ready_df.rename(columns={"id": "region_id"}, inplace=True)
 
-    _fk_citation = get_primary_key(
-        "citations", {"data_source_citation": details_dict["citation"]}
-    )
-    db_ready_df["citation_id"] = _fk_citation
-
-    _fk_org_res = get_primary_key(
-        "original_resolutions", {"original_resolution": details_dict["resolution"]}
-    )
-    db_ready_df["original_resolution_id"] = _fk_org_res
-
-    _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
-    db_ready_df["var_detail_id"] = _fk_var_detail
+    # same in all rows; attached only when writing to the DB
+    with load_phase("lookups"):
+        constant_cols = {
+            "citation_id": get_primary_key(
+                "citations", {"data_source_citation": details_dict["citation"]}
+            ),
+            "original_resolution_id": get_primary_key(
+                "original_resolutions",
+                {"original_resolution": details_dict["resolution"]},
+            ),
+            "var_detail_id": get_primary_key("var_details", {"var_name": var_name}),
+            "chosen": 1,
+        }
 
     if "climate_experiment" in db_ready_df.columns:
-        clt_expt_df = get_table(sql_cmd="SELECT * FROM climate_experiments")
+        clt_expt_df = dimension_cache.get_table("climate_experiments")
         clt_expt_df.rename(columns={"id": "climate_experiment_id"}, inplace=True)
 
         db_ready_df = pd.merge(
@@ -156,9 +227,8 @@ def process_and_add_lau_data(data_df, var_name, details_dict):
             right_on="climate_experiment",
             how="left",
         )
-        db_ready_df.drop(["climate_experiment"], inplace=True)
+        db_ready_df.drop(columns=["climate_experiment"], inplace=True)
 
-    db_ready_df["chosen"] = 1
     db_access_with_calculations_log.info(f"{var_name} has {len(db_ready_df)} rows")
 
     db_ready_df.drop(
@@ -169,6 +239,7 @@ def process_and_add_lau_data(data_df, var_name, details_dict):
         ],
         inplace=True,
     )
+    db_ready_df = optimize_dtypes(db_ready_df, var_name=var_name)
 
     # dump LAU region data
     lau_db_df = db_ready_df.drop(
@@ -177,112 +248,139 @@ def process_and_add_lau_data(data_df, var_name, details_dict):
         ]
     )
 
-    add_to_region_data(lau_db_df)
+    with load_phase("region_data"):
+        add_to_region_data(with_constant_cols(lau_db_df, constant_cols))
+    invalidate_share_matrices(var_name)
 
     # aggregate and dump upper level region data
-    aggregate_and_add_to_db(db_ready_df, var_name)
-
+    with load_phase("aggregation"):
+        aggregate_and_add_to_db(db_ready_df, var_name, constant_cols)
+
+
+def disaggregate_and_add_data(
+    data_df: pd.DataFrame,
+    var_name: str,
+    details_dict: dict,
+    proxy: str,
+    chunked: bool = True,
+) -> None:
+    """Disaggregate data to LAU regions using the proxy and add it to the DB.
+
+    If `chunked`, the data is disaggregated and added one country at a time, so that
+    the peak memory is bounded by the largest country instead of the whole dataset.
+    """
+    with load_phase("share_matrix"):
+        proxy_vars = get_proxy_var_names(proxy)
+        share_matrix = get_share_matrix(proxy, details_dict["resolution"])
+
+    with load_phase("lookups"):
+        _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
+
+        # same in all rows; attached only when writing to the DB
+        constant_cols = {
+            "var_detail_id": _fk_var_detail,
+            "citation_id": get_primary_key(
+                "citations", {"data_source_citation": details_dict["citation"]}
+            ),
+            "original_resolution_id": get_primary_key(
+                "original_resolutions",
+                {"original_resolution": details_dict["resolution"]},
+            ),
+            "disaggregation_method_id": get_primary_key(
+                "disaggregation_methods",
+                {"disaggregation_method": "Using proxy metrics"},
+            ),
+            "chosen": 1,
+        }
 
-def disaggregate_and_add_data(data_df, var_name, details_dict, proxy):
-    if "+" in proxy:  # assuming only sum of vars or a var could be proxy
-        proxy_data, proxy_vars = add_proxy_vars(proxy)
-    else:
-        proxy_data = get_var_data_for_disaggregation(proxy)
-        proxy_vars = [proxy]
+    data_df = optimize_dtypes(data_df)
 
-    # add a match_region_code on proxy data based on spatial resolution of the data
-    if details_dict["resolution"] != "NUTS3":
-        n_del = del_dict[details_dict["resolution"]]
-        proxy_data["match_region_code"] = proxy_data["parent_region_code"].str[:-n_del]
+    # same quality rating and year as the disagg.ed value to all
+    if chunked:
+        disagg_chunks = iter_disaggregated_chunks(
+            share_matrix,
+            data_df,
+            details_dict["resolution"],
+            data_key="reg_code",
+            carry_cols=["quality_rating", "year"],
+        )
     else:
-        proxy_data["match_region_code"] = proxy_data["parent_region_code"]
-
-    disagg_df_list = []
-    for key_row in data_df.iterrows():
-        row = key_row[1]
-        _proxy_data = proxy_data[proxy_data["match_region_code"] == row["reg_code"]]
-        disagg_df = disaggregate_value(row["value"], _proxy_data)
-        disagg_df["quality_rating"] = row[
-            "quality_rating"
-        ]  # same quality rating as the disagg.ed
-        # value to all
-        disagg_df["year"] = row["year"]  # same year as the disagg.ed
-        # value to all
-        disagg_df_list.append(disagg_df)
-
-    db_ready_df = pd.concat(disagg_df_list)
-
-    _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
-    db_ready_df["var_detail_id"] = _fk_var_detail
-
-    _fk_citation = get_primary_key(
-        "citations", {"data_source_citation": details_dict["citation"]}
-    )
-    db_ready_df["citation_id"] = _fk_citation
-
-    _fk_org_res = get_primary_key(
-        "original_resolutions", {"original_resolution": details_dict["resolution"]}
-    )
-    db_ready_df["original_resolution_id"] = _fk_org_res
-
-    _fk_disagg_method = get_primary_key(
-        "disaggregation_methods", {"disaggregation_method": "Using proxy metrics"}
-    )
-    db_ready_df["disaggregation_method_id"] = _fk_disagg_method
-
-    if "climate_experiment" in db_ready_df.columns:
-        clt_expt_df = get_table(sql_cmd="SELECT * FROM climate_experiments")
-        clt_expt_df.rename(columns={"id": "climate_experiment_id"}, inplace=True)
-
-        db_ready_df = pd.merge(
-            db_ready_df,
-            clt_expt_df,
-            left_on="climate_experiment",
-            right_on="climate_experiment",
-            how="left",
+        disagg_chunks = iter(
+            [
+                share_matrix.disaggregate_frame(
+                    data_df,
+                    data_key="reg_code",
+                    carry_cols=["quality_rating", "year"],
+                )
+            ]
         )
-        db_ready_df.drop(["climate_experiment"], inplace=True)
 
-    db_ready_df["chosen"] = 1
+    memory_before, memory_after = 0.0, 0.0
+    # NOTE: the chunks are disaggregated lazily, i.e. within this phase
+    with load_phase("disaggregation"):
+        for db_ready_df in disagg_chunks:
+            if "climate_experiment" in db_ready_df.columns:
+                clt_expt_df = dimension_cache.get_table("climate_experiments")
+                clt_expt_df.rename(
+                    columns={"id": "climate_experiment_id"}, inplace=True
+                )
 
-    db_ready_df.drop(columns=["region_code", "match_region_code"], inplace=True)
+                db_ready_df = pd.merge(
+                    db_ready_df,
+                    clt_expt_df,
+                    left_on="climate_experiment",
+                    right_on="climate_experiment",
+                    how="left",
+                )
+                db_ready_df.drop(columns=["climate_experiment"], inplace=True)
+
+            db_ready_df.drop(columns=["region_code"], inplace=True)
+            memory_before += get_memory_usage(db_ready_df)
+            db_ready_df = optimize_dtypes(db_ready_df)
+            memory_after += get_memory_usage(db_ready_df)
+
+            # dump LAU region data
+            lau_db_df = db_ready_df.drop(
+                columns=[
+                    "parent_region_code",
+                ]
+            )
 
-    # dump LAU region data
-    lau_db_df = db_ready_df.drop(
-        columns=[
-            "parent_region_code",
-        ]
-    )
+            with load_phase("region_data"):
+                add_to_region_data(with_constant_cols(lau_db_df, constant_cols))
+            del lau_db_df
 
-    add_to_region_data(lau_db_df)
+            # aggregate and dump upper level region data
+            with load_phase("aggregation"):
+                aggregate_and_add_to_db(db_ready_df, var_name, constant_cols)
 
-    # aggregate and dump upper level region data
-    aggregate_and_add_to_db(db_ready_df, var_name)
+    log_memory_report(var_name, memory_before, memory_after)
+    invalidate_share_matrices(var_name)
 
     # add to proxy_metrics
-    add_to_proxy_metrics(_fk_var_detail, proxy_vars)
-
-
-def perform_post_calculation_and_add_data(data_df, var_name, details_dict):
-    regions_df = get_regions("LAU")
-
-    # add a match_region_code on regions_df based on spatial resolution of the data
-    if details_dict["resolution"] != "NUTS3":
-        n_del = del_dict[details_dict["resolution"]]
-        regions_df["match_region_code"] = regions_df["parent_region_code"].str[:-n_del]
-    else:
-        regions_df["match_region_code"] = regions_df["parent_region_code"]
-
-    # merge dfs
-    db_ready_df = pd.merge(
-        regions_df,
-        data_df,
-        left_on="match_region_code",
-        right_on="reg_code",
-        how="right",
+    with load_phase("proxy_metrics"):
+        add_to_proxy_metrics(_fk_var_detail, proxy_vars)
+
+
+def perform_post_calculation_and_add_data(
+    data_df: pd.DataFrame, var_name: str, details_dict: dict
+) -> None:
+    # get all LAU regions in each region of the data, based on spatial resolution of the data
+    hierarchy = get_region_hierarchy()
+    data_pos, lau_idx = hierarchy.children_of(
+        details_dict["resolution"],
+        hierarchy.index_of_codes(
+            details_dict["resolution"], data_df["reg_code"].values
+        ),
+        "LAU",
     )
 
-    db_ready_df.rename(columns={"id": "region_id"}, inplace=True)
+    db_ready_df = data_df.iloc[data_pos].reset_index(drop=True)
+    db_ready_df["region_id"] = hierarchy.ids("LAU")[lau_idx]
+    db_ready_df["region_code"] = hierarchy.codes("LAU")[lau_idx]
+    db_ready_df["parent_region_code"] = hierarchy.codes("NUTS3")[
+        hierarchy.parent_of("LAU", lau_idx)
+    ]
 
     _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
     db_ready_df["var_detail_id"] = _fk_var_detail
@@ -304,7 +402,7 @@ def perform_post_calculation_and_add_data(data_df, var_name, details_dict):
     db_ready_df["disaggregation_method_id"] = _fk_disagg_method
 
     if "climate_experiment" in db_ready_df.columns:
-        clt_expt_df = get_table(sql_cmd="SELECT * FROM climate_experiments")
+        clt_expt_df = dimension_cache.get_table("climate_experiments")
         clt_expt_df.rename(columns={"id": "climate_experiment_id"}, inplace=True)
 
         db_ready_df = pd.merge(
@@ -319,7 +417,7 @@ def perform_post_calculation_and_add_data(data_df, var_name, details_dict):
     db_ready_df["chosen"] = 1
 
     db_ready_df.drop(
-        columns=["region_code", "reg_code", "match_region_code"],
+        columns=["region_code", "reg_code"],
         inplace=True,
     )
 
@@ -330,74 +428,79 @@ def perform_post_calculation_and_add_data(data_df, var_name, details_dict):
         ]
     )
 
-    add_to_region_data(lau_db_df)
+    with load_phase("region_data"):
+        add_to_region_data(lau_db_df)
+    invalidate_share_matrices(var_name)
 
     # aggregate and dump upper level region data
-    aggregate_and_add_to_db(db_ready_df, var_name)
+    with load_phase("aggregation"):
+        aggregate_and_add_to_db(db_ready_df, var_name)
+
+
+def get_input_data_path(var_name: str, data_year: Any) -> str:
+    """Return the path of the processed data of a var (and year, if the var has data per year)."""
+    if isinstance(data_year, str):
+        return os.path.join(PROCESSED_DATA_PATH, var_name, data_year)
+    return os.path.join(PROCESSED_DATA_PATH, var_name)
 
 
 def process_and_add_input_data(values: set) -> None:
-    """Take processed and saved data, disaggregate to LAU regions and add to the database."""
+    """Take processed and saved data, disaggregate to LAU regions and add to the database.
+
+    Errors are raised, so that the scheduler can report the job as failed and skip
+    the vars that depend on it.
+    """
     var_name, on_the_fly_calculation, proxy, post_calculation, data_year = values
-    try:
-        process = psutil.Process(os.getpid())
-        memory_used = process.memory_info().rss / (1024 * 1024)
-        waiting_count = 0
-        while memory_used > 2000:
-            time.sleep(10)
-            db_access_with_calculations_log.info(
-                f"used more than 2gb of memory, waiting since {waiting_count * 10} seconds"
-            )
-            memory_used = process.memory_info().rss / (1024 * 1024)
-            waiting_count = waiting_count + 1
+    if not isinstance(on_the_fly_calculation, str):
+        # if on_the_fly_calculation is required for a var, this will be done on API side
 
-        if not isinstance(on_the_fly_calculation, str):
-            # if on_the_fly_calculation is required for a var, this will be done on API side
+        # get data and details dict
+        DATA_PATH = get_input_data_path(var_name, data_year)
 
-            # get data and details dict
-            if isinstance(data_year, str):
-                DATA_PATH = os.path.join(PROCESSED_DATA_PATH, var_name, data_year)
-            else:
-                DATA_PATH = os.path.join(PROCESSED_DATA_PATH, var_name)
-
-            data_df = pd.read_csv(
-                os.path.join(DATA_PATH, "data.csv"), dtype={"reg_code": object}
-            )
+        data_df = pd.read_csv(
+            os.path.join(DATA_PATH, "data.csv"), dtype={"reg_code": object}
+        )
 
-            with open(os.path.join(DATA_PATH, "details.json")) as f:
-                details_dict = json.load(f)
+        with open(os.path.join(DATA_PATH, "details.json")) as f:
+            details_dict = json.load(f)
 
-            # subset only PT if working locally
-            if bool(os.environ.get("MINI_DB", 0)):
-                if details_dict["resolution"] == "LAU":
-                    subset_df = data_df.loc[data_df["prnt_code"].str.startswith(("PT"))]
-                else:
-                    subset_df = data_df.loc[data_df["reg_code"].str.startswith(("PT"))]
+        # subset only PT if working locally
+        if bool(os.environ.get("MINI_DB", 0)):
+            if details_dict["resolution"] == "LAU":
+                subset_df = data_df.loc[data_df["prnt_code"].str.startswith(("PT"))]
+            else:
+                subset_df = data_df.loc[data_df["reg_code"].str.startswith(("PT"))]
 
-                data_df = subset_df.copy(deep=True)
+            data_df = subset_df.copy(deep=True)
 
+        else:
+            if details_dict["resolution"] == "LAU":
+                subset_df = data_df.loc[
+                    data_df["prnt_code"].str.startswith(("PL", "DE", "ES"))
+                ]
             else:
-                if details_dict["resolution"] == "LAU":
-                    subset_df = data_df.loc[
-                        data_df["prnt_code"].str.startswith(("PL", "DE", "ES"))
-                    ]
-                else:
-                    subset_df = data_df.loc[
-                        data_df["reg_code"].str.startswith(("PL", "DE", "ES"))
-                    ]
+                subset_df = data_df.loc[
+                    data_df["reg_code"].str.startswith(("PL", "DE", "ES"))
+                ]
 
-                data_df = subset_df.copy(deep=True)
+            data_df = subset_df.copy(deep=True)
 
-            if len(data_df) > 0:
-                if isinstance(data_year, str):
-                    db_access_with_calculations_log.info(
-                        f"currently working on {var_name} with year {data_year} ===================="
-                    )
-                else:
-                    db_access_with_calculations_log.info(
-                        f"currently working on {var_name} ===================="
-                    )
+        if len(data_df) > 0:
+            if isinstance(data_year, str):
+                db_access_with_calculations_log.info(
+                    f"currently working on {var_name} with year {data_year} ===================="
+                )
+            else:
+                db_access_with_calculations_log.info(
+                    f"currently working on {var_name} ===================="
+                )
 
+            # NOTE: the partition of the var is created before its load session, as
+            # creating it within the session would wait for the locks of the session
+            add_var_partitions([get_primary_key("var_details", {"var_name": var_name})])
+
+            # all lookups and writes of the var on one connection, committed once
+            with load_session(var_name):
                 # if data is for LAU regions, directly add to DB
                 if details_dict["resolution"] == "LAU":
                     process_and_add_lau_data(data_df, var_name, details_dict)
@@ -424,19 +527,14 @@ def process_and_add_input_data(values: set) -> None:
                             "Either the data should be at LAU resolution. or one of proxy or post_calculation should be provided"
                         )
 
-            else:
-                db_access_with_calculations_log.info(
-                    f"for {var_name} data_df has 0 rows. Nothing to add!"
-                )
-
         else:
             db_access_with_calculations_log.info(
-                f"for {var_name} skipping due to on_the_fly_calculation"
+                f"for {var_name} data_df has 0 rows. Nothing to add!"
             )
 
-    except:
-        db_access_with_calculations_log.error(
-            f"!!!!for {var_name} job failed!!!!{traceback.format_exc()}"
+    else:
+        db_access_with_calculations_log.info(
+            f"for {var_name} skipping due to on_the_fly_calculation"
         )
 
 
@@ -458,23 +556,20 @@ def process_and_add_eucalc_data(values: set) -> None:
         f"currently working on {var_name} for year {year}===================="
     )
     if isinstance(proxy, str):
-        if "+" in proxy:  # assuming only sum of vars or a var could be proxy
-            proxy_data, proxy_vars = add_proxy_vars(proxy, country_code)
-        else:
-            proxy_data = get_var_data_for_disaggregation(proxy, country_code)
-            proxy_vars = [proxy]
+        proxy_vars = get_proxy_var_names(proxy)
+        share_matrix = get_share_matrix(proxy, "NUTS0", country_code)
 
         # NOTE: it could happen that proxy is 0 in all regions which leads to "divide by 0" problem.
-        # For now, these values are skipped!!
-        if len(proxy_data["value"].unique()) == 1:
-            if proxy_data["value"].unique().item() == 0:
-                warnings.warn(
-                    f"{proxy} is 0 for all regions. Using population as proxy instead"
-                )
-                proxy_data = get_var_data_for_disaggregation("population", country_code)
-                proxy_vars = ["population"]
+        # For now, population is used as proxy instead!!
+        if share_matrix.zero_parents.all():
+            warnings.warn(
+                f"{proxy} is 0 for all regions. Using population as proxy instead"
+            )
+            share_matrix = get_share_matrix("population", "NUTS0", country_code)
+            proxy_vars = ["population"]
 
-        db_ready_df = disaggregate_value(value, proxy_data)
+        parent_df = pd.DataFrame({"reg_code": [country_code], "value": [value]})
+        db_ready_df = share_matrix.disaggregate_frame(parent_df, data_key="reg_code")
 
     elif isinstance(post_calculation, str):
         if post_calculation == "same value all regions":
@@ -537,8 +632,162 @@ def process_and_add_eucalc_data(values: set) -> None:
     )
 
     add_to_region_data(lau_db_df)
+    invalidate_share_matrices(var_name)
 
     # aggregate and dump upper level region data
     aggregate_and_add_to_db(db_ready_df, var_name)
 
     add_to_proxy_metrics(_fk_var_detail, proxy_vars)
+
+
+def process_and_add_eucalc_var_data(
+    var_name: str, data_df: pd.DataFrame, proxy: Any, post_calculation: Any
+) -> None:
+    """Disaggregate EUCALC data of a var for all years, pathways and countries at once and add to the database.
+
+    `data_df` holds one row per (country_code, year, main_pathway, reference, pathway_variant)
+    with the corresponding value. Instead of one `process_and_add_eucalc_data` job per row,
+    all values are disaggregated with a single sparse matrix product and added in one bulk load.
+    """
+    db_access_with_calculations_log.info(
+        f"currently working on {var_name} for {len(data_df)} values ===================="
+    )
+    data_df = data_df.rename(columns={"country_code": "reg_code"})
+
+    # get pathway primary keys
+    pathway_cols = ["main_pathway", "reference", "pathway_variant"]
+    pathways_df = data_df[pathway_cols].drop_duplicates()
+    pathways_df["pathway_id"] = [
+        get_primary_key(
+            "pathways",
+            {
+                "pathway_main": main_pathway,
+                "pathway_reference": reference,
+                "pathway_variant": pathway_variant,
+            },
+        )
+        for main_pathway, reference, pathway_variant in pathways_df.itertuples(
+            index=False
+        )
+    ]
+    data_df = pd.merge(data_df, pathways_df, on=pathway_cols, how="left")
+
+    # NOTE: the values of the same country, year and pathway would overwrite each other
+    is_duplicate = data_df.duplicated(["reg_code", "year", "pathway_id"], keep=False)
+    if is_duplicate.any():
+        raise ValueError(
+            f"{var_name} has several values for the same country, year and pathway: "
+            f"{data_df.loc[is_duplicate, ['reg_code', 'year'] + pathway_cols].drop_duplicates().values.tolist()}"
+        )
+
+    # proxy vars per country, added to proxy_metrics
+    country_proxy_vars: list = []
+    if isinstance(proxy, str):
+        proxy_vars = get_proxy_var_names(proxy)
+        share_matrix = get_share_matrix(proxy, "NUTS0")
+
+        # NOTE: it could happen that proxy is 0 in all regions of a country which leads to "divide by 0" problem.
+        # For now, population is used as proxy instead for such countries!!
+        zero_countries = share_matrix.parent_codes[share_matrix.zero_parents]
+        is_zero_country = data_df["reg_code"].isin(zero_countries)
+
+        disagg_df_list = [
+            share_matrix.disaggregate_frame(
+                data_df[~is_zero_country],
+                data_key="reg_code",
+                carry_cols=["year", "pathway_id"],
+            )
+        ]
+        if is_zero_country.any():
+            warnings.warn(
+                f"{proxy} is 0 for all regions in {list(zero_countries)}. Using population as proxy instead"
+            )
+            population_share_matrix = get_share_matrix("population", "NUTS0")
+            disagg_df_list.append(
+                population_share_matrix.disaggregate_frame(
+                    data_df[is_zero_country],
+                    data_key="reg_code",
+                    carry_cols=["year", "pathway_id"],
+                )
+            )
+
+        if len(zero_countries) > 0:
+            other_countries = sorted(
+                set(get_region_hierarchy().codes("NUTS0")) - set(zero_countries)
+            )
+            country_proxy_vars = [
+                (list(zero_countries), ["population"]),
+                (other_countries, proxy_vars),
+            ]
+        else:
+            country_proxy_vars = [(None, proxy_vars)]
+
+        db_ready_df = pd.concat(disagg_df_list, ignore_index=True)
+
+    elif isinstance(post_calculation, str):
+        if post_calculation == "same value all regions":
+            hierarchy = get_region_hierarchy()
+            data_pos, lau_idx = hierarchy.children_of(
+                "NUTS0",
+                hierarchy.index_of_codes("NUTS0", data_df["reg_code"].values),
+                "LAU",
+            )
+
+            db_ready_df = (
+                data_df[["year", "pathway_id", "value"]]
+                .iloc[data_pos]
+                .reset_index(drop=True)
+            )
+            db_ready_df["region_id"] = hierarchy.ids("LAU")[lau_idx]
+            db_ready_df["region_code"] = hierarchy.codes("LAU")[lau_idx]
+            db_ready_df["parent_region_code"] = hierarchy.codes("NUTS3")[
+                hierarchy.parent_of("LAU", lau_idx)
+            ]
+
+        else:
+            raise ValueError("unknown post_calculation")
+
+    else:
+        raise ValueError("atleast one of proxy and post_calculation should be provided")
+
+    # additional cols
+    _fk_citation = get_primary_key(
+        "citations",
+        {
+            "data_source_citation": "Costa L., (2022), Documentation of decarbonisation scenarios for usage in the project (LOCALISED Deliverable 2.1)"
+        },
+    )
+    db_ready_df["citation_id"] = _fk_citation
+
+    _fk_var_detail = get_primary_key("var_details", {"var_name": var_name})
+    db_ready_df["var_detail_id"] = _fk_var_detail
+
+    _fk_org_res = get_primary_key(
+        "original_resolutions", {"original_resolution": "NUTS0"}
+    )
+    db_ready_df["original_resolution_id"] = _fk_org_res
+
+    _fk_disagg_method = get_primary_key(
+        "disaggregation_methods", {"disaggregation_method": "Using proxy metrics"}
+    )
+    db_ready_df["disaggregation_method_id"] = _fk_disagg_method
+
+    db_ready_df["chosen"] = 1
+
+    db_ready_df.drop(columns=["region_code"], inplace=True)
+
+    # dump LAU region data
+    lau_db_df = db_ready_df.drop(
+        columns=[
+            "parent_region_code",
+        ]
+    )
+
+    add_to_region_data(lau_db_df)
+    invalidate_share_matrices(var_name)
+
+    # aggregate and dump upper level region data
+    aggregate_and_add_to_db(db_ready_df, var_name)
+
+    for countries, proxy_vars in country_proxy_vars:
+        add_to_proxy_metrics(_fk_var_detail, proxy_vars, countries=countries)
@@ -0,0 +1,205 @@
+"""Benchmarks of the DB access layer. Run against a populated DB, for ex.: `python db_benchmarks.py`."""
+import csv
+import time
+import logging
+from io import StringIO
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from zoomin.database.db_access import read_query, _get_regions_where_clause
+from zoomin.database.db_connection import with_db_connection
+from zoomin.database.db_pgcopy import copy_to_table, iter_pgcopy_chunks
+from zoomin.database.db_query import select_col_values
+
+db_benchmarks_log = logging.getLogger("db_benchmarks")
+logging.basicConfig(level=logging.INFO)
+
+
+def _calls_per_sec(func_call: Callable, n_calls: int) -> float:
+    """Return how many times per second `func_call` can be called."""
+    before = time.perf_counter()
+    for _ in range(n_calls):
+        func_call()
+    after = time.perf_counter()
+
+    return round(n_calls / (after - before), 2)
+
+
+def benchmark_connection_pool(n_calls: int = 200) -> dict:
+    """Compare calls/sec of a trivial query with a pooled connection and with a new connection per call."""
+
+    @with_db_connection(pooled=False)
+    def select_with_new_connection(cursor: Any) -> Any:
+        cursor.execute("SELECT 1")
+        return cursor.fetchone()
+
+    @with_db_connection(pooled=True)
+    def select_with_pooled_connection(cursor: Any) -> Any:
+        cursor.execute("SELECT 1")
+        return cursor.fetchone()
+
+    result = {
+        "new connection per call": _calls_per_sec(select_with_new_connection, n_calls),
+        "pooled connection": _calls_per_sec(select_with_pooled_connection, n_calls),
+    }
+    db_benchmarks_log.info(f"connection pool, calls/sec: {result}")
+
+    return result
+
+
+def _get_region_data_like_df(n_rows: int) -> pd.DataFrame:
+    """Return a dataframe shaped like region_data rows of a LAU load."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "region_id": rng.integers(1, 100000, n_rows),
+            "var_detail_id": 1,
+            "year": 2020,
+            "value": rng.random(n_rows),
+            "quality_rating": pd.Categorical(rng.choice(["good", "bad"], n_rows)),
+            "chosen": 1,
+        }
+    )
+
+
+@with_db_connection()
+def benchmark_copy_formats(cursor: Any, n_rows: int = 1000000) -> dict:
+    """Compare rows/sec of CSV and binary COPY, both for encoding only and for adding to a temporary table."""
+    data_df = _get_region_data_like_df(n_rows)
+    cursor.execute(
+        "CREATE TEMP TABLE region_data_benchmark (region_id integer, var_detail_id integer, \
+            year integer, value double precision, quality_rating varchar(255), chosen integer) \
+            ON COMMIT DROP"
+    )
+    columns = ", ".join(data_df.columns)
+
+    def encode_csv() -> StringIO:
+        s_buf = StringIO()
+        csv.writer(s_buf).writerows(data_df.itertuples(index=False))
+        s_buf.seek(0)
+        return s_buf
+
+    def encode_binary() -> bytes:
+        pg_types = [
+            "integer",
+            "integer",
+            "integer",
+            "double precision",
+            "character varying",
+            "integer",
+        ]
+        return b"".join(iter_pgcopy_chunks(data_df, pg_types))
+
+    def copy_csv() -> None:
+        cursor.copy_expert(
+            sql=f"COPY region_data_benchmark ({columns}) FROM STDIN WITH CSV",
+            file=encode_csv(),
+        )
+
+    def copy_binary() -> None:
+        copy_to_table(cursor, "region_data_benchmark", data_df)
+
+    result = {
+        name: _calls_per_sec(func_call, 1) * n_rows
+        for name, func_call in [
+            ("csv encoding", encode_csv),
+            ("binary encoding", encode_binary),
+            ("csv COPY", copy_csv),
+            ("binary COPY", copy_binary),
+        ]
+    }
+    db_benchmarks_log.info(f"COPY formats, rows/sec: {result}")
+
+    return result
+
+
+@with_db_connection()
+def benchmark_read_backends(cursor: Any, n_rows: int = 5000000) -> dict:
+    """Compare rows/sec of scanning region_data with pd.read_sql_query and with a binary COPY, without and with text columns."""
+    sql_cmds = {
+        "numeric": f"SELECT region_id, var_detail_id, value, year, pathway_id FROM region_data LIMIT {n_rows}",
+        "with region codes": f"SELECT r.region_code, r.parent_region_code, rd.value, rd.year FROM region_data rd \
+            JOIN regions r ON r.id = rd.region_id LIMIT {n_rows}",
+    }
+
+    result: dict = {}
+    for name, sql_cmd in sql_cmds.items():
+        result[name] = {}
+        for backend in ["sql", "copy"]:
+            before = time.perf_counter()
+            data_df = read_query(cursor, sql_cmd, backend=backend)
+            after = time.perf_counter()
+
+            result[name][backend] = round(len(data_df) / (after - before), 2)
+        db_benchmarks_log.info(
+            f"region_data scan ({name}) of {len(data_df)} rows, rows/sec: {result[name]} "
+            f"({result[name]['copy'] / result[name]['sql']:.1f}x)"
+        )
+
+    return result
+
+
+@with_db_connection()
+def benchmark_query_layer(
+    cursor: Any, n_calls: int = 1000, n_region_ids: int = 100000
+) -> dict:
+    """Compare the latency of a region lookup and the size of a statement matching many regions, with f-strings and with the query layer."""
+    cursor.execute("SELECT region_code FROM regions LIMIT 1")
+    (region_code,) = cursor.fetchone()
+
+    def lookup_with_f_string() -> list:
+        cursor.execute(f"SELECT id FROM regions WHERE region_code='{region_code}'")
+        return list(cursor.fetchall())
+
+    def lookup_with_bound_params() -> list:
+        return select_col_values(
+            cursor, "regions", "id", {"region_code": region_code}, prepare=False
+        )
+
+    def lookup_with_prepared_statement() -> list:
+        return select_col_values(
+            cursor, "regions", "id", {"region_code": region_code}, prepare=True
+        )
+
+    latency = {
+        name: round(1000 / _calls_per_sec(func_call, n_calls), 4)
+        for name, func_call in [
+            ("f-string", lookup_with_f_string),
+            ("bound parameters", lookup_with_bound_params),
+            ("prepared statement", lookup_with_prepared_statement),
+        ]
+    }
+    db_benchmarks_log.info(f"region lookup, latency in ms: {latency}")
+
+    region_ids = list(range(1, n_region_ids + 1))
+    where_clause, params = _get_regions_where_clause("LAU", alias="r")
+    sql_cmd = "SELECT region_id, value FROM region_data WHERE var_detail_id=1"
+    statement_size = {
+        "f-string IN": len(f"{sql_cmd} AND region_id IN {tuple(region_ids)}"),
+        "ANY binding": len(
+            cursor.mogrify(f"{sql_cmd} AND region_id = ANY(%s)", (region_ids,))
+        ),
+        "regions join": len(
+            cursor.mogrify(
+                f"SELECT rd.region_id, rd.value FROM region_data rd \
+                    JOIN regions r ON r.id=rd.region_id \
+                    WHERE rd.var_detail_id=1 AND {where_clause}",
+                params,
+            )
+        ),
+    }
+    db_benchmarks_log.info(
+        f"statement matching {n_region_ids} regions, size in bytes: {statement_size}"
+    )
+
+    return {"latency": latency, "statement_size": statement_size}
+
+
+if __name__ == "__main__":
+
+    benchmark_connection_pool()
+    benchmark_copy_formats()
+    benchmark_read_backends()
+    benchmark_query_layer()
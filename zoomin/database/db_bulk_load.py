@@ -0,0 +1,247 @@
+"""Bulk loader, that COPYs partitions of a dataframe in parallel and adds them to a table all at once."""
+import os
+import csv
+import math
+import uuid
+import logging
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from zoomin.database.db_connection import get_load_session, with_db_connection
+from zoomin.database.db_pgcopy import copy_to_table, get_column_types
+
+db_bulk_load_log = logging.getLogger("db_bulk_load")
+logging.basicConfig(level=logging.INFO)
+
+# number of partitions COPYed at the same time, each on its own connection
+BULK_LOAD_WORKERS = int(os.environ.get("BULK_LOAD_WORKERS", 4))
+# number of rows per partition
+ROWS_PER_PARTITION = int(os.environ.get("ROWS_PER_PARTITION", 250000))
+MIN_ROWS_PER_PARTITION = 10000
+
+# "append" adds the rows, "upsert" first deletes the rows with the same keys
+LOAD_MODE = os.environ.get("LOAD_MODE", "append")
+
+# columns identifying a row, for upserts
+UPSERT_KEY_COLS = {
+    "region_data": [
+        "region_id",
+        "var_detail_id",
+        "year",
+        "pathway_id",
+        "climate_experiment_id",
+    ],
+}
+NOT_NULL_KEY_COLS = {"region_id", "var_detail_id"}
+
+
+def get_partitions(data_df: pd.DataFrame, rows_per_partition: int) -> list:
+    """Split `data_df` into partitions of at most `rows_per_partition` rows."""
+    n_partitions = max(math.ceil(len(data_df) / rows_per_partition), 1)
+
+    return [
+        data_df.iloc[i * rows_per_partition : (i + 1) * rows_per_partition]
+        for i in range(n_partitions)
+    ]
+
+
+@with_db_connection(in_session=False)
+def _create_staging_table(cursor: Any, table: str, columns: list) -> str:
+    """Create an empty unlogged table with the `columns` of `table` and return its name."""
+    staging_table = f"{table}_staging_{uuid.uuid4().hex[:12]}"
+    cursor.execute(
+        f"CREATE UNLOGGED TABLE {staging_table} AS SELECT {', '.join(columns)} FROM {table} WITH NO DATA"
+    )
+
+    return staging_table
+
+
+@with_db_connection(in_session=False)
+def _get_column_types(cursor: Any, table: str) -> dict:
+    return get_column_types(cursor, table, cache=False)
+
+
+@with_db_connection(in_session=False)
+def _drop_staging_table(cursor: Any, staging_table: str) -> None:
+    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+
+
+def _get_csv_values(series: pd.Series) -> np.ndarray:
+    """Return the values of a column as written by `copy_csv`, with None for missing values.
+
+    csv.writer writes None as an empty field, which a CSV COPY reads as NULL, instead
+    of "nan" or "<NA>". Floats without a fractional part are written as integers, so
+    that they can be added to integer columns as well.
+    """
+    is_null = series.isna().values
+    if pd.api.types.is_float_dtype(series.dtype):
+        float_values = series.to_numpy(dtype="float64", na_value=np.nan)
+        known = float_values[~is_null]
+        if (
+            np.isfinite(known).all()
+            and (known == np.round(known)).all()
+            and (np.abs(known) < 2**53).all()
+        ):
+            series = pd.Series(float_values).astype("Int64")
+
+    values = np.asarray(series.to_numpy(dtype=object))
+    values[is_null] = None
+
+    return values
+
+
+def copy_csv(cursor: Any, table: str, data_df: pd.DataFrame) -> None:
+    """Add the rows of `data_df` to `table` with a CSV COPY; missing values are added as NULL."""
+    s_buf = StringIO()
+    writer = csv.writer(s_buf)
+    writer.writerows(zip(*[_get_csv_values(data_df[col]) for col in data_df.columns]))
+    s_buf.seek(0)
+
+    columns = ", ".join(data_df.columns)
+    cursor.copy_expert(sql=f"COPY {table} ({columns}) FROM STDIN WITH CSV", file=s_buf)
+
+
+@with_db_connection(in_session=False)
+def _copy_partition(
+    cursor: Any,
+    staging_table: str,
+    partition_df: pd.DataFrame,
+    column_types: dict,
+    copy_format: str,
+) -> bool:
+    """COPY a partition to the staging table. Returns None if it failed."""
+    if copy_format == "binary":
+        copy_to_table(cursor, staging_table, partition_df, column_types=column_types)
+    else:
+        copy_csv(cursor, staging_table, partition_df)
+
+    return True
+
+
+def _get_key_condition(key_cols: list, columns: list) -> str:
+    """Return the condition matching rows of the table (t) to the keys in the staging table (s).
+
+    NOTE: keys might be NULL (for ex.: pathway_id), and key columns missing in the
+    staging table are NULL for all of its rows. Keys that are never NULL are
+    compared with `=`, so that indexes on them can be used.
+    """
+    conditions = []
+    for col in key_cols:
+        if col not in columns:
+            conditions.append(f"t.{col} IS NULL")
+        elif col in NOT_NULL_KEY_COLS:
+            conditions.append(f"t.{col} = s.{col}")
+        else:
+            conditions.append(f"t.{col} IS NOT DISTINCT FROM s.{col}")
+
+    return " AND ".join(conditions)
+
+
+@with_db_connection()
+def _add_from_staging_table(
+    cursor: Any, table: str, staging_table: str, columns: list, mode: str
+) -> bool:
+    """Add all rows of the staging table to `table` in one transaction. Returns None if it failed.
+
+    If `mode` is "upsert", the rows of `table` with the same keys are deleted first.
+    """
+    cols = ", ".join(columns)
+
+    if mode == "upsert":
+        key_cols = UPSERT_KEY_COLS[table]
+        staging_key_cols = ", ".join([col for col in key_cols if col in columns])
+        cursor.execute(
+            f"DELETE FROM {table} t USING (SELECT DISTINCT {staging_key_cols} FROM {staging_table}) s \
+                WHERE {_get_key_condition(key_cols, columns)}"
+        )
+        db_bulk_load_log.info(
+            f"{cursor.rowcount} rows with the same keys deleted from {table}"
+        )
+
+    cursor.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging_table}")
+
+    return True
+
+
+def bulk_load(
+    table: str,
+    data_df: pd.DataFrame,
+    copy_format: str = "csv",
+    mode: str = LOAD_MODE,
+    n_workers: int = BULK_LOAD_WORKERS,
+    rows_per_partition: Optional[int] = None,
+) -> None:
+    """Add the rows of `data_df` to `table`, either all of them or none.
+
+    The partitions are COPYed in parallel, each on its own pooled connection, to an
+    unlogged staging table. Only if all of them succeeded, the staging table is added
+    to `table` in a single transaction (the one of the load session, within a load session).
+
+    `copy_format` is either "csv" or "binary". `mode` is either "append" or "upsert";
+    upserting replaces the rows with the same `UPSERT_KEY_COLS`, so that loading the
+    same data again does not duplicate it. By default, the rows are split into
+    `n_workers` partitions of `MIN_ROWS_PER_PARTITION` to `ROWS_PER_PARTITION` rows.
+    """
+    if copy_format not in ("csv", "binary"):
+        raise ValueError(f"unknown copy_format {copy_format}")
+
+    if mode not in ("append", "upsert"):
+        raise ValueError(f"unknown mode {mode}")
+
+    if mode == "upsert" and table not in UPSERT_KEY_COLS:
+        raise ValueError(f"no upsert keys defined for {table}")
+
+    if rows_per_partition is None:
+        rows_per_partition = min(
+            max(math.ceil(len(data_df) / max(n_workers, 1)), MIN_ROWS_PER_PARTITION),
+            ROWS_PER_PARTITION,
+        )
+    partitions = get_partitions(data_df, max(rows_per_partition, 1))
+
+    columns = list(data_df.columns)
+    staging_table = _create_staging_table(table, columns)
+    if staging_table is None:
+        raise ValueError(f"the staging table for {table} could not be created")
+
+    try:
+        column_types = (
+            _get_column_types(staging_table) if copy_format == "binary" else {}
+        )
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda partition_df: _copy_partition(
+                        staging_table, partition_df, column_types, copy_format
+                    ),
+                    partitions,
+                )
+            )
+
+        n_failed = sum(result is None for result in results)
+        if n_failed > 0:
+            raise ValueError(
+                f"{n_failed} of {len(partitions)} partitions could not be added to {table}, none of the rows were added"
+            )
+
+        if _add_from_staging_table(table, staging_table, columns, mode) is None:
+            raise ValueError(
+                f"the rows could not be added to {table}, none of the rows were added"
+            )
+
+        db_bulk_load_log.info(
+            f"{len(data_df)} rows added to {table} in {len(partitions)} partitions"
+        )
+
+    finally:
+        session = get_load_session()
+        if session is None:
+            _drop_staging_table(staging_table)
+        else:
+            # NOTE: dropped once the session ended, as its transaction holds a lock on
+            # the staging table until then, and dropping it within the session would
+            # be undone if the session is rolled back
+            session.add_cleanup(_drop_staging_table, staging_table)
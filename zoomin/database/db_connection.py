@@ -1,9 +1,12 @@
 """Module to help connect to DB."""
 import os
 import logging
-from typing import Any, Callable
+import threading
+from typing import Any, Callable, Iterator, Optional
 from functools import wraps
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool
 from dotenv import load_dotenv, find_dotenv
 
 db_connection_log = logging.getLogger("db_connection")
@@ -19,24 +22,166 @@ db_pwd = os.environ.get("DB_PASSWORD")
 db_host = os.environ.get("DB_HOST")
 db_port = os.environ.get("DB_PORT")
 
+# size of the per-process connection pool
+db_pool_min_conn = int(os.environ.get("DB_POOL_MIN_CONN", 1))
+db_pool_max_conn = int(os.environ.get("DB_POOL_MAX_CONN", 5))
 
-def with_db_connection() -> Any:
-    """Wrap a set up-tear down Postgres connection while providing a cursor object to make queries with."""
+_connection_pool: Optional[pool.ThreadedConnectionPool] = None
+_connection_pool_pid: Optional[int] = None
+_connection_pool_lock = threading.Lock()
+
+# load session of each thread, see db_session.load_session
+_load_session = threading.local()
+
+
+def get_conn_info() -> dict:
+    """Return the connection details of the DB."""
+    return {
+        "database": db_name,
+        "user": db_user,
+        "password": db_pwd,
+        "host": db_host,
+        "port": db_port,
+    }
+
+
+def _reset_connection_pool_after_fork() -> None:
+    """Forget the pool inherited from the parent process.
+
+    NOTE: the inherited connections are not closed, as they share their sockets
+    with the parent process. The child process opens its own connections.
+    """
+    global _connection_pool, _connection_pool_pid, _connection_pool_lock, _load_session  # pylint: disable=global-statement
+    _connection_pool = None
+    _connection_pool_pid = None
+    _connection_pool_lock = threading.Lock()
+    _load_session = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_connection_pool_after_fork)
+
+
+def get_connection_pool() -> pool.ThreadedConnectionPool:
+    """Return the connection pool of the current process, created on first use."""
+    global _connection_pool, _connection_pool_pid  # pylint: disable=global-statement
+
+    with _connection_pool_lock:
+        # NOTE: checked in addition to the fork hook, for processes not started with os.fork
+        if _connection_pool is None or _connection_pool_pid != os.getpid():
+            _connection_pool = pool.ThreadedConnectionPool(
+                db_pool_min_conn, db_pool_max_conn, **get_conn_info()
+            )
+            _connection_pool_pid = os.getpid()
+
+    return _connection_pool
+
+
+def close_connection_pool() -> None:
+    """Close all connections of the pool of the current process, for ex.: before dropping the DB."""
+    global _connection_pool, _connection_pool_pid  # pylint: disable=global-statement
+
+    with _connection_pool_lock:
+        if _connection_pool is not None and _connection_pool_pid == os.getpid():
+            _connection_pool.closeall()
+        _connection_pool = None
+        _connection_pool_pid = None
+
+
+def get_load_session() -> Any:
+    """Return the load session of the current thread, None outside of a load session."""
+    return getattr(_load_session, "session", None)
+
+
+def _set_load_session(session: Any) -> None:
+    _load_session.session = session
+
+
+def _get_connection(pooled: bool) -> tuple:
+    """Return a connection and the pool it was borrowed from (None for a dedicated connection)."""
+    if pooled:
+        connection_pool = get_connection_pool()
+        try:
+            return connection_pool.getconn(), connection_pool
+        except pool.PoolError:
+            # pool exhausted, for ex.: by nested calls of decorated functions
+            db_connection_log.debug(
+                "connection pool exhausted, opening a dedicated connection"
+            )
+
+    return psycopg2.connect(**get_conn_info()), None
+
+
+def _release_connection(connection: Any, connection_pool: Any) -> None:
+    """Return a connection to the pool it was borrowed from, or close it if it is a dedicated one."""
+    if connection_pool is not None and not connection_pool.closed:
+        # broken connections are discarded instead of being reused
+        connection_pool.putconn(connection, close=connection.closed != 0)
+    else:
+        connection.close()
+
+
+@contextmanager
+def borrow_db_connection(pooled: bool = True, in_session: bool = True) -> Iterator[Any]:
+    """Provide a connection within a `with` block, for ex.: to a generator reading in chunks.
+
+    The changes are committed if the block succeeds and rolled back otherwise, and
+    the connection is released afterwards, as with `with_db_connection`.
+    Within a load session, its connection is provided instead (unless not `in_session`).
+    """
+    session = get_load_session() if in_session else None
+    if session is not None:
+        # NOTE: committed or rolled back with the load session
+        yield session.connection
+        return
+
+    connection, connection_pool = _get_connection(pooled)
+    try:
+        yield connection
+        connection.commit()
+
+    except BaseException:
+        # NOTE: also when a generator is closed before it is exhausted
+        if connection.closed == 0:
+            connection.rollback()
+        raise
+
+    finally:
+        _release_connection(connection, connection_pool)
+
+
+def with_db_connection(pooled: bool = True, in_session: bool = True) -> Any:
+    """Wrap a set up-tear down Postgres connection while providing a cursor object to make queries with.
+
+    If `pooled`, the connection is borrowed from the connection pool of the process
+    and returned to it afterwards, instead of opening and closing a new connection
+    on each call.
+
+    Within a load session, the cursor is opened on the connection of the session and
+    the changes are committed with the session, unless not `in_session`. A DB error
+    is raised then instead of returning None, as it aborts the whole session.
+    """
 
     def wrap(func_call: Callable) -> Any:
         @wraps(func_call)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
+            session = get_load_session() if in_session else None
+            if session is not None:
+                cursor = session.connection.cursor()
+                try:
+                    return func_call(cursor, *args, **kwargs)
+
+                except psycopg2.DatabaseError as error:
+                    db_connection_log.error(error)
+                    raise
+
+                finally:
+                    cursor.close()
+
+            connection = None
+            connection_pool = None
             try:
                 # Setup postgres connection
-                conn_info = {
-                    "database": db_name,
-                    "user": db_user,
-                    "password": db_pwd,
-                    "host": db_host,
-                    "port": db_port,
-                }
-
-                connection = psycopg2.connect(**conn_info)
+                connection, connection_pool = _get_connection(pooled)
                 cursor = connection.cursor()
 
                 # Call function passing in cursor
@@ -48,22 +193,21 @@ def with_db_connection() -> Any:
                 # commit the changes
                 connection.commit()
 
-                # Close connection
-                if connection is not None:
-                    connection.close()
-
                 # return value
                 return return_val
 
             except psycopg2.DatabaseError as error:
                 db_connection_log.error(error)
 
-                # Close connection
-                if connection is not None:
-                    connection.close()
+                # NOTE: the pool rolls back connections returned in a transaction
 
                 return None
 
+            finally:
+                # Release connection
+                if connection is not None:
+                    _release_connection(connection, connection_pool)
+
         return wrapper
 
     return wrap
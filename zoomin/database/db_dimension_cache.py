@@ -0,0 +1,124 @@
+"""In-memory cache of the small dimension tables, to resolve foreign keys without a DB round trip per lookup."""
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+from zoomin.database.db_connection import with_db_connection
+from zoomin.database.db_region_snapshot import invalidate_region_snapshot
+
+# small tables that are looked up repeatedly while populating the DB
+DIMENSION_TABLES = [
+    "citations",
+    "original_resolutions",
+    "var_details",
+    "disaggregation_methods",
+    "pathways",
+    "climate_experiments",
+    "input_var_qualities",
+]
+
+
+@with_db_connection()
+def _get_table_rows(cursor: Any, table: str) -> tuple:
+    """Return the column names and all rows of a table."""
+    cursor.execute(f"SELECT * FROM {table}")
+    columns = [desc[0] for desc in cursor.description]
+
+    return columns, cursor.fetchall()
+
+
+class DimensionCache:
+    """Dimension tables, each loaded in bulk on first use and kept as dicts.
+
+    Lookups by a set of columns are answered from an index built on first use of
+    that set of columns. If a lookup finds nothing, the table is reloaded once, in
+    case rows were added by another process.
+    """
+
+    def __init__(self, tables: Iterable = tuple(DIMENSION_TABLES)) -> None:
+        """Set up the cache for `tables`; nothing is loaded until first use."""
+        self.tables = set(tables)
+        self._rows: Dict[str, list] = {}
+        self._columns: dict = {}
+        self._indexes: Dict[tuple, Dict[tuple, list]] = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, table: str) -> bool:
+        """Return whether `table` is cached."""
+        return table in self.tables
+
+    def refresh(self, table: Optional[str] = None) -> None:
+        """Drop a table (default: all tables) from the cache, to be reloaded on next use."""
+        with self._lock:
+            tables = self.tables if table is None else {table}
+            for _table in tables:
+                self._rows.pop(_table, None)
+                self._columns.pop(_table, None)
+            self._indexes = {
+                key: index
+                for key, index in self._indexes.items()
+                if key[0] not in tables
+            }
+
+    def _load(self, table: str) -> None:
+        result = _get_table_rows(table)
+        if result is None:
+            raise ValueError(f"the table {table} could not be read from the DB")
+
+        columns, rows = result
+        self._columns[table] = columns
+        self._rows[table] = [dict(zip(columns, row)) for row in rows]
+
+    def _lookup(self, table: str, cols_criteria: Optional[dict]) -> list:
+        with self._lock:
+            if table not in self._rows:
+                self._load(table)
+
+            if cols_criteria is None or len(cols_criteria) == 0:
+                return self._rows[table]
+
+            criteria_cols = tuple(sorted(cols_criteria))
+            key = (table, criteria_cols)
+            if key not in self._indexes:
+                index: Dict[tuple, list] = {}
+                for row in self._rows[table]:
+                    index.setdefault(
+                        tuple(row[col] for col in criteria_cols), []
+                    ).append(row)
+                self._indexes[key] = index
+
+            return self._indexes[key].get(
+                tuple(cols_criteria[col] for col in criteria_cols), []
+            )
+
+    def get_col_values(
+        self, table: str, col: str, cols_criteria: Optional[dict] = None
+    ) -> list:
+        """Return all `col` values or a subset corresponding to other column values in a table."""
+        rows = self._lookup(table, cols_criteria)
+        if len(rows) == 0:
+            # the rows might have been added after the table was loaded
+            self.refresh(table)
+            rows = self._lookup(table, cols_criteria)
+
+        return [row[col] for row in rows]
+
+    def get_table(self, table: str) -> pd.DataFrame:
+        """Return a table as dataframe."""
+        with self._lock:
+            rows = self._lookup(table, None)
+            return pd.DataFrame(rows, columns=self._columns[table])
+
+
+dimension_cache = DimensionCache()
+
+
+def refresh_dimension_cache(table: Optional[str] = None) -> None:
+    """Drop a table (default: all tables) from the dimension cache, for ex.: after writing to it.
+
+    The region snapshot is checked again as well, if the regions table was written to.
+    """
+    dimension_cache.refresh(table)
+    if table is None or table == "regions":
+        invalidate_region_snapshot()
@@ -0,0 +1,107 @@
+"""Compact dtypes for the dataframes of the DB population pipeline."""
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+db_dtypes_log = logging.getLogger("db_dtypes")
+logging.basicConfig(level=logging.INFO)
+
+# store values as float32 instead of float64, to save memory at the cost of precision
+FLOAT32_VALUES = os.environ.get("FLOAT32_VALUES", "0").lower() in ("1", "true", "yes")
+
+# region codes and other repeated strings
+CATEGORICAL_COLS = [
+    "region_code",
+    "parent_region_code",
+    "reg_code",
+    "prnt_code",
+    "quality_rating",
+    "climate_experiment",
+]
+
+# foreign keys and other integer columns; downcast to the narrowest integer dtype
+INTEGER_COLS = [
+    "region_id",
+    "var_detail_id",
+    "citation_id",
+    "original_resolution_id",
+    "disaggregation_method_id",
+    "pathway_id",
+    "climate_experiment_id",
+    "year",
+    "chosen",
+]
+
+# fixed dtypes of region_data columns, so that all chunks of a query have the same dtypes
+# NOTE: nullable integers for the columns that might be NULL
+REGION_DATA_DTYPES = {
+    "region_id": "int32",
+    "var_detail_id": "int32",
+    "pathway_id": "Int32",
+    "climate_experiment_id": "Int32",
+    "year": "Int32",
+    "value": "float64",
+}
+
+
+def get_memory_usage(data_df: pd.DataFrame) -> float:
+    """Return the memory used by a dataframe in MB."""
+    return float(data_df.memory_usage(deep=True).sum()) / (1024 * 1024)
+
+
+def log_memory_report(var_name: str, memory_before: float, memory_after: float) -> None:
+    """Log the memory reduction of the data of a var."""
+    db_dtypes_log.info(
+        f"{var_name} data uses {memory_after:.2f} MB instead of {memory_before:.2f} MB "
+        f"({100 * (1 - memory_after / max(memory_before, 1e-9)):.1f}% less)"
+    )
+
+
+def optimize_dtypes(
+    data_df: pd.DataFrame,
+    var_name: Optional[str] = None,
+    float32_values: bool = FLOAT32_VALUES,
+) -> pd.DataFrame:
+    """Convert region codes to categoricals, integer columns to narrow integers and optionally values to float32.
+
+    If `var_name` is given, the memory reduction is logged for the var.
+    """
+    if var_name is not None:
+        memory_before = get_memory_usage(data_df)
+
+    data_df = data_df.copy()
+
+    for col in CATEGORICAL_COLS:
+        if col in data_df.columns and data_df[col].dtype == object:
+            data_df[col] = data_df[col].astype("category")
+
+    for col in INTEGER_COLS:
+        if col not in data_df.columns:
+            continue
+
+        # NOTE: columns with missing values (for ex.: pathway_id of non-EUCalc data) are left as is
+        if (
+            pd.api.types.is_numeric_dtype(data_df[col])
+            and not data_df[col].isna().any()
+        ):
+            values = data_df[col].values
+            if np.array_equal(values, values.astype(np.int64)):
+                data_df[col] = pd.to_numeric(
+                    values.astype(np.int64), downcast="integer"
+                )
+
+    if float32_values and "value" in data_df.columns:
+        data_df["value"] = data_df["value"].astype(np.float32)
+
+    if var_name is not None:
+        log_memory_report(var_name, memory_before, get_memory_usage(data_df))
+
+    return data_df
+
+
+def with_constant_cols(data_df: pd.DataFrame, constant_cols: dict) -> pd.DataFrame:
+    """Return `data_df` with the columns that have the same value in all rows, to be attached just before writing to the DB."""
+    return data_df.assign(**constant_cols)
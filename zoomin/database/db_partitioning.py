@@ -0,0 +1,206 @@
+"""Module to partition region_data by var_detail_id, with one partition per variable and a default partition.
+
+region_data is partitioned after the django migrations created it (see `V1ApiConfig.ready`).
+It can also be partitioned on its own, for ex.: `python db_partitioning.py`.
+"""
+import logging
+import threading
+from typing import Any, Iterable, Optional
+
+from zoomin.database.db_connection import get_load_session, with_db_connection
+
+db_partitioning_log = logging.getLogger("db_partitioning")
+logging.basicConfig(level=logging.INFO)
+
+PARTITIONED_TABLE = "region_data"
+PARTITION_KEY = "var_detail_id"
+DEFAULT_PARTITION = f"{PARTITIONED_TABLE}_default"
+
+_is_partitioned: Optional[bool] = None
+_var_partitions: set = set()
+_var_partitions_lock = threading.Lock()
+
+
+def get_partition_name(var_detail_id: int) -> str:
+    """Return the name of the partition of a variable."""
+    return f"{PARTITIONED_TABLE}_var_{var_detail_id}"
+
+
+def is_partitioned(cursor: Any, table: str = PARTITIONED_TABLE) -> bool:
+    """Return whether `table` is a partitioned table."""
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+        (table,),
+    )
+    return bool(cursor.fetchone()[0])
+
+
+def get_index_definitions(cursor: Any, table: str) -> list:
+    """Return the names and `CREATE INDEX` statements of the indexes of `table`, except the primary key."""
+    cursor.execute(
+        "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i \
+            JOIN pg_class c ON c.oid = i.indexrelid \
+            WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary",
+        (table,),
+    )
+    return list(cursor.fetchall())
+
+
+def get_foreign_key_definitions(cursor: Any, table: str) -> list:
+    """Return the names and definitions of the foreign key constraints of `table`."""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint \
+            WHERE conrelid = to_regclass(%s) AND contype = 'f' AND conparentid = 0",
+        (table,),
+    )
+    return list(cursor.fetchall())
+
+
+def get_var_partitions(cursor: Any) -> set:
+    """Return the var_detail_ids having their own partition."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid \
+            WHERE i.inhparent = to_regclass(%s)",
+        (PARTITIONED_TABLE,),
+    )
+    prefix = f"{PARTITIONED_TABLE}_var_"
+
+    return {
+        int(name[len(prefix) :])
+        for (name,) in cursor.fetchall()
+        if name.startswith(prefix)
+    }
+
+
+def _create_var_partition(cursor: Any, var_detail_id: int) -> None:
+    """Create the partition of a variable, moving its rows out of the default partition."""
+    partition = get_partition_name(var_detail_id)
+
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {PARTITION_KEY} = %s)",
+        (var_detail_id,),
+    )
+    if cursor.fetchone()[0]:
+        # NOTE: a partition can not be created while the default partition holds rows of it
+        cursor.execute(
+            f"CREATE TABLE {partition} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {PARTITION_KEY} = %s RETURNING *) \
+                INSERT INTO {partition} SELECT * FROM moved",
+            (var_detail_id,),
+        )
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {partition} FOR VALUES IN ({int(var_detail_id)})"
+        )
+    else:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {PARTITIONED_TABLE} \
+                FOR VALUES IN ({int(var_detail_id)})"
+        )
+
+
+@with_db_connection(in_session=False)
+def add_var_partitions(cursor: Any, var_detail_ids: Iterable) -> None:
+    """Create the partitions of the variables that do not have one yet. Does nothing if region_data is not partitioned.
+
+    NOTE: creating a partition locks the default partition, and would wait for the
+    locks a load session of the same thread holds on region_data. Within a load
+    session, nothing is created; the partitions have to be created before the
+    session (see `process_and_add_input_data`). Rows of vars without a partition
+    are added to the default partition.
+    """
+    global _is_partitioned  # pylint: disable=global-statement
+
+    if get_load_session() is not None:
+        db_partitioning_log.debug(
+            "partitions are not created within a load session, they are created before it"
+        )
+        return
+
+    with _var_partitions_lock:
+        if _is_partitioned is None:
+            _is_partitioned = is_partitioned(cursor)
+            if _is_partitioned:
+                _var_partitions.update(get_var_partitions(cursor))
+
+        if not _is_partitioned:
+            return
+
+        new_var_detail_ids = set(int(_id) for _id in var_detail_ids) - _var_partitions
+        for var_detail_id in new_var_detail_ids:
+            _create_var_partition(cursor, var_detail_id)
+
+        # NOTE: updated once all partitions are created, as a failure rolls back all of them
+        _var_partitions.update(new_var_detail_ids)
+
+
+def partition_region_data_table(cursor: Any) -> None:
+    """Convert region_data into a table partitioned by var_detail_id, with the given cursor.
+
+    The indexes, foreign keys and rows of the table are kept. As the primary key of a
+    partitioned table has to include the partition key, it becomes (id, var_detail_id).
+    """
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (PARTITIONED_TABLE,))
+    if not cursor.fetchone()[0]:
+        db_partitioning_log.info(f"{PARTITIONED_TABLE} does not exist (yet)")
+        return
+
+    if is_partitioned(cursor):
+        db_partitioning_log.info(f"{PARTITIONED_TABLE} is partitioned already")
+        return
+
+    old_table = f"{PARTITIONED_TABLE}_unpartitioned"
+    index_definitions = get_index_definitions(cursor, PARTITIONED_TABLE)
+    foreign_key_definitions = get_foreign_key_definitions(cursor, PARTITIONED_TABLE)
+
+    cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {old_table}")
+    # NOTE: without identity, as identity columns of partitioned tables are not supported by all postgres versions
+    cursor.execute(
+        f"CREATE TABLE {PARTITIONED_TABLE} (LIKE {old_table} INCLUDING CONSTRAINTS) \
+            PARTITION BY LIST ({PARTITION_KEY})"
+    )
+    cursor.execute(
+        f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} DEFAULT"
+    )
+
+    cursor.execute(f"SELECT DISTINCT {PARTITION_KEY} FROM {old_table}")
+    for (var_detail_id,) in cursor.fetchall():
+        _create_var_partition(cursor, var_detail_id)
+
+    cursor.execute(f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {old_table}")
+    cursor.execute(f"DROP TABLE {old_table}")
+
+    # the names of the sequence, constraints and indexes are free again
+    cursor.execute(
+        f"CREATE SEQUENCE {PARTITIONED_TABLE}_id_seq OWNED BY {PARTITIONED_TABLE}.id"
+    )
+    cursor.execute(
+        f"ALTER TABLE {PARTITIONED_TABLE} ALTER COLUMN id SET DEFAULT nextval('{PARTITIONED_TABLE}_id_seq')"
+    )
+    cursor.execute(
+        f"SELECT setval('{PARTITIONED_TABLE}_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM {PARTITIONED_TABLE}"
+    )
+    cursor.execute(
+        f"ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {PARTITIONED_TABLE}_pkey PRIMARY KEY (id, {PARTITION_KEY})"
+    )
+    for _, index_definition in index_definitions:
+        cursor.execute(index_definition)
+    for name, foreign_key_definition in foreign_key_definitions:
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {name} {foreign_key_definition}"
+        )
+
+    cursor.execute(f"ANALYZE {PARTITIONED_TABLE}")
+    db_partitioning_log.info(f"{PARTITIONED_TABLE} partitioned by {PARTITION_KEY}")
+
+
+@with_db_connection()
+def partition_region_data(cursor: Any) -> None:
+    """Convert region_data into a table partitioned by var_detail_id, see `partition_region_data_table`."""
+    partition_region_data_table(cursor)
+
+
+if __name__ == "__main__":
+
+    partition_region_data()
@@ -0,0 +1,420 @@
+"""PostgreSQL binary COPY (PGCOPY) encoder, packing dataframe columns straight from NumPy arrays."""
+import struct
+from io import BytesIO
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+# big-endian binary representation of the supported fixed width column types
+PG_BINARY_DTYPES = {
+    "smallint": ">i2",
+    "integer": ">i4",
+    "bigint": ">i8",
+    "real": ">f4",
+    "double precision": ">f8",
+    "boolean": "?",
+}
+PG_TEXT_TYPES = {"text", "character varying", "character"}
+PG_STRUCT_FORMATS = {
+    "smallint": ">h",
+    "integer": ">i",
+    "bigint": ">q",
+    "real": ">f",
+    "double precision": ">d",
+    "boolean": "?",
+}
+
+# data types of the result columns of a query, by type OID
+PG_TYPE_OIDS = {
+    16: "boolean",
+    20: "bigint",
+    21: "smallint",
+    23: "integer",
+    700: "real",
+    701: "double precision",
+    25: "text",
+    1042: "character",
+    1043: "character varying",
+}
+NULL_BITS_COL = "null_bits__"
+CSV_NULL = "\\N"  # NULL of a CSV COPY; empty strings are quoted
+
+ROWS_PER_CHUNK = 100000  # rows encoded at once
+COPY_CHUNK_SIZE = 8 * 1024 * 1024  # bytes sent to the DB server at once
+
+_column_types: Dict[str, dict] = {}
+
+
+def get_column_types(cursor: Any, table: str, cache: bool = True) -> dict:
+    """Return the data types of the columns of a table, looked up once per process if `cache`."""
+    if table not in _column_types or not cache:
+        cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s",
+            (table,),
+        )
+        column_types = dict(cursor.fetchall())
+        if not cache:
+            return column_types
+        _column_types[table] = column_types
+
+    return _column_types[table]
+
+
+def _scatter(out: np.ndarray, starts: np.ndarray, field_bytes: np.ndarray) -> None:
+    """Write the rows of `field_bytes` (n, k) to `out` at the byte offsets `starts` (n)."""
+    for j in range(field_bytes.shape[1]):
+        out[starts + j] = field_bytes[:, j]
+
+
+def _encode_field(series: pd.Series, pg_type: str) -> tuple:
+    """Return the null mask, the data size per row and the data (fixed width array or text blob) of a column."""
+    is_null = series.isna().values
+
+    if pg_type in PG_TEXT_TYPES and isinstance(series.dtype, pd.CategoricalDtype):
+        # encode each category once and pick the bytes of each row by its code
+        encoded = [str(val).encode("utf-8") for val in series.cat.categories]
+        category_sizes = np.array([len(val) for val in encoded], dtype=np.int64)
+        padded = np.zeros((len(encoded), max(category_sizes, default=0)), np.uint8)
+        for i, val in enumerate(encoded):
+            padded[i, : len(val)] = np.frombuffer(val, dtype=np.uint8)
+
+        codes = series.cat.codes.values[~is_null]
+        sizes = np.zeros(len(series), dtype=np.int64)
+        sizes[~is_null] = category_sizes[codes]
+        in_text = np.arange(padded.shape[1]) < category_sizes[codes][:, None]
+        return is_null, sizes, padded[codes][in_text]
+
+    if pg_type in PG_TEXT_TYPES:
+        encoded = [
+            b"" if null else str(val).encode("utf-8")
+            for val, null in zip(series.values, is_null)
+        ]
+        sizes = np.fromiter(
+            (len(val) for val in encoded), dtype=np.int64, count=len(encoded)
+        )
+        return is_null, sizes, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    if pg_type not in PG_BINARY_DTYPES:
+        raise ValueError(f"binary COPY of columns of type {pg_type} is not supported")
+
+    dtype = np.dtype(PG_BINARY_DTYPES[pg_type])
+    values = series.to_numpy()
+    if is_null.any():
+        values = np.where(is_null, 0, values)
+    field_bytes = (
+        values.astype(dtype).view(np.uint8).reshape(len(values), dtype.itemsize)
+    )
+
+    sizes = np.where(is_null, 0, dtype.itemsize)
+    return is_null, sizes, field_bytes
+
+
+def encode_pgcopy_rows(data_df: pd.DataFrame, pg_types: list) -> np.ndarray:
+    """Encode the rows of `data_df` as PGCOPY tuples (without header and trailer).
+
+    `pg_types` are the data types of the target columns, in the order of the columns of `data_df`.
+    """
+    n_rows = len(data_df)
+    fields = [
+        _encode_field(data_df[col], pg_type)
+        for col, pg_type in zip(data_df.columns, pg_types)
+    ]
+
+    # each tuple: field count (int16), then per field its size (int32, -1 for NULL) and data
+    row_sizes = 2 + sum(4 + sizes for _, sizes, _ in fields)
+    row_starts = np.cumsum(row_sizes) - row_sizes
+    out = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+
+    field_count = np.full(n_rows, len(fields), dtype=">i2")
+    _scatter(out, row_starts, field_count.view(np.uint8).reshape(n_rows, 2))
+
+    offsets = row_starts + 2
+    for (is_null, sizes, data), pg_type in zip(fields, pg_types):
+        size_prefix = np.where(is_null, -1, sizes).astype(">i4")
+        _scatter(out, offsets, size_prefix.view(np.uint8).reshape(n_rows, 4))
+        offsets = offsets + 4
+
+        if pg_type in PG_TEXT_TYPES:
+            # position of each byte of the text blob in the output
+            n_bytes = len(data)
+            if n_bytes > 0:
+                within = np.arange(n_bytes) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+                out[np.repeat(offsets, sizes) + within] = data
+        else:
+            not_null = ~is_null
+            _scatter(out, offsets[not_null], data[not_null])
+
+        offsets = offsets + sizes
+
+    return out
+
+
+def iter_pgcopy_chunks(
+    data_df: pd.DataFrame, pg_types: list, rows_per_chunk: int = ROWS_PER_CHUNK
+) -> Iterator[bytes]:
+    """Encode `data_df` as a PGCOPY stream, `rows_per_chunk` rows at a time."""
+    yield PGCOPY_HEADER
+    for start in range(0, len(data_df), rows_per_chunk):
+        yield encode_pgcopy_rows(
+            data_df.iloc[start : start + rows_per_chunk], pg_types
+        ).tobytes()
+    yield PGCOPY_TRAILER
+
+
+class _ChunkReader:
+    """File-like object reading from an iterator of byte chunks, as required by `copy_expert`."""
+
+    def __init__(self, chunks: Iterable) -> None:
+        """Initialize."""
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def read(self, size: int = -1) -> bytes:
+        """Return up to `size` bytes; an empty bytes object once all chunks are read."""
+        while len(self._buffer) == 0:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return b""
+
+        if size is None or size < 0:
+            size = len(self._buffer)
+
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data.tobytes()
+
+
+def copy_to_table(
+    cursor: Any,
+    table: str,
+    data_df: pd.DataFrame,
+    rows_per_chunk: int = ROWS_PER_CHUNK,
+    chunk_size: int = COPY_CHUNK_SIZE,
+    column_types: Optional[dict] = None,
+) -> None:
+    """Add the rows of `data_df` to `table` with a binary COPY, streamed in chunks of `chunk_size` bytes.
+
+    `column_types` default to the looked up data types of the columns of `table`.
+    """
+    if column_types is None:
+        column_types = get_column_types(cursor, table)
+
+    missing_cols = set(data_df.columns) - set(column_types)
+    if len(missing_cols) > 0:
+        raise ValueError(f"the columns {sorted(missing_cols)} do not exist in {table}")
+
+    pg_types = [column_types[col] for col in data_df.columns]
+    columns = ", ".join(data_df.columns)
+
+    cursor.copy_expert(
+        sql=f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT BINARY)",
+        file=_ChunkReader(iter_pgcopy_chunks(data_df, pg_types, rows_per_chunk)),
+        size=chunk_size,
+    )
+
+
+def _check_header(data: bytes) -> int:
+    """Return the position of the first tuple of a PGCOPY stream."""
+    if data[: len(PGCOPY_HEADER) - 8] != PGCOPY_HEADER[:-8]:
+        raise ValueError("not a binary COPY stream")
+    (header_ext_len,) = struct.unpack_from(">i", data, len(PGCOPY_HEADER) - 4)
+
+    return len(PGCOPY_HEADER) + int(header_ext_len)
+
+
+def decode_pgcopy_fixed(data: bytes, pg_types: list) -> list:
+    """Decode a PGCOPY stream of fixed width, non NULL columns into one NumPy array per column.
+
+    As all tuples have the same size, the stream is viewed as a 2D array of bytes
+    and each column is read straight from it.
+    """
+    pos = _check_header(data)
+    dtypes = [np.dtype(PG_BINARY_DTYPES[pg_type]) for pg_type in pg_types]
+    row_size = 2 + sum(4 + dtype.itemsize for dtype in dtypes)
+
+    n_bytes = len(data) - len(PGCOPY_TRAILER) - pos
+    if n_bytes % row_size != 0 or data[-len(PGCOPY_TRAILER) :] != PGCOPY_TRAILER:
+        raise ValueError("the binary COPY stream does not hold fixed width tuples")
+
+    rows = np.frombuffer(data, dtype=np.uint8, offset=pos, count=n_bytes).reshape(
+        -1, row_size
+    )
+
+    # every tuple must start with the field count and hold the field sizes at the same offsets
+    expected = [np.frombuffer(struct.pack(">h", len(dtypes)), dtype=np.uint8)]
+    offsets = [0]
+    offset = 2
+    cols = []
+    for dtype in dtypes:
+        expected.append(np.frombuffer(struct.pack(">i", dtype.itemsize), np.uint8))
+        offsets.append(offset)
+        offset += 4
+        cols.append(
+            rows[:, offset : offset + dtype.itemsize]
+            .copy()
+            .view(dtype)[:, 0]
+            .astype(dtype.newbyteorder("="))
+        )
+        offset += dtype.itemsize
+
+    for expected_bytes, offset in zip(expected, offsets):
+        if not (rows[:, offset : offset + len(expected_bytes)] == expected_bytes).all():
+            raise ValueError("the binary COPY stream does not hold fixed width tuples")
+
+    return cols
+
+
+def decode_pgcopy_rows(data: bytes, pg_types: list) -> list:
+    """Decode a PGCOPY stream of any supported columns into one list of values (None for NULL) per column."""
+    pos = _check_header(data)
+    formats = [PG_STRUCT_FORMATS.get(pg_type) for pg_type in pg_types]
+    cols: list = [[] for _ in pg_types]
+
+    while True:
+        (n_fields,) = struct.unpack_from(">h", data, pos)
+        pos += 2
+        if n_fields == -1:
+            break
+
+        for col, fmt in zip(cols, formats):
+            (size,) = struct.unpack_from(">i", data, pos)
+            pos += 4
+            if size == -1:
+                col.append(None)
+            elif fmt is None:
+                col.append(data[pos : pos + size].decode("utf-8"))
+            else:
+                col.append(struct.unpack_from(fmt, data, pos)[0])
+            pos += max(size, 0)
+
+    return cols
+
+
+def _get_query_columns(cursor: Any, sql_cmd: str) -> tuple:
+    """Return the names and data types of the result columns of a query."""
+    cursor.execute(f"SELECT * FROM ({sql_cmd}) q LIMIT 0")
+    columns = [desc[0] for desc in cursor.description]
+    pg_types = [PG_TYPE_OIDS.get(desc[1]) for desc in cursor.description]
+
+    unsupported = [col for col, pg_type in zip(columns, pg_types) if pg_type is None]
+    if len(unsupported) > 0:
+        raise ValueError(f"binary COPY of the columns {unsupported} is not supported")
+
+    return columns, pg_types
+
+
+def _copy_query(cursor: Any, sql_cmd: str) -> bytes:
+    buffer = BytesIO()
+    cursor.copy_expert(
+        sql=f"COPY ({sql_cmd}) TO STDOUT WITH (FORMAT BINARY)", file=buffer
+    )
+
+    return buffer.getvalue()
+
+
+def _read_query_csv(
+    cursor: Any, sql_cmd: str, columns: list, pg_types: list
+) -> pd.DataFrame:
+    """Return the result of a query as dataframe, read with a CSV COPY and the C parser of pandas.
+
+    As the values are parsed from text, as with `pd.read_sql_query`, they are the
+    same. Text columns are object columns with None for NULL.
+
+    NOTE: a text value equal to `CSV_NULL` is read as NULL.
+    """
+    buffer = BytesIO()
+    cursor.copy_expert(
+        sql=f"COPY ({sql_cmd}) TO STDOUT WITH (FORMAT CSV, NULL '{CSV_NULL}')",
+        file=buffer,
+    )
+    if buffer.tell() == 0:
+        return pd.DataFrame(columns=columns)
+    buffer.seek(0)
+
+    object_cols = [
+        i
+        for i, pg_type in enumerate(pg_types)
+        if pg_type in PG_TEXT_TYPES or pg_type == "boolean"
+    ]
+    # NOTE: the columns are read by position, as a query may return several columns of the same name
+    csv_df = pd.read_csv(
+        buffer,
+        header=None,
+        dtype={i: object for i in object_cols},
+        na_values=[CSV_NULL],
+        keep_default_na=False,
+        float_precision="round_trip",
+        encoding="utf-8",
+    )
+    cols = [csv_df[i].to_numpy() for i in range(len(columns))]
+    for i in object_cols:
+        values = csv_df[i]
+        is_null = values.isna().to_numpy()
+        if pg_types[i] == "boolean":
+            values = values.map({"t": True, "f": False})
+        cols[i] = np.array(values, dtype=object)
+        cols[i][is_null] = None
+        if pg_types[i] == "boolean" and not is_null.any():
+            cols[i] = cols[i].astype(bool)
+
+    return pd.DataFrame(dict(zip(columns, cols)), columns=columns)
+
+
+def copy_from_query(cursor: Any, sql_cmd: str) -> pd.DataFrame:
+    """Return the result of a query as dataframe, read with a binary COPY.
+
+    If all columns have fixed width types, NULLs are replaced in the query and
+    reported as bits of one extra column, so that all tuples have the same size
+    and are decoded without a loop over the rows. As with `pd.read_sql_query`, integer
+    and float columns are int64 and float64, and integer and boolean columns with
+    NULLs become float and object columns.
+
+    Results with text columns are read with a CSV COPY instead, see `_read_query_csv`,
+    as the tuples of a binary COPY of variable width columns can only be decoded
+    one after the other.
+    """
+    columns, pg_types = _get_query_columns(cursor, sql_cmd)
+
+    if any(pg_type in PG_TEXT_TYPES for pg_type in pg_types) or len(columns) > 63:
+        return _read_query_csv(cursor, sql_cmd, columns, pg_types)
+
+    quoted_cols = [f'q."{col}"' for col in columns]
+    # NOTE: cast back, as COALESCE with the literal 0 widens smallint columns to integer
+    select_cols = [
+        f"COALESCE({col}, {'false' if pg_type == 'boolean' else 0})::{pg_type}"
+        for col, pg_type in zip(quoted_cols, pg_types)
+    ]
+    null_bits = " | ".join(
+        [f"(({col} IS NULL)::int::bigint << {i})" for i, col in enumerate(quoted_cols)]
+    )
+    data = _copy_query(
+        cursor,
+        f"SELECT {', '.join(select_cols)}, {null_bits} AS {NULL_BITS_COL} FROM ({sql_cmd}) q",
+    )
+    *cols, null_bits_col = decode_pgcopy_fixed(data, pg_types + ["bigint"])
+    # widened to int64 and float64, as returned by `pd.read_sql_query`
+    cols = [
+        values.astype(np.int64, copy=False)
+        if values.dtype.kind == "i"
+        else values.astype(np.float64, copy=False)
+        if values.dtype.kind == "f"
+        else values
+        for values in cols
+    ]
+
+    data_df = pd.DataFrame(dict(zip(columns, cols)), columns=columns, copy=False)
+    for i, col in enumerate(columns):
+        is_null = (null_bits_col >> i) & 1 == 1
+        if is_null.any():
+            values = data_df[col].astype(
+                "float64" if pg_types[i] != "boolean" else object
+            )
+            values[is_null] = np.nan if pg_types[i] != "boolean" else None
+            data_df[col] = values
+
+    return data_df
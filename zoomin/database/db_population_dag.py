@@ -0,0 +1,136 @@
+"""Dependency graph of the DB population jobs, so that proxies are added before the vars disaggregated with them."""
+import logging
+from typing import Dict, Optional
+
+import pandas as pd
+
+from zoomin.database.db_scheduler import (
+    N_WORKERS,
+    estimate_input_data_memory,
+    run_jobs,
+)
+from zoomin.database.db_access_with_calculations import process_and_add_input_data
+from zoomin.disaggregation.proxy_expression import compile_proxy_expression
+
+db_population_dag_log = logging.getLogger("db_population_dag")
+logging.basicConfig(level=logging.INFO)
+
+
+def get_job_dependencies(values: tuple) -> list:
+    """Return the vars that must be in the DB before a job (var_name, on_the_fly_calculation, proxy, post_calculation, data_year) can run."""
+    _, on_the_fly_calculation, proxy, post_calculation, _ = values
+
+    # NOTE: on_the_fly_calculation is done on API side, nothing is added to the DB
+    if isinstance(on_the_fly_calculation, str):
+        return []
+
+    if isinstance(proxy, str):
+        return compile_proxy_expression(proxy).var_names
+
+    # a combination of other vars, for ex.: "var a+var b"
+    if (
+        isinstance(post_calculation, str)
+        and post_calculation != "same value all regions"
+    ):
+        return compile_proxy_expression(post_calculation).var_names
+
+    return []
+
+
+def build_population_dag(jobs: list) -> list:
+    """Return the jobs grouped into levels; the jobs of a level only depend on vars of previous levels.
+
+    Dependencies on vars without a job are assumed to be in the DB already.
+    """
+    job_var_names = {values[0] for values in jobs}
+
+    dependencies: Dict[str, set] = {}
+    for values in jobs:
+        var_dependencies = set(get_job_dependencies(values)) - {values[0]}
+
+        missing = var_dependencies - job_var_names
+        if len(missing) > 0:
+            db_population_dag_log.info(
+                f"{values[0]} depends on {sorted(missing)}, which are assumed to be in the DB already"
+            )
+
+        dependencies[values[0]] = dependencies.get(values[0], set()) | (
+            var_dependencies & job_var_names
+        )
+
+    # Kahn's algorithm; a var is added at the level after its last dependency
+    levels = []
+    done: set = set()
+    remaining = dict(dependencies)
+    while len(remaining) > 0:
+        level_var_names = {
+            var_name for var_name, deps in remaining.items() if deps <= done
+        }
+        if len(level_var_names) == 0:
+            raise ValueError(
+                f"circular dependencies between the vars {sorted(remaining)}"
+            )
+
+        levels.append([values for values in jobs if values[0] in level_var_names])
+        done = done | level_var_names
+        for var_name in level_var_names:
+            del remaining[var_name]
+
+    return levels
+
+
+def run_population_dag(
+    jobs: list,
+    memory_budget_mb: Optional[float] = None,
+    n_workers: int = N_WORKERS,
+) -> pd.DataFrame:
+    """Run `process_and_add_input_data` on each of the `jobs`, level by level.
+
+    The jobs of a level run concurrently with memory-aware scheduling. Jobs that
+    depend on a var whose job failed are skipped.
+
+    Returns the report of all jobs, with the level they ran at.
+    """
+    levels = build_population_dag(jobs)
+    db_population_dag_log.info(
+        f"populating {len(jobs)} jobs in {len(levels)} dependency levels"
+    )
+
+    level_reports = []
+    failed: set = set()
+    for level, level_jobs in enumerate(levels):
+        runnable_jobs = []
+        for values in level_jobs:
+            failed_dependencies = set(get_job_dependencies(values)) & failed
+            if len(failed_dependencies) > 0:
+                db_population_dag_log.error(
+                    f"skipping {values[0]} as {sorted(failed_dependencies)} failed"
+                )
+                failed.add(values[0])
+            else:
+                runnable_jobs.append(values)
+
+        if len(runnable_jobs) == 0:
+            continue
+
+        db_population_dag_log.info(
+            f"level {level}: {sorted({values[0] for values in runnable_jobs})}"
+        )
+        level_report = run_jobs(
+            process_and_add_input_data,
+            runnable_jobs,
+            estimate_input_data_memory,
+            memory_budget_mb=memory_budget_mb,
+            n_workers=n_workers,
+        )
+        level_report["level"] = level
+        level_reports.append(level_report)
+
+        failed = failed | set(
+            level_report.loc[level_report["failed"], "var_name"].values
+        )
+
+    if len(level_reports) == 0:
+        return pd.DataFrame()
+
+    return pd.concat(level_reports, ignore_index=True)
@@ -0,0 +1,226 @@
+"""Population mode: load the data tables without index and foreign key maintenance, then rebuild them once.
+
+While in population mode, the non primary key indexes and the foreign key constraints of
+the data tables are dropped. Their definitions are recorded in a file first, so that they
+can be rebuilt even if the population was interrupted, for ex.:
+`python db_population_mode.py start` ... `python db_population_mode.py finish`
+"""
+import os
+import re
+import sys
+import json
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+
+from zoomin.database.db_connection import (
+    db_host,
+    db_name,
+    db_port,
+    with_db_connection,
+)
+from zoomin.database.db_partitioning import (
+    get_index_definitions,
+    get_foreign_key_definitions,
+)
+
+db_population_mode_log = logging.getLogger("db_population_mode")
+logging.basicConfig(level=logging.INFO)
+
+POPULATION_MODE_TABLES = ["region_data", "proxy_metrics"]
+
+# directory of the recorded definitions, one file per DB
+POPULATION_MODE_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "output"
+)
+
+# number of indexes built at the same time, each on its own connection
+INDEX_BUILD_WORKERS = int(os.environ.get("INDEX_BUILD_WORKERS", 4))
+# memory the DB server may use for all index builds together, shared by the workers
+INDEX_BUILD_MEMORY_MB = int(os.environ.get("INDEX_BUILD_MEMORY_MB", 2048))
+
+
+def get_population_mode_path() -> str:
+    """Return the path of the file with the recorded definitions of the DB (DB_HOST, DB_PORT and DB_NAME)."""
+    db_key = re.sub(r"[^\w.-]", "_", f"{db_host}_{db_port}_{db_name}")
+
+    return os.path.join(POPULATION_MODE_DIR, f"population_mode_{db_key}.json")
+
+
+def get_recorded_definitions() -> dict:
+    """Return the recorded index and foreign key definitions, empty if not in population mode."""
+    path = get_population_mode_path()
+    if not os.path.isfile(path):
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        definitions: dict = json.load(f)
+
+    return definitions
+
+
+def _record_definitions(definitions: dict) -> None:
+    path = get_population_mode_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write to a temporary file first, so that an interruption never leaves a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(definitions, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+@with_db_connection()
+def _get_definitions(cursor: Any, tables: list) -> dict:
+    return {
+        table: {
+            "indexes": get_index_definitions(cursor, table),
+            "foreign_keys": get_foreign_key_definitions(cursor, table),
+        }
+        for table in tables
+    }
+
+
+@with_db_connection()
+def _drop_indexes_and_foreign_keys(cursor: Any, definitions: dict) -> bool:
+    for table, table_definitions in definitions.items():
+        for name, _ in table_definitions["foreign_keys"]:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+        for name, _ in table_definitions["indexes"]:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    return True
+
+
+def start_population_mode(tables: list = POPULATION_MODE_TABLES) -> None:
+    """Record and drop the non primary key indexes and the foreign keys of `tables`.
+
+    If the recorded definitions of an interrupted population exist, they are kept,
+    as the DB does not hold all of them anymore.
+    """
+    definitions = get_recorded_definitions()
+
+    if len(definitions) > 0:
+        db_population_mode_log.info(
+            "population mode was not finished, keeping the recorded definitions"
+        )
+    else:
+        definitions = _get_definitions(tables)
+        if definitions is None:
+            raise ValueError("the index and foreign key definitions could not be read")
+        _record_definitions(definitions)
+
+    if _drop_indexes_and_foreign_keys(definitions) is None:
+        raise ValueError("the indexes and foreign keys could not be dropped")
+
+    db_population_mode_log.info(f"population mode started for {list(definitions)}")
+
+
+@with_db_connection()
+def _create_index(
+    cursor: Any, index_definition: str, maintenance_work_mem_mb: int
+) -> bool:
+    """Create an index, unless it exists. Returns None if it failed.
+
+    NOTE: the definitions of the indexes of partitioned tables read `ON ONLY`, which
+    creates an invalid index of the partitioned table alone. The index is created on
+    the partitioned table and all its partitions instead.
+    """
+    index_definition = index_definition.replace(" INDEX ", " INDEX IF NOT EXISTS ", 1)
+    index_definition = index_definition.replace(" ON ONLY ", " ON ", 1)
+
+    cursor.execute(f"SET maintenance_work_mem = '{maintenance_work_mem_mb}MB'")
+    cursor.execute(index_definition)
+
+    return True
+
+
+@with_db_connection()
+def _add_foreign_keys_and_analyze(cursor: Any, definitions: dict) -> bool:
+    """Add the foreign keys that do not exist, and update the statistics of the tables."""
+    for table, table_definitions in definitions.items():
+        for name, foreign_key_definition in table_definitions["foreign_keys"]:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s)",
+                (table, name),
+            )
+            if not cursor.fetchone()[0]:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {name} {foreign_key_definition}"
+                )
+
+        cursor.execute(f"ANALYZE {table}")
+
+    return True
+
+
+def finish_population_mode(n_workers: int = INDEX_BUILD_WORKERS) -> None:
+    """Rebuild the recorded indexes in parallel, add the recorded foreign keys and analyze the tables.
+
+    The recorded definitions are removed only once everything is rebuilt, so that
+    this can be run again after an interruption.
+    """
+    definitions = get_recorded_definitions()
+    if len(definitions) == 0:
+        db_population_mode_log.info("not in population mode")
+        return
+
+    index_definitions = [
+        index_definition
+        for table_definitions in definitions.values()
+        for _, index_definition in table_definitions["indexes"]
+    ]
+    n_workers = max(min(n_workers, len(index_definitions)), 1)
+    maintenance_work_mem_mb = max(INDEX_BUILD_MEMORY_MB // n_workers, 64)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(
+            executor.map(
+                lambda index_definition: _create_index(
+                    index_definition, maintenance_work_mem_mb
+                ),
+                index_definitions,
+            )
+        )
+
+    n_failed = sum(result is None for result in results)
+    if n_failed > 0:
+        raise ValueError(
+            f"{n_failed} of {len(index_definitions)} indexes could not be rebuilt, run finish_population_mode() again"
+        )
+
+    if _add_foreign_keys_and_analyze(definitions) is None:
+        raise ValueError(
+            "the foreign keys could not be added, run finish_population_mode() again"
+        )
+
+    os.remove(get_population_mode_path())
+    db_population_mode_log.info(f"population mode finished for {list(definitions)}")
+
+
+@contextmanager
+def population_mode(
+    tables: list = POPULATION_MODE_TABLES, n_workers: int = INDEX_BUILD_WORKERS
+) -> Iterator[None]:
+    """Load data within this context without index and foreign key maintenance on `tables`.
+
+    NOTE: upserts (`load_mode="upsert"`) are slower within this context, as they look up
+    the existing rows without indexes.
+    """
+    start_population_mode(tables)
+    try:
+        yield
+    finally:
+        finish_population_mode(n_workers)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ("start", "finish"):
+        raise ValueError("usage: python db_population_mode.py start|finish")
+
+    if sys.argv[1] == "start":
+        start_population_mode()
+    else:
+        finish_population_mode()
@@ -0,0 +1,150 @@
+"""Query layer with bound parameters, array binding and server-side prepared statements, instead of SQL built from f-strings."""
+import re
+import weakref
+import hashlib
+import threading
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# names of the statements prepared on each connection; dropped with the connection
+_prepared_statements: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_prepared_statements_lock = threading.Lock()
+
+
+def check_identifier(name: str) -> str:
+    """Return `name` if it is a valid table or column name, as those can not be bound as parameters."""
+    if not isinstance(name, str) or _IDENTIFIER.match(name) is None:
+        raise ValueError(f"invalid table or column name {name}")
+
+    return name
+
+
+def to_param(val: Any) -> Any:
+    """Return a value that can be bound as parameter; arrays become lists, NumPy scalars Python scalars."""
+    if isinstance(val, (np.ndarray, pd.Series, pd.Index)):
+        return np.asarray(val).tolist()
+    if isinstance(val, (list, tuple, set)):
+        return [to_param(_val) for _val in val]
+    if isinstance(val, np.generic):
+        return val.item()
+
+    return val
+
+
+def build_where_clause(cols_criteria: dict) -> tuple:
+    """Return a WHERE clause with placeholders and its parameters.
+
+    Lists, tuples and arrays are bound as one array (`= ANY(%s)`), so that the
+    statement has the same size no matter how many values are matched.
+    """
+    conditions = []
+    params = []
+    for key, val in cols_criteria.items():
+        check_identifier(key)
+        val = to_param(val)
+
+        if val is None:
+            conditions.append(f"{key} IS NULL")
+        elif isinstance(val, list):
+            conditions.append(f"{key} = ANY(%s)")
+            params.append(val)
+        else:
+            conditions.append(f"{key} = %s")
+            params.append(val)
+
+    return " AND ".join(conditions), params
+
+
+def _to_positional(sql_cmd: str) -> str:
+    """Replace the `%s` placeholders of a query by the positional parameters ($1, $2, ...) of prepared statements."""
+    parts = sql_cmd.replace("%%", "\0").split("%s")
+
+    positional_sql_cmd = parts[0]
+    for i, part in enumerate(parts[1:], start=1):
+        positional_sql_cmd = f"{positional_sql_cmd}${i}{part}"
+
+    return positional_sql_cmd.replace("\0", "%")
+
+
+def execute(
+    cursor: Any, sql_cmd: str, params: Optional[list] = None, prepare: bool = False
+) -> None:
+    """Execute a query with `%s` placeholders bound to `params`.
+
+    If `prepare`, the query is prepared on the server once per connection and
+    executed by name afterwards, so that its plan is reused instead of planned
+    on every call.
+
+    NOTE: psycopg2 binds parameters on the client, i.e. the values are still sent
+    as part of the statement; only prepared statements are planned once.
+    """
+    params = [] if params is None else [to_param(param) for param in params]
+
+    if not prepare:
+        cursor.execute(sql_cmd, params)
+        return
+
+    connection = cursor.connection
+    name = f"zoomin_{hashlib.sha1(sql_cmd.encode('utf-8')).hexdigest()[:16]}"
+    with _prepared_statements_lock:
+        prepared = _prepared_statements.setdefault(connection, set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {_to_positional(sql_cmd)}")
+            prepared.add(name)
+
+    if len(params) > 0:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+def select_col_values(
+    cursor: Any,
+    table: str,
+    col: str,
+    cols_criteria: Optional[dict] = None,
+    prepare: bool = True,
+) -> list:
+    """Return all `col` values or a subset corresponding to other column values in a table."""
+    sql_cmd = f"SELECT {check_identifier(col)} FROM {check_identifier(table)}"
+    params: list = []
+
+    if cols_criteria is not None and len(cols_criteria) > 0:
+        where_clause, params = build_where_clause(cols_criteria)
+        sql_cmd = f"{sql_cmd} WHERE {where_clause}"
+
+    execute(cursor, sql_cmd, params, prepare=prepare)
+
+    return [res[0] for res in cursor.fetchall()]
+
+
+def update_col_values(
+    cursor: Any, table: str, col_values: dict, cols_criteria: Optional[dict] = None
+) -> None:
+    """Set `col_values` in a table, in the rows corresponding to other column values."""
+    set_clause = ", ".join([f"{check_identifier(key)} = %s" for key in col_values])
+    sql_cmd = f"UPDATE {check_identifier(table)} SET {set_clause}"
+    params = list(col_values.values())
+
+    if cols_criteria is not None and len(cols_criteria) > 0:
+        where_clause, where_params = build_where_clause(cols_criteria)
+        sql_cmd = f"{sql_cmd} WHERE {where_clause}"
+        params.extend(where_params)
+
+    execute(cursor, sql_cmd, params)
+
+
+def insert_row(cursor: Any, table: str, row: dict) -> None:
+    """Add a row, given as dict of column values, to a table."""
+    cols = ", ".join([check_identifier(col) for col in row])
+    placeholders = ", ".join(["%s"] * len(row))
+
+    execute(
+        cursor,
+        f"INSERT INTO {check_identifier(table)} ({cols}) VALUES ({placeholders})",
+        list(row.values()),
+    )
@@ -0,0 +1,186 @@
+"""Snapshot of the regions table as memory-mapped `.npy` columns, to filter regions in memory instead of querying the DB."""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from zoomin.database.db_connection import db_name, with_db_connection
+
+db_region_snapshot_log = logging.getLogger("db_region_snapshot")
+logging.basicConfig(level=logging.INFO)
+
+REGION_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "output", "region_snapshots"
+)
+
+# seconds after which the version of the regions table is checked again
+VERSION_CHECK_INTERVAL = float(
+    os.environ.get("REGION_SNAPSHOT_VERSION_CHECK_INTERVAL", 60)
+)
+
+SNAPSHOT_COLS = [
+    "id",
+    "region_code",
+    "parent_region_code",
+    "parent_is_null",
+    "resolution",
+]
+
+
+@with_db_connection()
+def get_regions_version(cursor: Any) -> str:
+    """Return a version stamp of the regions table, that changes whenever regions are added, edited or deleted.
+
+    NOTE: a hash of the contents of the table, as the count and maximum of the ids
+    do not change when a region is edited.
+    """
+    cursor.execute(
+        "SELECT md5(string_agg(concat_ws(':', id, region_code, coalesce(parent_region_code, '<null>'), resolution), ',' ORDER BY id)) FROM regions"
+    )
+    (content_hash,) = cursor.fetchone()
+
+    return f"{db_name}:{content_hash}"
+
+
+@with_db_connection()
+def _get_all_regions(cursor: Any) -> list:
+    cursor.execute(
+        "SELECT id, region_code, parent_region_code, resolution FROM regions ORDER BY id"
+    )
+    return list(cursor.fetchall())
+
+
+class RegionSnapshot:
+    """Columns of the regions table (id, region_code, parent_region_code, resolution) as read-only arrays.
+
+    The arrays are memory-mapped from `.npy` files, so that all worker processes
+    share the same pages instead of each holding a copy.
+    """
+
+    def __init__(self, snapshot_dir: str, version: str) -> None:
+        """Memory-map the snapshot in `snapshot_dir`."""
+        self.version = version
+        self._cols = {
+            col: np.load(os.path.join(snapshot_dir, f"{col}.npy"), mmap_mode="r")
+            for col in SNAPSHOT_COLS
+        }
+
+    def get_regions(
+        self, resolution: str, country: Optional[str] = "all"
+    ) -> pd.DataFrame:
+        """Return dataframe of region codes and their primary keys corresponding to the specified resolution."""
+        mask = self._cols["resolution"] == resolution
+
+        # subset on a country
+        if country is not None and country != "all":
+            # NOTE: LAU regions ids do not contain country codes
+            if resolution == "LAU":
+                mask &= np.char.startswith(self._cols["parent_region_code"], country)
+            else:
+                mask &= np.char.startswith(self._cols["region_code"], country)
+
+        idx = np.flatnonzero(mask)
+        parent_region_codes = self._cols["parent_region_code"][idx].astype(object)
+        parent_region_codes[self._cols["parent_is_null"][idx]] = None
+
+        return pd.DataFrame(
+            {
+                "id": np.asarray(self._cols["id"][idx]),
+                "region_code": self._cols["region_code"][idx].astype(object),
+                "parent_region_code": parent_region_codes,
+            }
+        )
+
+
+def _export_region_snapshot(snapshot_dir: str) -> None:
+    """Export the regions table to `.npy` files in `snapshot_dir`."""
+    db_region_snapshot_log.info("exporting regions table snapshot")
+    rows = _get_all_regions()
+    if rows is None:
+        raise ValueError("the regions table could not be read from the DB")
+
+    ids, region_codes, parent_region_codes, resolutions = (
+        zip(*rows) if len(rows) > 0 else ([], [], [], [])
+    )
+    parent_is_null = np.array(
+        [code is None for code in parent_region_codes], dtype=bool
+    )
+    cols = {
+        "id": np.asarray(ids, dtype=np.int64),
+        # NOTE: fixed width strings, as object arrays cannot be memory-mapped
+        "region_code": np.asarray(region_codes, dtype=str),
+        "parent_region_code": np.asarray(
+            ["" if code is None else code for code in parent_region_codes], dtype=str
+        ),
+        "parent_is_null": parent_is_null,
+        "resolution": np.asarray(resolutions, dtype=str),
+    }
+
+    # write to a temporary directory first, so that concurrent readers never see partial files
+    tmp_dir = f"{snapshot_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for col, values in cols.items():
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), values)
+
+    try:
+        os.replace(tmp_dir, snapshot_dir)
+    except OSError:
+        # another process exported the same snapshot in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+_region_snapshot: Optional[RegionSnapshot] = None
+_region_snapshot_checked_at: Optional[float] = None
+_region_snapshot_lock = threading.Lock()
+
+
+def get_region_snapshot(refresh: bool = False) -> RegionSnapshot:
+    """Return the region snapshot, exported once per version of the regions table.
+
+    NOTE: the version is checked at most once per `VERSION_CHECK_INTERVAL` seconds
+    (or on `refresh`), so edits of the regions by other processes are seen after
+    that interval. Writes to the regions table through `db_access` invalidate the
+    snapshot of the writing process right away.
+    """
+    global _region_snapshot, _region_snapshot_checked_at  # pylint: disable=global-statement
+
+    with _region_snapshot_lock:
+        if (
+            _region_snapshot is None
+            or refresh
+            or _region_snapshot_checked_at is None
+            or time.monotonic() - _region_snapshot_checked_at >= VERSION_CHECK_INTERVAL
+        ):
+            version = get_regions_version()
+            snapshot_dir = os.path.join(
+                REGION_SNAPSHOT_PATH,
+                hashlib.sha1(version.encode("utf-8")).hexdigest()[:16],
+            )
+            if not os.path.isdir(snapshot_dir):
+                os.makedirs(REGION_SNAPSHOT_PATH, exist_ok=True)
+                _export_region_snapshot(snapshot_dir)
+
+            if _region_snapshot is None or _region_snapshot.version != version:
+                _region_snapshot = RegionSnapshot(snapshot_dir, version)
+            _region_snapshot_checked_at = time.monotonic()
+
+    return _region_snapshot
+
+
+def refresh_region_snapshot() -> None:
+    """Check the version of the regions table again and export a new snapshot if it changed."""
+    get_region_snapshot(refresh=True)
+
+
+def invalidate_region_snapshot() -> None:
+    """Check the version of the regions table again on the next access, for ex.: after writing to it."""
+    global _region_snapshot_checked_at  # pylint: disable=global-statement
+
+    with _region_snapshot_lock:
+        _region_snapshot_checked_at = None
@@ -0,0 +1,250 @@
+"""Memory-aware scheduling of DB population jobs in a process pool."""
+import os
+import json
+import time
+import logging
+import threading
+import traceback
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+import psutil
+import pandas as pd
+
+from zoomin.database.db_access_with_calculations import (
+    get_input_data_path,
+    process_and_add_input_data,
+)
+
+db_scheduler_log = logging.getLogger("db_scheduler")
+logging.basicConfig(level=logging.INFO)
+
+# global memory budget for all running jobs in MB; default: 80% of the memory available at start
+MEMORY_BUDGET_MB = os.environ.get("MEMORY_BUDGET_MB")
+N_WORKERS = int(os.environ.get("N_WORKERS", os.cpu_count() or 1))
+
+# NOTE: rough figures used to estimate the memory of a job. They over-estimate
+# rather than under-estimate, as running out of memory is worse than waiting.
+WORKER_BASE_MEMORY_MB = 300  # imports, region hierarchy, share matrices
+CSV_MEMORY_FACTOR = 5  # in-memory size of a parsed csv relative to its size on disk
+# per LAU row; disaggregated frame, aggregation and copy buffers
+BYTES_PER_LAU_ROW = 250
+AVG_LAU_REGIONS_PER_REGION = {
+    "LAU": 1,
+    "NUTS3": 100,
+    "NUTS2": 450,
+    "NUTS1": 1200,
+    "NUTS0": 4000,
+}
+
+RSS_SAMPLING_INTERVAL = 0.1  # seconds
+
+
+def _count_rows(file_path: str) -> int:
+    """Count the data rows of a csv file without parsing it."""
+    n_lines = 0
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            n_lines = n_lines + block.count(b"\n")
+
+    return max(n_lines - 1, 0)  # without header
+
+
+def estimate_input_data_memory(values: tuple) -> float:
+    """Estimate the memory (in MB) needed by `process_and_add_input_data` for a var, from the size and row count of its data file."""
+    var_name, on_the_fly_calculation, _, _, data_year = values
+
+    data_path = get_input_data_path(var_name, data_year)
+    file_path = os.path.join(data_path, "data.csv")
+    if isinstance(on_the_fly_calculation, str) or not os.path.exists(file_path):
+        return WORKER_BASE_MEMORY_MB
+
+    with open(os.path.join(data_path, "details.json")) as f:
+        resolution = json.load(f)["resolution"]
+
+    file_mb = os.path.getsize(file_path) / (1024 * 1024)
+    n_lau_rows = _count_rows(file_path) * AVG_LAU_REGIONS_PER_REGION.get(
+        resolution, AVG_LAU_REGIONS_PER_REGION["NUTS0"]
+    )
+
+    return (
+        WORKER_BASE_MEMORY_MB
+        + file_mb * CSV_MEMORY_FACTOR
+        + n_lau_rows * BYTES_PER_LAU_ROW / (1024 * 1024)
+    )
+
+
+def _get_job_name(values: tuple) -> str:
+    """Return a readable name of a job, for ex.: `population 2020`."""
+    var_name, *_, data_year = values
+    if isinstance(data_year, str):
+        return f"{var_name} {data_year}"
+    return str(var_name)
+
+
+def _run_and_measure(func: Callable, values: tuple) -> dict:
+    """Run a job in a worker and measure its wall time and the peak increase of the RSS of the worker.
+
+    NOTE: the workers of the pool are reused, so the RSS of a worker includes the
+    memory it still holds from previous jobs. The memory of the job is measured as
+    the increase over the RSS of the worker before the job.
+    """
+    process = psutil.Process(os.getpid())
+    rss_before = process.memory_info().rss
+    peak_rss = [rss_before]
+    stop_sampling = threading.Event()
+
+    def _sample_rss() -> None:
+        while not stop_sampling.wait(RSS_SAMPLING_INTERVAL):
+            peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=_sample_rss, daemon=True)
+    sampler.start()
+
+    failed = False
+    before = time.perf_counter()
+    try:
+        func(values)
+    except Exception:  # pylint: disable=broad-except
+        failed = True
+        db_scheduler_log.error(
+            f"!!!!for {_get_job_name(values)} job failed!!!!{traceback.format_exc()}"
+        )
+    finally:
+        stop_sampling.set()
+        sampler.join()
+
+    peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    return {
+        "wall_time_s": round(time.perf_counter() - before, 2),
+        "rss_before_mb": round(rss_before / (1024 * 1024), 2),
+        "peak_rss_increase_mb": round((peak_rss[0] - rss_before) / (1024 * 1024), 2),
+        "failed": failed,
+    }
+
+
+def run_jobs(
+    func: Callable,
+    jobs: list,
+    estimate_memory: Callable,
+    memory_budget_mb: Optional[float] = None,
+    n_workers: int = N_WORKERS,
+) -> pd.DataFrame:
+    """Run `func` on each of the `jobs` in a process pool, without exceeding the memory budget.
+
+    Jobs are ordered by their estimated memory, largest first. A job is started
+    only if its estimate fits into the part of the budget not held by the running
+    jobs; smaller jobs may overtake a large one that does not fit yet. A job that
+    does not fit into the budget at all is run alone.
+
+    Returns a report with the estimated memory, wall time, peak RSS increase and
+    failure of each job. If a worker dies, for ex.: as it ran out of memory, the jobs
+    running at that time are reported as failed and the others run in a new pool.
+    """
+    if memory_budget_mb is None:
+        memory_budget_mb = (
+            float(MEMORY_BUDGET_MB)
+            if MEMORY_BUDGET_MB is not None
+            else 0.8 * psutil.virtual_memory().available / (1024 * 1024)
+        )
+
+    pending = sorted(
+        [(estimate_memory(values), values) for values in jobs],
+        key=lambda job: job[0],
+        reverse=True,
+    )
+    db_scheduler_log.info(
+        f"running {len(pending)} jobs with {n_workers} workers and a memory budget of {memory_budget_mb:.0f} MB"
+    )
+
+    report = []
+    running: dict = {}
+    memory_in_use = 0.0
+    executor = futures.ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            is_broken = False
+
+            # admit as many jobs as fit, largest first
+            for job in list(pending):
+                if len(running) >= n_workers:
+                    break
+
+                estimated_mb, values = job
+                fits = memory_in_use + estimated_mb <= memory_budget_mb
+                if fits or len(running) == 0:
+                    try:
+                        future = executor.submit(_run_and_measure, func, values)
+                    except BrokenProcessPool:
+                        is_broken = True
+                        break
+                    pending.remove(job)
+                    running[future] = job
+                    memory_in_use = memory_in_use + estimated_mb
+
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                estimated_mb, values = running.pop(future)
+                memory_in_use = memory_in_use - estimated_mb
+
+                job_report = {
+                    "job": _get_job_name(values),
+                    "var_name": values[0],
+                    "estimated_memory_mb": round(estimated_mb, 2),
+                }
+                try:
+                    job_report.update(future.result())
+
+                # NOTE: BrokenProcessPool if a worker died, for ex.: killed when running out
+                # of memory. All jobs running in the pool fail then, as it is not known
+                # which of them it was.
+                except Exception as error:  # pylint: disable=broad-except
+                    is_broken = is_broken or isinstance(error, BrokenProcessPool)
+                    job_report.update(
+                        {
+                            "wall_time_s": None,
+                            "rss_before_mb": None,
+                            "peak_rss_increase_mb": None,
+                            "failed": True,
+                        }
+                    )
+                    db_scheduler_log.error(
+                        f"!!!!for {job_report['job']} job failed!!!!{error!r}"
+                    )
+                else:
+                    db_scheduler_log.info(
+                        f"{job_report['job']} finished in {job_report['wall_time_s']} s, "
+                        f"peak RSS +{job_report['peak_rss_increase_mb']} MB over {job_report['rss_before_mb']} MB "
+                        f"(estimated {job_report['estimated_memory_mb']} MB)"
+                    )
+                report.append(job_report)
+
+            # the remaining jobs run in a new pool
+            if is_broken:
+                executor.shutdown(wait=True)
+                executor = futures.ProcessPoolExecutor(max_workers=n_workers)
+
+    finally:
+        executor.shutdown(wait=True)
+
+    return pd.DataFrame(report)
+
+
+def run_input_data_jobs(
+    jobs: list,
+    memory_budget_mb: Optional[float] = None,
+    n_workers: int = N_WORKERS,
+) -> pd.DataFrame:
+    """Run `process_and_add_input_data` on each of the `jobs` with memory-aware scheduling.
+
+    Each job is a tuple (var_name, on_the_fly_calculation, proxy, post_calculation, data_year).
+    """
+    return run_jobs(
+        process_and_add_input_data,
+        jobs,
+        estimate_input_data_memory,
+        memory_budget_mb=memory_budget_mb,
+        n_workers=n_workers,
+    )
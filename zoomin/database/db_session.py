@@ -0,0 +1,121 @@
+"""Load session: one connection and one transaction for all lookups and writes of a variable load.
+
+Within `load_session()`, the functions decorated with `with_db_connection` use the
+connection of the session instead of borrowing their own one, and their changes are
+committed once, at the end of the session. If the load fails halfway, none of its rows
+are kept, for ex.:
+```
+with load_session("population") as session:
+    with session.phase("lookups"):
+        ...
+    with session.phase("region_data"):
+        add_to_region_data(...)
+```
+"""
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Iterator
+
+from zoomin.database.db_connection import (
+    _get_connection,
+    _release_connection,
+    _set_load_session,
+    get_load_session,
+)
+
+db_session_log = logging.getLogger("db_session")
+logging.basicConfig(level=logging.INFO)
+
+
+class LoadSession:
+    """The connection pinned for a load and the seconds spent in each phase of it."""
+
+    def __init__(self, name: str, connection: Any) -> None:
+        """Set up the session `name` on `connection`."""
+        self.name = name
+        self.connection = connection
+        self.timings: dict = {}
+        self._started = time.perf_counter()
+        self._nested_seconds: list = []
+        self._cleanups: list = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the time spent within this context to the phase `name`, except the time spent in the phases nested in it."""
+        self._nested_seconds.append(0.0)
+        before = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - before
+            nested_seconds = self._nested_seconds.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + seconds - nested_seconds
+            if len(self._nested_seconds) > 0:
+                self._nested_seconds[-1] += seconds
+
+    def add_cleanup(self, func: Callable, *args: Any) -> None:
+        """Call `func(*args)` once the session is committed or rolled back and its connection released."""
+        self._cleanups.append((func, args))
+
+    def get_timing_report(self) -> dict:
+        """Return the seconds spent in each phase and in total, including the time not spent in any phase."""
+        report = {name: round(seconds, 3) for name, seconds in self.timings.items()}
+        report["total"] = round(time.perf_counter() - self._started, 3)
+
+        return report
+
+
+def load_phase(name: str) -> ContextManager:
+    """Time a phase of the load session of the current thread; does nothing outside of a load session."""
+    session = get_load_session()
+    if session is None:
+        return nullcontext()
+
+    phase: ContextManager = session.phase(name)
+    return phase
+
+
+@contextmanager
+def load_session(name: str = "load", pooled: bool = True) -> Iterator[LoadSession]:
+    """Pin one connection for all lookups and writes within this context, and commit them once at the end.
+
+    The changes are rolled back if the block fails. A load session opened within
+    another one is part of the outer session.
+
+    NOTE: the partitions of new variables are not created within a session, see
+    `add_var_partitions`. Some work is still done on other connections, and committed
+    on its own: the parallel COPY of large frames to their staging table (only adding
+    the staging table to the target table is part of the session; the staging table is
+    dropped once the session ended).
+    Reads with the "sql" backend go through the SQLAlchemy engine, and do not see the
+    uncommitted rows of the session.
+    """
+    session = get_load_session()
+    if session is not None:
+        yield session
+        return
+
+    connection, connection_pool = _get_connection(pooled)
+    session = LoadSession(name, connection)
+    _set_load_session(session)
+    try:
+        yield session
+        with session.phase("commit"):
+            connection.commit()
+
+    except BaseException:
+        if connection.closed == 0:
+            connection.rollback()
+        db_session_log.error(f"{name} failed, none of its changes were committed")
+        raise
+
+    finally:
+        _set_load_session(None)
+        _release_connection(connection, connection_pool)
+        for func, args in session._cleanups:
+            try:
+                func(*args)
+            except Exception as error:  # pylint: disable=broad-except
+                db_session_log.error(f"cleanup of {name} failed: {error}")
+        db_session_log.info(f"{name}, seconds per phase: {session.get_timing_report()}")
@@ -1,66 +1,18 @@
 """Disaggregation techniques."""
-# from functools import reduce
 from typing import Optional
 import warnings
 
 import pandas as pd
 
-from zoomin.database.db_access import get_var_data_for_disaggregation
+from zoomin.disaggregation.proxy_expression import get_proxy_data
 
-# def get_values_list(string, symbol):
-#     str_list = string.split(symbol)
-#     val_list = [values.get(var) if var in values.keys() else int(var) for var in str_list]
-#     return val_list
 
-# if '/' in equation: # yet to test this part ===================================
-#     org_div_list = equation.split('/')
-#     final_div_list = []
-#     for item in org_div_list:
-#         if '*' in item:
-#             val_list = get_values_list(item, "*")
-#             result = reduce(lambda x, y: x*y, val_list)
-#         elif '+' in item:
-#             val_list = get_values_list(item, "+")
-#             result = reduce(lambda x, y: x+y, val_list)
-#         elif '-' in item:
-#             val_list = get_values_list(item, "-")
-#             result = reduce(lambda x, y: x-y, val_list)
-#         else:
-#             if item in values.keys():
-#                 result = values.get(item)
-#             else:
-#                 result = int(item)
+def add_proxy_vars(equation: str, country: Optional[str] = "all") -> tuple:
+    """Return the proxy values at LAU regions and the list of vars of a proxy expression.
 
-#         final_div_list.append(result)
-
-#     return reduce(lambda x, y: x/y, final_div_list) # ============================
-
-
-def add_proxy_vars(equation: str, country: Optional[str] = "all"):
-    if not "+" in equation:
-        raise ValueError("unknown operation.")
-    else:
-        proxy_vars = equation.split("+")
-
-        for i, var_name in enumerate(proxy_vars):
-            var_data = get_var_data_for_disaggregation(var_name, country)
-            if i == 0:
-                result = var_data
-            else:
-                _result = pd.merge(
-                    result,
-                    var_data,
-                    left_on=["region_code", "parent_region_code"],
-                    right_on=["region_code", "parent_region_code"],
-                    how="inner",
-                )
-
-                _result["value"] = _result[["value_x", "value_y"]].sum(axis=1)
-                result = _result.drop(
-                    columns=["value_x", "value_y", "region_id_x"]
-                ).rename(columns={"region_id_y": "region_id"})
-
-        return result, proxy_vars
+    Kept for backwards compatibility, see `proxy_expression.get_proxy_data`.
+    """
+    return get_proxy_data(equation, country)
 
 
 def disaggregate_value(value: float, proxy_data: pd.DataFrame) -> pd.DataFrame:
@@ -0,0 +1,227 @@
+"""Compile proxy expressions and evaluate them on the data of the vars they refer to.
+
+A proxy expression combines vars and constants with `+`, `-`, `*`, `/` and
+parentheses, for ex.: `population`, `population+employment in nace sector G-I`,
+`0.7 * gross value added / (population + 1)`.
+
+NOTE: var names may contain spaces and hyphens. Therefore, a `-` is only
+interpreted as subtraction if there is a whitespace on both sides of it
+(`a - b`) or if it is a negation (`-a`, `2 * -a`). `a-b` is a single var.
+"""
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from zoomin.database.db_access import get_regions, get_vars_data_for_disaggregation
+
+OPERATORS = {"+", "-", "*", "/"}
+
+
+def _tokenize(proxy: str) -> list:
+    """Split a proxy expression into operators, parentheses and operands."""
+    tokens: list = []
+    name = ""
+    i = 0
+    while i < len(proxy):
+        char = proxy[i]
+
+        is_separator = char in {"+", "*", "/", "(", ")"}
+        if char == "-":
+            # subtraction or negation, if not in the middle of a var name
+            is_separator = name.strip() == "" or (
+                proxy[i - 1].isspace() and i + 1 < len(proxy) and proxy[i + 1].isspace()
+            )
+
+        if is_separator:
+            if name.strip() != "":
+                tokens.append(name.strip())
+            tokens.append(char)
+            name = ""
+        else:
+            name = f"{name}{char}"
+        i += 1
+
+    if name.strip() != "":
+        tokens.append(name.strip())
+
+    return tokens
+
+
+def _to_number(token: str) -> Optional[float]:
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+class ProxyExpression:
+    """A compiled proxy expression.
+
+    The expression is held as a tree of nested tuples; `("var", name)`,
+    `("const", number)`, `("neg", node)` or `(operator, left node, right node)`.
+    """
+
+    def __init__(self, proxy: str) -> None:
+        """Compile `proxy`."""
+        self.proxy = proxy
+        self._tokens = _tokenize(proxy)
+        self._pos = 0
+
+        if len(self._tokens) == 0:
+            raise ValueError("empty proxy expression.")
+
+        self.tree = self._parse_sum()
+        if self._pos != len(self._tokens):
+            raise ValueError(
+                f"unexpected '{self._tokens[self._pos]}' in proxy expression '{proxy}'."
+            )
+
+        self.var_names: list = []
+        self._collect_var_names(self.tree)
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise ValueError(f"incomplete proxy expression '{self.proxy}'.")
+        self._pos += 1
+        return token
+
+    def _parse_sum(self) -> tuple:
+        node = self._parse_product()
+        while self._peek() in {"+", "-"}:
+            operator = self._next()
+            node = (operator, node, self._parse_product())
+        return node
+
+    def _parse_product(self) -> tuple:
+        node = self._parse_operand()
+        while self._peek() in {"*", "/"}:
+            operator = self._next()
+            node = (operator, node, self._parse_operand())
+        return node
+
+    def _parse_operand(self) -> tuple:
+        token = self._next()
+        if token == "-":
+            return ("neg", self._parse_operand())
+        if token == "(":
+            node = self._parse_sum()
+            if self._next() != ")":
+                raise ValueError(f"missing ')' in proxy expression '{self.proxy}'.")
+            return node
+        if token in OPERATORS or token == ")":
+            raise ValueError(
+                f"unexpected '{token}' in proxy expression '{self.proxy}'."
+            )
+
+        number = _to_number(token)
+        if number is not None:
+            return ("const", number)
+        return ("var", token)
+
+    def _collect_var_names(self, node: tuple) -> None:
+        if node[0] == "var":
+            if node[1] not in self.var_names:
+                self.var_names.append(node[1])
+        elif node[0] != "const":
+            for child in node[1:]:
+                self._collect_var_names(child)
+
+    def evaluate(self, values: dict) -> Any:
+        """Evaluate the expression on aligned arrays of var values, given as a dict with var names as keys."""
+
+        def _evaluate(node: tuple) -> Any:
+            if node[0] == "var":
+                return values[node[1]]
+            if node[0] == "const":
+                return node[1]
+            if node[0] == "neg":
+                return -_evaluate(node[1])
+
+            left, right = _evaluate(node[1]), _evaluate(node[2])
+            if node[0] == "+":
+                return left + right
+            if node[0] == "-":
+                return left - right
+            if node[0] == "*":
+                return left * right
+            return left / right
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return _evaluate(self.tree)
+
+
+def compile_proxy_expression(proxy: str) -> ProxyExpression:
+    """Compile a proxy expression."""
+    return ProxyExpression(proxy)
+
+
+def select_proxy_snapshot(data_df: pd.DataFrame) -> pd.DataFrame:
+    """Return the rows of one year of each var, so that the vars are combined per region and not over years and pathways.
+
+    Of each var, the rows of the latest year are selected, preferring the rows without
+    pathway (observed data) over the rows of pathways. Raises a ValueError if a var still
+    has several values per region, for ex.: of several pathways or climate experiments.
+    """
+    data_df = data_df.assign(
+        _observed=data_df["pathway_id"].isna(),
+        _year=data_df["year"].fillna(-np.inf),
+    )
+    snapshot_df = (
+        data_df.sort_values(["_observed", "_year"], kind="mergesort")
+        .groupby("var_name", sort=False)[["_observed", "_year"]]
+        .last()
+        .reset_index()
+    )
+    data_df = pd.merge(data_df, snapshot_df, on=["var_name", "_observed", "_year"])
+
+    is_duplicate = data_df.duplicated(["region_id", "var_name"])
+    if is_duplicate.any():
+        raise ValueError(
+            f"the proxy vars {sorted(data_df.loc[is_duplicate, 'var_name'].unique())} "
+            "have several values per region in the same year."
+        )
+
+    return data_df.drop(columns=["_observed", "_year"])
+
+
+def get_proxy_data(proxy: str, country: Optional[str] = "all") -> tuple:
+    """Return the proxy values at LAU regions and the list of vars the proxy is made up of.
+
+    All vars are fetched with a single query and aligned on region_id, using one year
+    of each var (see `select_proxy_snapshot`). Only regions with data for all the vars
+    are kept. Non-finite results (for ex.: division by 0) are set to 0.
+    """
+    expression = compile_proxy_expression(proxy)
+    if len(expression.var_names) == 0:
+        raise ValueError(f"proxy expression '{proxy}' does not contain any var.")
+
+    data_df = select_proxy_snapshot(
+        get_vars_data_for_disaggregation(expression.var_names)
+    )
+    data_df = data_df.pivot(index="region_id", columns="var_name", values="value")
+    data_df = data_df.reindex(columns=expression.var_names).dropna(how="any")
+
+    values = {var_name: data_df[var_name].values for var_name in expression.var_names}
+    proxy_values = np.broadcast_to(
+        np.asarray(expression.evaluate(values), dtype=float), (len(data_df),)
+    )
+    proxy_df = pd.DataFrame(
+        {
+            "region_id": data_df.index.values,
+            "value": np.where(np.isfinite(proxy_values), proxy_values, 0),
+        }
+    )
+
+    regions_df = get_regions("LAU", country=country)
+
+    proxy_df = pd.merge(
+        proxy_df, regions_df, left_on="region_id", right_on="id", how="inner"
+    )
+    proxy_df.drop(columns=["id"], inplace=True)
+
+    return proxy_df, expression.var_names
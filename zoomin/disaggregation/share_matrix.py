@@ -0,0 +1,373 @@
+"""Sparse parent-to-LAU share matrices of proxies, cached in memory and on disk."""
+import os
+import hashlib
+import logging
+import tempfile
+import warnings
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from zoomin.data.region_hierarchy import get_region_hierarchy
+from zoomin.database.db_access import get_var_data_version
+from zoomin.disaggregation.proxy_expression import (
+    compile_proxy_expression,
+    get_proxy_data,
+)
+
+share_matrix_log = logging.getLogger("share_matrix")
+logging.basicConfig(level=logging.INFO)
+
+SHARE_MATRIX_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "output", "share_matrices"
+)
+
+
+def get_proxy_var_names(proxy: str) -> list:
+    """Return the list of vars a proxy is made up of."""
+    return compile_proxy_expression(proxy).var_names
+
+
+class ShareMatrix:
+    """Shares of each LAU region in the proxy value of its parent region.
+
+    `matrix` is a CSR matrix of shape (n LAU regions, n parent regions). Multiplying
+    it with values of the parent regions disaggregates them to the LAU regions.
+    """
+
+    def __init__(
+        self,
+        matrix: sparse.csr_matrix,
+        parent_codes: np.ndarray,
+        lau_parent_idx: np.ndarray,
+        region_ids: np.ndarray,
+        region_codes: np.ndarray,
+        parent_region_codes: np.ndarray,
+        zero_parents: np.ndarray,
+        version: str,
+    ) -> None:
+        """Initialize."""
+        self.matrix = matrix
+        self.parent_codes = parent_codes
+        self.lau_parent_idx = lau_parent_idx
+        self.region_ids = region_ids
+        self.region_codes = region_codes
+        self.parent_region_codes = parent_region_codes
+        self.zero_parents = zero_parents
+        self.version = version
+
+    def disaggregate(self, parent_values: np.ndarray) -> np.ndarray:
+        """Disaggregate values of the parent regions (rows aligned with `parent_codes`) to the LAU regions.
+
+        The results are the same as with `disaggregate_value`: share * value, and
+        value / n children for the parent regions whose proxy values are all 0.
+        """
+        lau_values = np.asarray(self.matrix @ parent_values)
+
+        zero_lau = self.zero_parents[self.lau_parent_idx]
+        if zero_lau.any():
+            n_children = np.bincount(
+                self.lau_parent_idx, minlength=len(self.parent_codes)
+            ).reshape((-1,) + (1,) * (np.ndim(parent_values) - 1))
+            lau_values[zero_lau] = (parent_values / n_children)[
+                self.lau_parent_idx[zero_lau]
+            ]
+
+        return lau_values
+
+    def subset(self, parent_codes: np.ndarray) -> "ShareMatrix":
+        """Return the share matrix restricted to the given parent regions and their LAU regions."""
+        parent_idx = pd.Index(self.parent_codes).get_indexer(parent_codes)
+        parent_idx = np.unique(parent_idx[parent_idx >= 0])
+
+        lau_mask = np.isin(self.lau_parent_idx, parent_idx)
+
+        return ShareMatrix(
+            matrix=self.matrix[lau_mask][:, parent_idx],
+            parent_codes=self.parent_codes[parent_idx],
+            lau_parent_idx=np.searchsorted(parent_idx, self.lau_parent_idx[lau_mask]),
+            region_ids=self.region_ids[lau_mask],
+            region_codes=self.region_codes[lau_mask],
+            parent_region_codes=self.parent_region_codes[lau_mask],
+            zero_parents=self.zero_parents[parent_idx],
+            version=self.version,
+        )
+
+    def disaggregate_frame(
+        self,
+        data_df: pd.DataFrame,
+        data_key: str = "reg_code",
+        carry_cols: Optional[list] = None,
+    ) -> pd.DataFrame:
+        """Disaggregate all values in `data_df` with a single sparse matrix product.
+
+        Every unique combination of `carry_cols` (for ex.: year, quality_rating) becomes
+        one column of the parent value matrix. The returned dataframe has the proxy
+        columns (without the match_region_code), the disaggregated value and the `carry_cols`.
+        """
+        carry_cols = list(carry_cols or [])
+
+        parent_idx = pd.Index(self.parent_codes).get_indexer(data_df[data_key])
+        data_df = data_df[parent_idx >= 0]
+        parent_idx = parent_idx[parent_idx >= 0]
+
+        if len(carry_cols) > 0:
+            col_idx = (
+                data_df.groupby(carry_cols, dropna=False, sort=False, observed=True)
+                .ngroup()
+                .values
+            )
+        else:
+            col_idx = np.zeros(len(data_df), dtype=int)
+        # NOTE: group numbers are made contiguous, as categorical carry_cols may skip some
+        _, first_rows, col_idx = np.unique(
+            col_idx, return_index=True, return_inverse=True
+        )
+        n_cols = len(first_rows)
+
+        # parent values matrix; one column per combination of carry_cols
+        parent_values = np.full((len(self.parent_codes), n_cols), np.nan)
+        parent_values[parent_idx, col_idx] = data_df["value"].values
+        has_value = np.zeros((len(self.parent_codes), n_cols), dtype=bool)
+        has_value[parent_idx, col_idx] = True
+
+        lau_values = self.disaggregate(parent_values)
+        lau_idx, lau_col_idx = np.nonzero(has_value[self.lau_parent_idx, :].T)[::-1]
+
+        disagg_df = pd.DataFrame(
+            {
+                "region_id": self.region_ids[lau_idx],
+                "region_code": self.region_codes[lau_idx],
+                "parent_region_code": self.parent_region_codes[lau_idx],
+                "value": lau_values[lau_idx, lau_col_idx],
+            }
+        )
+        combos_df = data_df[carry_cols].iloc[first_rows].reset_index(drop=True)
+        for col in carry_cols:
+            disagg_df[col] = combos_df[col].values[lau_col_idx]
+
+        return disagg_df
+
+
+def iter_disaggregated_chunks(
+    share_matrix: ShareMatrix,
+    data_df: pd.DataFrame,
+    resolution: str,
+    data_key: str = "reg_code",
+    carry_cols: Optional[list] = None,
+) -> Iterator[pd.DataFrame]:
+    """Disaggregate `data_df` (at `resolution`) one country at a time.
+
+    Only the share matrix rows of the current country are multiplied, so that the
+    memory required is bounded by the size of the largest country and not the
+    whole dataset. Each chunk contains all LAU regions of a country and can therefore
+    be aggregated to upper levels on its own.
+    """
+    hierarchy = get_region_hierarchy()
+    country_idx = hierarchy.ancestor_at(
+        resolution,
+        hierarchy.index_of_codes(resolution, data_df[data_key].values),
+        "NUTS0",
+    )
+
+    for country in pd.unique(country_idx[country_idx >= 0]):
+        chunk_df = data_df[country_idx == country]
+        country_share_matrix = share_matrix.subset(
+            np.asarray(chunk_df[data_key].unique(), dtype=str)
+        )
+
+        yield country_share_matrix.disaggregate_frame(chunk_df, data_key, carry_cols)
+
+
+def build_share_matrix(
+    proxy_data: pd.DataFrame, resolution: str, version: str = ""
+) -> ShareMatrix:
+    """Build the share matrix from the proxy data at LAU for the parent regions at `resolution`."""
+    # match each LAU region to its parent region based on spatial resolution of the data
+    hierarchy = get_region_hierarchy()
+    parent_idx = hierarchy.ancestor_at(
+        "LAU",
+        hierarchy.index_of_ids("LAU", proxy_data["region_id"].values),
+        resolution,
+    )
+    proxy_data = proxy_data[parent_idx >= 0].reset_index(drop=True)
+
+    lau_parent_idx, parent_positions = pd.factorize(parent_idx[parent_idx >= 0])
+    parent_codes = hierarchy.codes(resolution)[parent_positions]
+    n_children = np.bincount(lau_parent_idx, minlength=len(parent_codes))
+
+    # NOTE: numpy sum per parent region, as in `disaggregate_value`
+    totals = (
+        proxy_data["value"].groupby(lau_parent_idx).agg(lambda x: x.values.sum()).values
+    )
+    zero_parents = totals == 0
+    if zero_parents.any():
+        warnings.warn(
+            "The proxy data is 0 in all child region. Therefore, the value is being equally distributed to all child regions"
+        )
+
+    lau_total = totals[lau_parent_idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(
+            lau_total == 0,
+            1 / n_children[lau_parent_idx],
+            proxy_data["value"].values / lau_total,
+        )
+
+    matrix = sparse.csr_matrix(
+        (shares, (np.arange(len(proxy_data)), lau_parent_idx)),
+        shape=(len(proxy_data), len(parent_codes)),
+    )
+
+    return ShareMatrix(
+        matrix=matrix,
+        parent_codes=np.asarray(parent_codes, dtype=str),
+        lau_parent_idx=lau_parent_idx,
+        region_ids=np.asarray(proxy_data["region_id"]),
+        region_codes=np.asarray(proxy_data["region_code"], dtype=str),
+        parent_region_codes=np.asarray(proxy_data["parent_region_code"], dtype=str),
+        zero_parents=zero_parents,
+        version=version,
+    )
+
+
+class ShareMatrixCache:
+    """Share matrices per (proxy, source resolution, country), cached in memory and as `.npz` files.
+
+    Each entry is stamped with the version of the proxy vars' data in region_data
+    and rebuilt when the stamp changes, i.e. when a proxy var is reloaded, also by
+    another process. The stamp is read from region_data on every `get`, so that no
+    stale shares are used; `invalidate` also removes the files of a reloaded var.
+    """
+
+    def __init__(self, cache_path: str = SHARE_MATRIX_PATH) -> None:
+        """Initialize."""
+        self.cache_path = cache_path
+        self._entries: Dict[tuple, ShareMatrix] = {}
+
+    def _file_path(self, key: tuple) -> str:
+        name = hashlib.sha1("|".join(key).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_path, f"{name}.npz")
+
+    def _load(self, key: tuple) -> Optional[ShareMatrix]:
+        file_path = self._file_path(key)
+        if not os.path.exists(file_path):
+            return None
+
+        with np.load(file_path) as arrays:
+            # NOTE: files of an older layout are rebuilt
+            if "version" not in arrays.files:
+                return None
+
+            share_matrix = ShareMatrix(
+                matrix=sparse.csr_matrix(
+                    (arrays["data"], arrays["indices"], arrays["indptr"]),
+                    shape=tuple(arrays["shape"]),
+                ),
+                parent_codes=arrays["parent_codes"],
+                lau_parent_idx=arrays["lau_parent_idx"],
+                region_ids=arrays["region_ids"],
+                region_codes=arrays["region_codes"],
+                parent_region_codes=arrays["parent_region_codes"],
+                zero_parents=arrays["zero_parents"],
+                version=str(arrays["version"]),
+            )
+        return share_matrix
+
+    def _save(self, key: tuple, share_matrix: ShareMatrix) -> None:
+        os.makedirs(self.cache_path, exist_ok=True)
+
+        # the matrix and its labels are written to one temporary file of this process and
+        # thread first, so that concurrent readers never see partial or mismatched files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    data=share_matrix.matrix.data,
+                    indices=share_matrix.matrix.indices,
+                    indptr=share_matrix.matrix.indptr,
+                    shape=np.array(share_matrix.matrix.shape),
+                    parent_codes=share_matrix.parent_codes,
+                    lau_parent_idx=share_matrix.lau_parent_idx,
+                    region_ids=share_matrix.region_ids,
+                    region_codes=share_matrix.region_codes,
+                    parent_region_codes=share_matrix.parent_region_codes,
+                    zero_parents=share_matrix.zero_parents,
+                    version=np.array(share_matrix.version),
+                    proxy_vars=np.array(get_proxy_var_names(key[0])),
+                )
+            os.replace(tmp_path, self._file_path(key))
+
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, proxy: str, resolution: str, country: str = "all") -> ShareMatrix:
+        """Return the share matrix of `proxy` for parent regions at `resolution` in `country`."""
+        key = (proxy, resolution, country)
+
+        version = get_var_data_version(get_proxy_var_names(proxy))
+
+        share_matrix = self._entries.get(key)
+        if share_matrix is None or share_matrix.version != version:
+            share_matrix = self._load(key)
+
+        if share_matrix is None or share_matrix.version != version:
+            share_matrix_log.info(
+                f"building share matrix of {proxy} for {resolution} regions in {country}"
+            )
+            proxy_data, _ = get_proxy_data(proxy, country)
+            share_matrix = build_share_matrix(proxy_data, resolution, version)
+            self._save(key, share_matrix)
+
+        self._entries[key] = share_matrix
+
+        return share_matrix
+
+    def invalidate(self, var_name: str) -> None:
+        """Drop all entries whose proxy contains `var_name`."""
+        for key in list(self._entries.keys()):
+            if var_name in get_proxy_var_names(key[0]):
+                del self._entries[key]
+
+        if not os.path.isdir(self.cache_path):
+            return
+
+        for file_name in os.listdir(self.cache_path):
+            if not file_name.endswith(".npz"):
+                continue
+
+            file_path = os.path.join(self.cache_path, file_name)
+            try:
+                with np.load(file_path) as arrays:
+                    proxy_vars = (
+                        list(arrays["proxy_vars"])
+                        if "proxy_vars" in arrays.files
+                        else [var_name]
+                    )
+            except (OSError, ValueError):
+                # removed or replaced by another process meanwhile
+                continue
+
+            if var_name in proxy_vars:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+
+
+share_matrix_cache = ShareMatrixCache()
+
+
+def get_share_matrix(proxy: str, resolution: str, country: str = "all") -> ShareMatrix:
+    """Return the cached share matrix of `proxy`."""
+    return share_matrix_cache.get(proxy, resolution, country)
+
+
+def invalidate_share_matrices(var_name: str) -> None:
+    """Invalidate the cached share matrices of all proxies containing `var_name`."""
+    share_matrix_cache.invalidate(var_name)